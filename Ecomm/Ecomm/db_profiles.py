@@ -0,0 +1,175 @@
+"""
+Database profiles.
+
+settings.DATABASES is built from the environment, so one settings file
+serves a laptop and a production host:
+
+PRIME_DB_ENGINE             ``sqlite`` (default) or ``postgresql``
+PRIME_DB_PROFILE            ``development`` (default) or ``production``
+PRIME_DB_NAME               SQLite file or Postgres database name
+PRIME_DB_USER, PRIME_DB_PASSWORD, PRIME_DB_HOST, PRIME_DB_PORT
+                            Postgres credentials
+PRIME_DB_CONN_MAX_AGE       seconds a connection is kept between requests
+PRIME_DB_POOL               1/0, use psycopg's connection pool (Postgres)
+PRIME_DB_POOL_MIN_SIZE, PRIME_DB_POOL_MAX_SIZE
+PRIME_DB_REPLICAS           comma-separated read replicas: SQLite files, or
+                            Postgres host[:port]s; they become the
+                            ``replica1``, ``replica2``... aliases used by
+                            prime_accessories.routers
+PRIME_SQLITE_BUSY_TIMEOUT_MS, PRIME_SQLITE_MMAP_SIZE, PRIME_SQLITE_CACHE_KB,
+PRIME_SQLITE_SYNCHRONOUS    SQLite pragma overrides
+
+``development`` keeps Django's defaults: a new connection per request and
+SQLite's rollback journal. ``production`` keeps connections open, through
+a psycopg pool when psycopg_pool is installed and persistent connections
+(with health checks) otherwise, and tunes SQLite:
+
+* WAL journal: readers no longer block the writer nor the writer them,
+* synchronous=NORMAL: commits skip an fsync; a power cut may drop the
+  last transactions but cannot corrupt the file,
+* busy_timeout: a writer waits its turn instead of failing at once,
+* mmap_size and cache_size: hot pages are read without a system call,
+* BEGIN IMMEDIATE: transactions take the write lock when they start, so
+  two writers never deadlock upgrading a read lock (which SQLite resolves
+  by failing one of them without waiting).
+
+WAL needs the database on a local file system.
+
+Replicas share the primary's settings, and tests run them as mirrors of
+the test database.
+"""
+import importlib.util
+import os
+from pathlib import Path
+
+
+PROFILES = ('development', 'production')
+ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+
+PRODUCTION_CONN_MAX_AGE = 600
+SQLITE_DEFAULTS = {
+    'busy_timeout_ms': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_kb': 64 * 1024,
+    'synchronous': 'NORMAL',
+}
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _int(environ, name, default):
+    raw = environ.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, not {raw!r}")
+
+
+def _bool(environ, name, default):
+    raw = environ.get(name)
+    if raw in (None, ''):
+        return default
+    return raw.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def has_psycopg_pool():
+    return importlib.util.find_spec('psycopg_pool') is not None
+
+
+def sqlite_pragmas(environ=os.environ):
+    """The production PRAGMA statements, run on every new SQLite connection"""
+    synchronous = environ.get('PRIME_SQLITE_SYNCHRONOUS', SQLITE_DEFAULTS['synchronous']).upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"PRIME_SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+    return [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA synchronous={synchronous}',
+        f"PRAGMA busy_timeout={_int(environ, 'PRIME_SQLITE_BUSY_TIMEOUT_MS', SQLITE_DEFAULTS['busy_timeout_ms'])}",
+        f"PRAGMA mmap_size={_int(environ, 'PRIME_SQLITE_MMAP_SIZE', SQLITE_DEFAULTS['mmap_size'])}",
+        # A negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{_int(environ, 'PRIME_SQLITE_CACHE_KB', SQLITE_DEFAULTS['cache_kb'])}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def sqlite_database(environ, base_dir, profile):
+    config = {
+        'ENGINE': ENGINES['sqlite'],
+        'NAME': environ.get('PRIME_DB_NAME') or base_dir / 'db.sqlite3',
+        # File-backed test database: the in-memory one uses shared-cache
+        # table locks, which fail the threaded concurrency tests
+        'TEST': {'NAME': base_dir / 'test_db.sqlite3'},
+    }
+    if profile == 'production':
+        config['OPTIONS'] = {
+            'init_command': ';'.join(sqlite_pragmas(environ)),
+            'transaction_mode': 'IMMEDIATE',
+            # Python's own busy handler, in seconds, for the connect itself
+            'timeout': _int(environ, 'PRIME_SQLITE_BUSY_TIMEOUT_MS', SQLITE_DEFAULTS['busy_timeout_ms']) / 1000,
+        }
+    return config
+
+
+def postgresql_database(environ, profile):
+    config = {
+        'ENGINE': ENGINES['postgresql'],
+        'NAME': environ.get('PRIME_DB_NAME', 'prime'),
+        'USER': environ.get('PRIME_DB_USER', ''),
+        'PASSWORD': environ.get('PRIME_DB_PASSWORD', ''),
+        'HOST': environ.get('PRIME_DB_HOST', ''),
+        'PORT': environ.get('PRIME_DB_PORT', ''),
+    }
+    if profile == 'production' and _bool(environ, 'PRIME_DB_POOL', has_psycopg_pool()):
+        # Django refuses CONN_MAX_AGE with a pool: the pool owns the connections
+        config['OPTIONS'] = {'pool': {
+            'min_size': _int(environ, 'PRIME_DB_POOL_MIN_SIZE', 2),
+            'max_size': _int(environ, 'PRIME_DB_POOL_MAX_SIZE', 10),
+            'timeout': 10,
+        }}
+    return config
+
+
+def database_settings(environ=os.environ, base_dir=None):
+    """settings.DATABASES for the profile selected by the environment"""
+    base_dir = Path(base_dir) if base_dir else Path(__file__).resolve().parent.parent
+    profile = environ.get('PRIME_DB_PROFILE', 'development')
+    if profile not in PROFILES:
+        raise ValueError(f"PRIME_DB_PROFILE must be one of {', '.join(PROFILES)}, not {profile!r}")
+    engine = environ.get('PRIME_DB_ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        config = sqlite_database(environ, base_dir, profile)
+    elif engine == 'postgresql':
+        config = postgresql_database(environ, profile)
+    else:
+        raise ValueError(f"PRIME_DB_ENGINE must be one of {', '.join(ENGINES)}, not {engine!r}")
+
+    pooled = 'pool' in config.get('OPTIONS', {})
+    if profile == 'production' and not pooled:
+        config['CONN_MAX_AGE'] = _int(environ, 'PRIME_DB_CONN_MAX_AGE', PRODUCTION_CONN_MAX_AGE)
+        # Reused connections are checked before each request instead of failing it
+        config['CONN_HEALTH_CHECKS'] = True
+    elif not pooled:
+        config['CONN_MAX_AGE'] = _int(environ, 'PRIME_DB_CONN_MAX_AGE', 0)
+    databases = {'default': config}
+    for index, replica in enumerate(filter(None, environ.get('PRIME_DB_REPLICAS', '').split(',')), 1):
+        databases[f'replica{index}'] = replica_database(config, replica.strip(), base_dir)
+    return databases
+
+
+def replica_database(primary, location, base_dir):
+    config = {**primary, 'TEST': {'MIRROR': 'default'}}
+    if primary['ENGINE'] == ENGINES['sqlite']:
+        # Relative files live next to db.sqlite3
+        config['NAME'] = base_dir / location
+    else:
+        config['HOST'], _, port = location.partition(':')
+        config['PORT'] = port or primary['PORT']
+    return config
+
+
+def replica_aliases(databases):
+    return [alias for alias in databases if alias.startswith('replica')]
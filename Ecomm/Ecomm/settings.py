@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os 
+
+from .db_profiles import database_settings, replica_aliases
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'prime_accessories.instrumentation.RequestMetricsMiddleware',  # first, so its latency covers the rest
+    'prime_accessories.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +58,8 @@ ROOT_URLCONF = 'Ecomm.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to RequestMetricsMiddleware
+        'BACKEND': 'prime_accessories.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],  # Add this line to specify the templates directory
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,14 +78,69 @@ WSGI_APPLICATION = 'Ecomm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# Selected by PRIME_DB_ENGINE / PRIME_DB_PROFILE and friends; see Ecomm/db_profiles.py
+DATABASES = database_settings(os.environ, BASE_DIR)
+
+# Catalog and order-history reads go to the replicas (if any); writes, and
+# for PRIME_REPLICA_STICKY_SECONDS every read of a client that just wrote,
+# go to the primary. See prime_accessories/routers.py.
+DATABASE_ROUTERS = ['prime_accessories.routers.PrimaryReplicaRouter']
+PRIME_DB_REPLICAS = replica_aliases(DATABASES)
+PRIME_REPLICA_STICKY_SECONDS = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# The catalog cache backend is picked with CATALOG_CACHE_BACKEND
+# (locmem, file or redis) and CATALOG_CACHE_LOCATION, the sessions cache
+# likewise with SESSION_CACHE_BACKEND and SESSION_CACHE_LOCATION.
+
+CATALOG_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'prime-catalog'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache' / 'catalog')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_catalog_backend, _catalog_location = CATALOG_CACHE_BACKENDS[os.environ.get('CATALOG_CACHE_BACKEND', 'locmem')]
+
+SESSION_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'prime-sessions'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache' / 'sessions')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/2'),
+}
+_session_backend, _session_location = SESSION_CACHE_BACKENDS[os.environ.get('SESSION_CACHE_BACKEND', 'locmem')]
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': _catalog_backend,
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', _catalog_location),
+        'KEY_PREFIX': 'catalog',
+        'TIMEOUT': 300,
+    },
+    'sessions': {
+        'BACKEND': _session_backend,
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', _session_location),
+        # Entries expire with their session
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000} if _session_backend.endswith('LocMemCache') else {},
+    },
 }
 
 
+# Sessions (see prime_accessories.session_backend): read from the sessions
+# cache, written to django_session in the request (through) or at most every
+# PRIME_SESSION_WRITE_BEHIND_SECONDS per session (behind), when a run_workers
+# task flushes the deferred changes. With more than one server process, or with
+# write-behind, the sessions cache must be shared, e.g. SESSION_CACHE_BACKEND=redis.
+
+SESSION_ENGINE = 'prime_accessories.session_backend'
+PRIME_SESSION_CACHE = 'sessions'
+PRIME_SESSION_WRITE_MODE = os.environ.get('PRIME_SESSION_WRITE_MODE', 'through')
+PRIME_SESSION_WRITE_BEHIND_SECONDS = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -118,3 +178,51 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]  # Add this line to specify the static files directory
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'media')]  # Add this line to specify the media files directory
+
+
+# Catalog search
+# Dotted path to a prime_accessories.search backend; None picks FTS5 on SQLite
+# and the portable SearchToken inverted index everywhere else.
+
+PRIME_SEARCH_BACKEND = None
+PRIME_SEARCH_MAX_RESULTS = 1000
+
+
+# Order numbers
+# Each process reserves this many order numbers per database round trip.
+
+ORDER_NUMBER_BLOCK_SIZE = 50
+
+
+# Catalog page/fragment cache (see prime_accessories.caching)
+
+PRIME_CATALOG_CACHE = 'catalog'
+PRIME_CATALOG_CACHE_TIMEOUT = 300
+
+
+# Request instrumentation (see prime_accessories.instrumentation)
+# Per-view aggregates are served to staff at metrics/, metrics/prometheus/
+# and metrics/slow/; a scraper can authenticate with PRIME_METRICS_TOKEN.
+
+PRIME_METRICS_ENABLED = True
+PRIME_SLOW_REQUEST_MS = 500
+PRIME_SLOW_REQUEST_LOG_SIZE = 50
+PRIME_METRICS_TOKEN = os.environ.get('PRIME_METRICS_TOKEN')
+
+
+# Background tasks (see prime_accessories.tasks); drained by manage.py run_workers.
+# A task still running after PRIME_TASK_LOCK_TIMEOUT seconds is assumed lost
+# and queued again. PRIME_TASKS_EAGER runs tasks inline instead of queueing them.
+# run_workers deletes done tasks PRIME_TASK_RETENTION_DAYS after they finished
+# (None keeps them).
+
+PRIME_TASKS_EAGER = False
+PRIME_TASK_LOCK_TIMEOUT = 300
+PRIME_TASK_RETENTION_DAYS = 7
+
+
+# Inventory (see prime_accessories.inventory). With PRIME_STOCK_HOLD_SECONDS set,
+# stock taken at checkout is held for that long awaiting payment, after which
+# the unpaid order is cancelled; None sells it outright.
+
+PRIME_STOCK_HOLD_SECONDS = None
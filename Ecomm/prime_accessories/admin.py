@@ -1,5 +1,19 @@
+import datetime
+
 from django.contrib import admin
-from .models import Phone, Accessories, Category, Order, OrderItem, CustomerProfile, Review
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import inventory
+from .exports import export_filename, filter_orders, streaming_orders_response
+from .models import (
+    Phone, Accessories, Category, Compatibility, Order, OrderItem, CustomerProfile, Review, DailySales, Task,
+    StockEntry,
+)
+from .rollups import sales_summary
 
 
 @admin.register(Category)
@@ -9,22 +23,47 @@ class CategoryAdmin(admin.ModelAdmin):
     ordering = ['-created_at']
 
 
+class StockShardingMixin:
+    """Actions splitting hot SKUs' stock over shards and merging it back; see inventory.py"""
+    item_type = None
+    actions = ['shard_stock', 'merge_shards']
+    
+    @admin.action(description=f"Shard stock of selected hot SKUs ({inventory.DEFAULT_SHARDS} shards)")
+    def shard_stock(self, request, queryset):
+        for pk in queryset.values_list('pk', flat=True):
+            inventory.shard_stock(self.item_type, pk)
+        self.message_user(request, f"Stock of {queryset.count()} products sharded.")
+    
+    @admin.action(description="Merge stock shards of selected SKUs")
+    def merge_shards(self, request, queryset):
+        for pk in queryset.filter(stock_shards__gt=0).values_list('pk', flat=True):
+            inventory.merge_shards(self.item_type, pk)
+        self.message_user(request, "Stock shards merged.")
+
+
 @admin.register(Phone)
-class PhoneAdmin(admin.ModelAdmin):
+class PhoneAdmin(StockShardingMixin, admin.ModelAdmin):
+    item_type = 'phone'
     list_display = ['name', 'brand', 'price', 'stock', 'rating', 'condition', 'created_at']
     list_filter = ['condition', 'rating', 'created_at', 'category']
-    search_fields = ['name', 'brand', 'model']
-    readonly_fields = ['created_at', 'updated_at']
+    search_fields = ['sku', 'name', 'brand', 'model']
+    # rating and stock are kept by the review handlers and the stock ledger
+    readonly_fields = ['stock', 'stock_shards', 'rating', 'ram_gb', 'storage_gb', 'display_inches', 'main_camera_mp',
+                       'created_at', 'updated_at']
     fieldsets = (
         ('Basic Info', {
-            'fields': ('name', 'brand', 'model', 'description', 'category')
+            'fields': ('sku', 'name', 'brand', 'model', 'description', 'category')
         }),
         ('Pricing & Inventory', {
-            'fields': ('price', 'stock')
+            'fields': ('price', 'stock', 'stock_shards')
         }),
         ('Specifications', {
             'fields': ('processor', 'ram', 'storage', 'display_size', 'camera_mp', 'battery_mah', 'os')
         }),
+        ('Normalized Specs', {
+            'fields': ('ram_gb', 'storage_gb', 'display_inches', 'main_camera_mp'),
+            'classes': ('collapse',)
+        }),
         ('Additional Info', {
             'fields': ('condition', 'color', 'image_url', 'rating')
         }),
@@ -35,22 +74,32 @@ class PhoneAdmin(admin.ModelAdmin):
     )
 
 
+class CompatibilityInline(admin.TabularInline):
+    model = Compatibility
+    extra = 0
+    # The phone table is too large for a select box
+    raw_id_fields = ['phone']
+    verbose_name = "Compatible phone"
+    verbose_name_plural = "Compatible phones"
+
+
 @admin.register(Accessories)
-class AccessoriesAdmin(admin.ModelAdmin):
+class AccessoriesAdmin(StockShardingMixin, admin.ModelAdmin):
+    item_type = 'accessory'
     list_display = ['name', 'accessory_type', 'price', 'stock', 'rating', 'created_at']
     list_filter = ['accessory_type', 'rating', 'created_at', 'category']
-    search_fields = ['name', 'brand', 'accessory_type']
-    filter_horizontal = ['compatible_phones']
-    readonly_fields = ['created_at', 'updated_at']
+    search_fields = ['sku', 'name', 'brand', 'accessory_type']
+    inlines = [CompatibilityInline]
+    readonly_fields = ['stock', 'stock_shards', 'rating', 'created_at', 'updated_at']
     fieldsets = (
         ('Basic Info', {
-            'fields': ('name', 'brand', 'accessory_type', 'description', 'category')
+            'fields': ('sku', 'name', 'brand', 'accessory_type', 'description', 'category')
         }),
         ('Pricing & Inventory', {
-            'fields': ('price', 'stock')
+            'fields': ('price', 'stock', 'stock_shards')
         }),
         ('Details', {
-            'fields': ('color', 'material', 'compatible_phones', 'image_url', 'rating')
+            'fields': ('color', 'material', 'image_url', 'rating')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -80,6 +129,7 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['order_number', 'customer__username']
     readonly_fields = ['order_number', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
+    actions = ['export_csv']
     fieldsets = (
         ('Order Info', {
             'fields': ('order_number', 'customer')
@@ -98,6 +148,28 @@ class OrderAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    @admin.action(description="Export selected orders to CSV")
+    def export_csv(self, request, queryset):
+        return streaming_orders_response(queryset, export_filename())
+    
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='prime_accessories_order_export'),
+        ] + super().get_urls()
+    
+    def export_view(self, request):
+        """Stream every order in ?date_from=&date_to=&status= (no selection needed)"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            date_from = parse_date(request.GET.get('date_from', ''))
+            date_to = parse_date(request.GET.get('date_to', ''))
+        except ValueError:
+            date_from = date_to = None
+        statuses = [status for status in request.GET.getlist('status') if status in dict(Order.STATUS_CHOICES)]
+        queryset = filter_orders(Order.objects.all(), date_from, date_to, statuses)
+        return streaming_orders_response(queryset, export_filename(date_from, date_to))
 
 
 @admin.register(Review)
@@ -115,3 +187,107 @@ class ReviewAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    """Read-only rollup rows, plus the sales dashboard at dashboard/"""
+    list_display = ['date', 'order_count', 'unit_count', 'gross_revenue', 'discount_total', 'net_revenue']
+    date_hierarchy = 'date'
+    DEFAULT_DAYS = 30
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view),
+                 name='prime_accessories_sales_dashboard'),
+        ] + super().get_urls()
+    
+    def dashboard_view(self, request):
+        """Sales for ?date_from=&date_to= (default: the last 30 days), read from the rollups only"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            date_from = parse_date(request.GET.get('date_from', ''))
+            date_to = parse_date(request.GET.get('date_to', ''))
+        except ValueError:
+            date_from = date_to = None
+        date_to = date_to or timezone.localdate()
+        date_from = date_from or date_to - datetime.timedelta(days=self.DEFAULT_DAYS - 1)
+        context = dict(
+            self.admin_site.each_context(request),
+            title="Sales dashboard",
+            opts=self.model._meta,
+            date_from=date_from,
+            date_to=date_to,
+            **sales_summary(date_from, date_to),
+        )
+        return TemplateResponse(request, 'admin/prime_accessories/sales_dashboard.html', context)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    """The background task outbox; failed tasks can be sent back to the queue"""
+    list_display = ['id', 'name', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by', 'created_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'locked_by']
+    readonly_fields = ['name', 'payload', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by',
+                       'locked_at', 'last_error', 'created_at', 'finished_at']
+    actions = ['retry']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.action(description="Retry selected failed tasks now")
+    def retry(self, request, queryset):
+        # Only failed tasks: a done one (e.g. rollup deltas already applied,
+        # or superseded by a rebuild) would take effect a second time
+        count = queryset.filter(status='failed').update(
+            status='pending', attempts=0, run_after=timezone.now(), locked_by='', locked_at=None, finished_at=None)
+        self.message_user(request, f"{count} tasks queued again.")
+
+
+@admin.register(StockEntry)
+class StockEntryAdmin(admin.ModelAdmin):
+    """The stock ledger, read-only, plus live stock levels at levels/"""
+    list_display = ['id', 'item_type', 'product_id', 'shard', 'quantity', 'status', 'order', 'expires_at', 'created_at']
+    list_filter = ['status', 'item_type']
+    search_fields = ['order__order_number']
+    raw_id_fields = ['order']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path('levels/', self.admin_site.admin_view(self.levels_view),
+                 name='prime_accessories_stock_levels'),
+        ] + super().get_urls()
+    
+    def levels_view(self, request):
+        """Available/reserved/sold per SKU, best sellers first; ?q= searches names and SKUs"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        search = request.GET.get('q', '').strip()
+        context = dict(
+            self.admin_site.each_context(request),
+            title="Stock levels",
+            opts=self.model._meta,
+            search=search,
+            levels=inventory.stock_levels(search),
+        )
+        return TemplateResponse(request, 'admin/prime_accessories/stock_levels.html', context)
@@ -0,0 +1,282 @@
+"""
+Read-only JSON API for the catalog.
+
+Endpoints serialize straight from ``.values()`` projections, so no model
+instances are built. ``?fields=name,price`` selects a sparse fieldset from
+the resource's whitelist; without it the default fields are returned.
+
+Every response carries an ETag and a Last-Modified header derived from the
+``updated_at`` columns. Before building a payload the view runs one
+aggregate query (newest updated_at and row count over the filtered rows)
+and answers ``If-None-Match`` / ``If-Modified-Since`` with a bodiless 304
+when nothing changed, so polling clients cost one cheap query per poll.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from . import compatibility
+from .caching import get_generations
+from .facets import get_facets
+from .filters import filter_accessories, filter_phones
+from .models import Phone, Accessories, Category, Compatibility
+from .pagination import CursorPaginator, InvalidCursor
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+PHONE_FIELDS = (
+    'id', 'sku', 'name', 'brand', 'model', 'description', 'price', 'stock',
+    'processor', 'ram', 'storage', 'display_size', 'camera_mp', 'battery_mah', 'os',
+    'ram_gb', 'storage_gb', 'display_inches', 'main_camera_mp',
+    'condition', 'color', 'image_url', 'rating', 'review_count', 'category',
+    'created_at', 'updated_at',
+)
+PHONE_DEFAULT_FIELDS = ('id', 'name', 'brand', 'price', 'stock', 'condition', 'rating', 'review_count', 'category')
+
+ACCESSORY_FIELDS = (
+    'id', 'sku', 'name', 'brand', 'description', 'price', 'stock', 'accessory_type',
+    'color', 'material', 'image_url', 'rating', 'review_count', 'category',
+    'created_at', 'updated_at',
+)
+ACCESSORY_DEFAULT_FIELDS = ('id', 'name', 'brand', 'price', 'stock', 'accessory_type', 'rating', 'review_count', 'category')
+
+CATEGORY_FIELDS = ('id', 'name', 'description', 'created_at', 'updated_at')
+CATEGORY_DEFAULT_FIELDS = ('id', 'name', 'description')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error_response(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def parse_fields(params, allowed, default):
+    """Return the requested sparse fieldset, validated against allowed"""
+    raw = params.get('fields')
+    if not raw:
+        return list(default)
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in allowed:
+            raise BadRequest(f"Unknown field '{name}'. Allowed: {', '.join(allowed)}")
+        fields.append(name)
+    return fields or list(default)
+
+
+def parse_limit(params):
+    raw = params.get('limit')
+    if not raw:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    if limit < 1:
+        raise BadRequest("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+
+def get_stamp(queryset):
+    """(newest updated_at, row count) of queryset in one aggregate query"""
+    stamp = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return stamp['last_modified'], stamp['count']
+
+
+def make_etag(request, *parts):
+    # Every query parameter changes the payload, so all of them are hashed
+    params = sorted(request.GET.lists())
+    digest = hashlib.md5(f'{request.path}|{params}|{parts}'.encode(), usedforsecurity=False)
+    return quote_etag(digest.hexdigest())
+
+
+def conditional_json(request, etag, last_modified, build_payload):
+    """Return a 304 when the client's copy is current, else the JSON payload"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build_payload())
+    response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def list_response(request, queryset, fields, extra_stamp=()):
+    """Cursor-paginated list of queryset rows projected onto fields"""
+    limit = parse_limit(request.GET)
+    last_modified, count = get_stamp(queryset)
+    etag = make_etag(request, last_modified, count, *extra_stamp)
+
+    def build_payload():
+        paginator = CursorPaginator(queryset.values(*fields, 'created_at', 'id'), limit)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise BadRequest("Invalid cursor")
+        return {
+            'results': [{name: row[name] for name in fields} for row in page],
+            'next': page_url(request, page.next_cursor),
+            'previous': page_url(request, page.previous_cursor),
+        }
+
+    return conditional_json(request, etag, last_modified, build_payload)
+
+
+def detail_response(request, queryset, pk, fields):
+    row = queryset.filter(pk=pk).values(*fields, 'updated_at').first()
+    if row is None:
+        raise Http404("No such object")
+    last_modified = row['updated_at']
+    etag = make_etag(request, last_modified)
+    return conditional_json(request, etag, last_modified, lambda: {name: row[name] for name in fields})
+
+
+def facets_response(request, kind):
+    # Facets are derived data cached on the catalog generations, so the
+    # generations themselves tag the response and no query runs for a 304
+    etag = make_etag(request, get_generations(['catalog', f'{kind}:list']))
+    return conditional_json(request, etag, None, lambda: {'facets': get_facets(kind, request.GET)})
+
+
+def compatibility_stamp(**link_filter):
+    """Stamp of the compatibility rows, so linking/unlinking changes the ETag"""
+    links = Compatibility.objects.filter(**link_filter)
+    stamp = links.aggregate(newest=Max('id'), count=Count('id'))
+    return stamp['newest'], stamp['count']
+
+
+def api_view(view):
+    """GET/HEAD only; BadRequest and invalid filter values become 400 JSON errors"""
+    @require_safe
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as exc:
+            return error_response(str(exc))
+        except (ValidationError, ValueError):
+            return error_response("Invalid filter value")
+        except Http404 as exc:
+            return error_response(str(exc), status=404)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+# ==================== PHONES ====================
+
+@api_view
+def phone_list(request):
+    """Phones, filtered like the phone list page"""
+    fields = parse_fields(request.GET, PHONE_FIELDS, PHONE_DEFAULT_FIELDS)
+    return list_response(request, filter_phones(Phone.objects.all(), request.GET), fields)
+
+
+@api_view
+def phone_facets(request):
+    """Facet counts for the phone list under the same filters"""
+    return facets_response(request, 'phone')
+
+
+@api_view
+def phone_detail(request, pk):
+    fields = parse_fields(request.GET, PHONE_FIELDS, PHONE_FIELDS)
+    return detail_response(request, Phone.objects.all(), pk, fields)
+
+
+@api_view
+def phone_accessories(request, pk):
+    """Accessories compatible with a phone"""
+    if not Phone.objects.filter(pk=pk).exists():
+        raise Http404("No such phone")
+    fields = parse_fields(request.GET, ACCESSORY_FIELDS, ACCESSORY_DEFAULT_FIELDS)
+    queryset = filter_accessories(Accessories.objects.filter(compatible_phones=pk), request.GET)
+    return list_response(request, queryset, fields, compatibility_stamp(phone_id=pk))
+
+
+@api_view
+def phone_compatible(request, pk):
+    """
+    Accessories fitting a phone, cheapest first, from the compatibility
+    index; ?type= (repeatable), ?min_price=, ?max_price=, ?limit=, ?cursor=
+    """
+    if not Phone.objects.filter(pk=pk).exists():
+        raise Http404("No such phone")
+    # The lookup is cached on these generations, so they tag the response too
+    etag = make_etag(request, get_generations(['catalog', f'phone:{pk}']))
+
+    def build_payload():
+        try:
+            result = compatibility.lookup(pk, request.GET)
+        except InvalidCursor:
+            raise BadRequest("Invalid cursor")
+        return {
+            **result,
+            'next': page_url(request, result['next']),
+            'previous': page_url(request, result['previous']),
+        }
+
+    return conditional_json(request, etag, None, build_payload)
+
+
+# ==================== ACCESSORIES ====================
+
+@api_view
+def accessory_list(request):
+    """Accessories, filtered like the accessories list page"""
+    fields = parse_fields(request.GET, ACCESSORY_FIELDS, ACCESSORY_DEFAULT_FIELDS)
+    return list_response(request, filter_accessories(Accessories.objects.all(), request.GET), fields)
+
+
+@api_view
+def accessory_facets(request):
+    """Facet counts for the accessories list under the same filters"""
+    return facets_response(request, 'accessory')
+
+
+@api_view
+def accessory_detail(request, pk):
+    fields = parse_fields(request.GET, ACCESSORY_FIELDS, ACCESSORY_FIELDS)
+    return detail_response(request, Accessories.objects.all(), pk, fields)
+
+
+@api_view
+def accessory_phones(request, pk):
+    """Phones an accessory is compatible with"""
+    if not Accessories.objects.filter(pk=pk).exists():
+        raise Http404("No such accessory")
+    fields = parse_fields(request.GET, PHONE_FIELDS, PHONE_DEFAULT_FIELDS)
+    queryset = filter_phones(Phone.objects.filter(accessories=pk), request.GET)
+    return list_response(request, queryset, fields, compatibility_stamp(accessory_id=pk))
+
+
+# ==================== CATEGORIES ====================
+
+@api_view
+def category_list(request):
+    """Every category; the list is small, so it is not paginated"""
+    fields = parse_fields(request.GET, CATEGORY_FIELDS, CATEGORY_DEFAULT_FIELDS)
+    queryset = Category.objects.order_by('name')
+    last_modified, count = get_stamp(queryset)
+    etag = make_etag(request, last_modified, count)
+    return conditional_json(request, etag, last_modified, lambda: {'results': list(queryset.values(*fields))})
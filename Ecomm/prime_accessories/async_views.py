@@ -0,0 +1,177 @@
+"""
+Async (ASGI-native) catalog and cart views.
+
+These mirror the list, detail and cart views in views.py, but use the async
+ORM (aget, afirst, async iteration), request.auser() and the async session
+API, so under an ASGI server they run on the event loop instead of
+occupying a thread of the sync-to-async bridge. They render the same
+templates with the same context and are routed under ``async/``.
+
+Every queryset is evaluated before rendering: templates run synchronously,
+and a lazy relation touched from a template would be a blocking query.
+"""
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_POST
+
+from .caching import ais_cacheable, amake_key, get_cache, get_timeout, normalize_filters
+from .carts import aadd_item, acart_contents, acart_items, aget_cart, aremove_item, parse_item_key
+from .facets import aget_facets
+from .filters import afilter_accessories, afilter_phones
+from .models import Phone, Accessories, Category
+from .pagination import CursorPaginator, InvalidCursor
+from .views import PhoneListView, PhoneDetailView, AccessoriesListView, AccessoriesDetailView
+
+
+async def resolve_user(request):
+    """Replace the lazy request.user so templates can't query from the event loop"""
+    request.user = await request.auser()
+    return request.user
+
+
+async def cached_response(request, name, generations, build):
+    """Async CatalogCacheMixin: serve anonymous GETs from the catalog cache"""
+    if not await ais_cacheable(request):
+        return await build()
+
+    cache = get_cache()
+    key = await amake_key(
+        f'view:async:{name}',
+        generations,
+        f"{request.resolver_match.kwargs.get('pk', '')}|{normalize_filters(request.GET)}",
+    )
+    cached = await cache.aget(key)
+    if cached is not None:
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Catalog-Cache'] = 'hit'
+        return response
+
+    response = await build()
+    if response.status_code == 200:
+        if not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            await cache.aset(key, (response.content, response['Content-Type']), get_timeout())
+        response['X-Catalog-Cache'] = 'miss'
+    return response
+
+
+async def paginate(request, queryset, per_page):
+    """Async MultipleObjectMixin.paginate_queryset, including cursor mode"""
+    if request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET:
+        paginator = CursorPaginator(queryset, per_page)
+        try:
+            page = await paginator.apage(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+        return paginator, page
+
+    paginator = Paginator(queryset, per_page)
+    # Paginator.count is a cached property that would run a sync COUNT(*)
+    paginator.count = await queryset.acount()
+    page_number = request.GET.get('page') or 1
+    if page_number == 'last':
+        page_number = paginator.num_pages
+    try:
+        page = paginator.page(page_number)
+    except InvalidPage:
+        raise Http404("Invalid page")
+    page.object_list = [obj async for obj in page.object_list]
+    return paginator, page
+
+
+async def catalog_list(request, view_class, kind, queryset):
+    paginator, page = await paginate(request, queryset, view_class.paginate_by)
+    categories = [category async for category in Category.objects.all()]
+    facets = await aget_facets(kind, request.GET)
+    await resolve_user(request)
+    return render(request, view_class.template_name, {
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': page.object_list,
+        view_class.context_object_name: page.object_list,
+        'categories': categories,
+        'search_query': request.GET.get('search', ''),
+        'facets': facets,
+    })
+
+
+# ==================== PHONE VIEWS ====================
+
+async def phone_list(request):
+    async def build():
+        queryset = await afilter_phones(Phone.objects.all(), request.GET)
+        return await catalog_list(request, PhoneListView, 'phone', queryset)
+    return await cached_response(request, 'phone_list', ['catalog', 'phone:list'], build)
+
+
+async def phone_detail(request, pk):
+    async def build():
+        try:
+            phone = await Phone.objects.select_related('category').aget(pk=pk)
+        except Phone.DoesNotExist:
+            raise Http404("No such phone")
+        reviews = [review async for review in
+                   phone.reviews.select_related('customer')[:PhoneDetailView.review_limit]]
+        accessories = [accessory async for accessory in phone.accessories.select_related('category')]
+        await resolve_user(request)
+        return render(request, PhoneDetailView.template_name, {
+            'object': phone,
+            'phone': phone,
+            'reviews': reviews,
+            'compatible_accessories': accessories,
+        })
+    return await cached_response(request, 'phone_detail', ['catalog', f'phone:{pk}'], build)
+
+
+# ==================== ACCESSORIES VIEWS ====================
+
+async def accessories_list(request):
+    async def build():
+        queryset = await afilter_accessories(Accessories.objects.all(), request.GET)
+        return await catalog_list(request, AccessoriesListView, 'accessory', queryset)
+    return await cached_response(request, 'accessories_list', ['catalog', 'accessory:list'], build)
+
+
+async def accessory_detail(request, pk):
+    async def build():
+        try:
+            accessory = await Accessories.objects.select_related('category').aget(pk=pk)
+        except Accessories.DoesNotExist:
+            raise Http404("No such accessory")
+        reviews = [review async for review in
+                   accessory.reviews.select_related('customer')[:AccessoriesDetailView.review_limit]]
+        phones = [phone async for phone in accessory.compatible_phones.select_related('category')]
+        await resolve_user(request)
+        return render(request, AccessoriesDetailView.template_name, {
+            'object': accessory,
+            'accessory': accessory,
+            'reviews': reviews,
+            'compatible_phones': phones,
+        })
+    return await cached_response(request, 'accessory_detail', ['catalog', f'accessory:{pk}'], build)
+
+
+# ==================== SHOPPING CART VIEWS ====================
+
+@require_POST
+async def add_to_cart(request, item_type, item_id):
+    cart = await aget_cart(request, create=True)
+    await aadd_item(cart, item_type, item_id)
+    return redirect('async_cart_view')
+
+
+async def view_cart(request):
+    cart_lines, total_amount = await acart_contents(await acart_items(request))
+    await resolve_user(request)
+    return render(request, 'prime_accessories/cart.html', {
+        'cart_items': cart_lines,
+        'total_amount': total_amount,
+    })
+
+
+async def remove_from_cart(request, cart_item_key):
+    item_type, item_id = parse_item_key(cart_item_key)
+    await aremove_item(await acart_items(request), item_type, item_id)
+    return redirect('async_cart_view')
@@ -0,0 +1,79 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import statistics
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(timings):
+    """Return millisecond statistics for a list of durations in seconds"""
+    ordered = sorted(timings)
+    millis = [value * 1000 for value in ordered]
+    return {
+        'runs': len(millis),
+        'min_ms': round(millis[0], 3),
+        'median_ms': round(statistics.median(millis), 3),
+        'mean_ms': round(statistics.fmean(millis), 3),
+        'p95_ms': round(percentile(millis, 0.95), 3),
+        'p99_ms': round(percentile(millis, 0.99), 3),
+        'max_ms': round(millis[-1], 3),
+    }
+
+
+def measure(fn, repeat=5, setup=None):
+    """Time fn repeat times and record how many queries each call issued"""
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        queries.append(len(captured.captured_queries))
+    result = summarize(timings)
+    result['queries'] = max(queries)
+    return result
+
+
+def format_table(rows, columns):
+    """Render a list of dicts as a fixed-width text table"""
+    widths = {column: max(len(column), *(len(str(row.get(column, ''))) for row in rows)) for column in columns}
+    lines = ['  '.join(column.ljust(widths[column]) for column in columns)]
+    lines.append('  '.join('-' * widths[column] for column in columns))
+    for row in rows:
+        lines.append('  '.join(str(row.get(column, '')).ljust(widths[column]) for column in columns))
+    return '\n'.join(lines)
+
+
+def find_regressions(baseline, results, threshold=0.25, min_delta_ms=1.0):
+    """
+    Compare run_benchmarks results with a baseline run.
+
+    A scenario regresses when it issues more queries than before, or when
+    its median grows by more than threshold (a fraction) and by more than
+    min_delta_ms, so sub-millisecond noise never fails a build. Returns a
+    list of human-readable descriptions.
+    """
+    before = {row['scenario']: row for row in baseline}
+    regressions = []
+    for row in results:
+        old = before.get(row['scenario'])
+        if old is None:
+            continue
+        if row['queries'] > old['queries']:
+            regressions.append(f"{row['scenario']}: {old['queries']} -> {row['queries']} queries")
+        delta = row['median_ms'] - old['median_ms']
+        if delta > min_delta_ms and row['median_ms'] > old['median_ms'] * (1 + threshold):
+            growth = f" (+{delta / old['median_ms']:.0%})" if old['median_ms'] else ''
+            regressions.append(f"{row['scenario']}: median {old['median_ms']} -> {row['median_ms']} ms{growth}")
+    return regressions
@@ -0,0 +1,175 @@
+"""
+Catalog page and fragment caching.
+
+Cached entries live in the cache alias named by PRIME_CATALOG_CACHE (local
+memory, file or Redis, see CACHES in settings). Every key embeds one or more
+generation counters:
+
+* ``catalog``             every catalog page (bumped by Category changes)
+* ``phone:list``          phone list pages (bumped by any Phone change, and
+                          by stock only when a phone sells out or comes back)
+* ``accessory:list``      accessory list pages
+* ``phone:<pk>``          one phone's detail page and fragments
+* ``accessory:<pk>``      one accessory's detail page and fragments
+
+Invalidation bumps the affected counters (see signals.py, and
+inventory.stock_changed for stock moved by checkouts and restocks); stale
+entries are never deleted, they just stop being addressed and age out with
+the timeout.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+
+from .search import get_kind
+
+
+DEFAULT_TIMEOUT = 300
+
+# GET parameters that change what a catalog page shows; anything else
+# (tracking parameters, cache busters) is ignored when building keys
+FILTER_PARAMS = (
+    'search', 'category', 'brand', 'min_price', 'max_price', 'condition', 'type',
+    'ram_min', 'ram_max', 'storage_min', 'storage_max', 'display_min', 'display_max',
+    'camera_min', 'camera_max',
+    'page', 'pagination', 'cursor',
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'PRIME_CATALOG_CACHE', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PRIME_CATALOG_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _generation_key(name):
+    return f'gen:{name}'
+
+
+def get_generations(names):
+    """Return the current counter for each generation name"""
+    cache = get_cache()
+    keys = [_generation_key(name) for name in names]
+    found = cache.get_many(keys)
+    generations = []
+    for name, key in zip(names, keys):
+        value = found.get(key)
+        if value is None:
+            # Seed from the clock, never from 0: an evicted counter must not
+            # resurrect entries written under an earlier value
+            cache.add(key, time.time_ns(), timeout=None)
+            value = cache.get(key)
+        generations.append(value)
+    return generations
+
+
+async def aget_generations(names):
+    """Async get_generations() for ASGI views"""
+    cache = get_cache()
+    keys = [_generation_key(name) for name in names]
+    found = await cache.aget_many(keys)
+    generations = []
+    for name, key in zip(names, keys):
+        value = found.get(key)
+        if value is None:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            value = await cache.aget(key)
+        generations.append(value)
+    return generations
+
+
+def bump(*names):
+    """Invalidate everything keyed on the given generations"""
+    cache = get_cache()
+    for name in names:
+        key = _generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def normalize_filters(query_dict, exclude=()):
+    """Canonical, order-independent representation of the catalog filters"""
+    normalized = []
+    for name in FILTER_PARAMS:
+        if name in exclude:
+            continue
+        value = query_dict.get(name, '').strip()
+        if name == 'search':
+            value = ' '.join(value.lower().split())
+        if value and not (name == 'page' and value == '1'):
+            normalized.append(f'{name}={value}')
+    return '&'.join(normalized)
+
+
+def _digest_key(prefix, generations, extra):
+    digest = hashlib.md5(f'{generations}|{extra}'.encode(), usedforsecurity=False).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def make_key(prefix, generation_names, extra=''):
+    return _digest_key(prefix, get_generations(generation_names), extra)
+
+
+async def amake_key(prefix, generation_names, extra=''):
+    return _digest_key(prefix, await aget_generations(generation_names), extra)
+
+
+def object_generation(obj):
+    return f'{get_kind(obj)}:{obj.pk}'
+
+
+def is_cacheable(request):
+    return request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+async def ais_cacheable(request):
+    return request.method in ('GET', 'HEAD') and not (await request.auser()).is_authenticated
+
+
+class CatalogCacheMixin:
+    """
+    Cache whole rendered responses of catalog list/detail views.
+
+    Only anonymous GET requests are served from or written to the cache, and
+    responses that used a CSRF token are never stored.
+    """
+    cache_item_type = None
+
+    def get_cache_generations(self):
+        if 'pk' in self.kwargs:
+            return ['catalog', f"{self.cache_item_type}:{self.kwargs['pk']}"]
+        return ['catalog', f'{self.cache_item_type}:list']
+
+    def get(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = make_key(
+            f'view:{type(self).__name__}',
+            self.get_cache_generations(),
+            f"{self.kwargs.get('pk', '')}|{normalize_filters(request.GET)}",
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Catalog-Cache'] = 'hit'
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        if isinstance(response, TemplateResponse) and response.status_code == 200:
+            def store(rendered):
+                if not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                    cache.set(key, (rendered.content, rendered['Content-Type']), get_timeout())
+            response.add_post_render_callback(store)
+            response['X-Catalog-Cache'] = 'miss'
+        return response
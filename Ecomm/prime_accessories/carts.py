@@ -0,0 +1,263 @@
+"""
+Database-backed shopping carts.
+
+Each line is its own CartItem row, so adding or removing an item is a
+single-row upsert or delete instead of rewriting the whole session, and the
+cart page reads every line with current prices in one joined query.
+
+Signed-in users own one Cart; anonymous carts are remembered by id in the
+session (the id survives the session key rotation on login) and merged into
+the user's cart by merge_session_cart() when they sign in. Carts still held
+in the legacy ``session['cart']`` dict are imported the first time they are
+touched.
+
+Adding to a cart is POST-only, so crawlers following links don't create
+carts and sessions; purge_anonymous_carts() (``manage.py purge_carts``)
+deletes the anonymous carts left behind by shoppers who never came back.
+"""
+import datetime
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import Http404
+from django.utils import timezone
+
+from .checkout import CART_MODELS
+from .models import Cart, CartItem
+
+
+CART_SESSION_KEY = 'cart_id'
+LEGACY_SESSION_KEY = 'cart'
+
+ITEM_FIELDS = {
+    'phone': 'phone_id',
+    'accessory': 'accessory_id',
+}
+
+
+def _item_field(item_type):
+    try:
+        return ITEM_FIELDS[item_type]
+    except KeyError:
+        raise Http404("Unknown item type")
+
+
+def cart_items(request):
+    """Queryset of the current visitor's cart lines, without loading the cart"""
+    if request.session.get(LEGACY_SESSION_KEY):
+        get_cart(request)
+    if request.user.is_authenticated:
+        return CartItem.objects.filter(cart__user=request.user)
+    cart_id = request.session.get(CART_SESSION_KEY)
+    if cart_id is None:
+        return CartItem.objects.none()
+    return CartItem.objects.filter(cart_id=cart_id, cart__user__isnull=True)
+
+
+def get_cart(request, create=False):
+    """Return the visitor's Cart, or None when there is none and create is False"""
+    if request.user.is_authenticated:
+        if create:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+        else:
+            cart = Cart.objects.filter(user=request.user).first()
+    else:
+        cart_id = request.session.get(CART_SESSION_KEY)
+        cart = Cart.objects.filter(pk=cart_id, user__isnull=True).first() if cart_id else None
+        if cart is None and create:
+            cart = Cart.objects.create()
+            request.session[CART_SESSION_KEY] = cart.pk
+
+    legacy = request.session.get(LEGACY_SESSION_KEY)
+    if legacy:
+        if cart is None:
+            return get_cart(request, create=True)
+        import_legacy_cart(cart, legacy)
+        del request.session[LEGACY_SESSION_KEY]
+    return cart
+
+
+def add_item(cart, item_type, item_id, quantity=1):
+    """Add quantity of a product to cart with a single-row upsert"""
+    field = _item_field(item_type)
+    updated = (CartItem.objects
+               .filter(cart=cart, **{field: item_id})
+               .update(quantity=F('quantity') + quantity))
+    if updated:
+        return
+    if not CART_MODELS[item_type].objects.filter(pk=item_id).exists():
+        raise Http404("No such product")
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, item_type=item_type, quantity=quantity, **{field: item_id})
+    except IntegrityError:
+        # A concurrent request inserted the line first
+        (CartItem.objects
+         .filter(cart=cart, **{field: item_id})
+         .update(quantity=F('quantity') + quantity))
+
+
+def remove_item(items, item_type, item_id):
+    """Delete a product's line from a cart_items() queryset"""
+    items.filter(**{_item_field(item_type): item_id}).delete()
+
+
+def parse_item_key(cart_item_key):
+    """Split a "<item_type>_<item_id>" key as used in cart URLs"""
+    item_type, _, item_id = cart_item_key.rpartition('_')
+    if item_type not in ITEM_FIELDS or not item_id.isdigit():
+        raise Http404("Unknown cart item")
+    return item_type, int(item_id)
+
+
+def _with_products(items):
+    return items.select_related('phone', 'accessory').order_by('added_at', 'id')
+
+
+def cart_contents(items):
+    """Return (lines, total) for a cart_items() queryset using current prices"""
+    return _summarize(_with_products(items))
+
+
+def _summarize(items):
+    lines = []
+    total_amount = Decimal('0.00')
+    for item in items:
+        product = item.phone if item.item_type == 'phone' else item.accessory
+        subtotal = product.price * item.quantity
+        total_amount += subtotal
+        lines.append({
+            'key': f"{item.item_type}_{product.pk}",
+            'item_type': item.item_type,
+            'item_id': product.pk,
+            'name': product.name,
+            'price': product.price,
+            'quantity': item.quantity,
+            'subtotal': subtotal,
+        })
+    return lines, total_amount
+
+
+def checkout_lines(items):
+    """(item_type, item_id, quantity) lines for checkout.place_order"""
+    return [
+        (item_type, phone_id or accessory_id, quantity)
+        for item_type, phone_id, accessory_id, quantity
+        in items.values_list('item_type', 'phone_id', 'accessory_id', 'quantity')
+    ]
+
+
+def merge_carts(source, target):
+    """Move every line of source into target, then delete source"""
+    with transaction.atomic():
+        for item in source.items.all():
+            product_id = item.phone_id or item.accessory_id
+            add_item(target, item.item_type, product_id, item.quantity)
+        source.delete()
+
+
+def import_legacy_cart(cart, legacy):
+    for item in legacy.values():
+        if item.get('item_type') not in ITEM_FIELDS:
+            continue
+        try:
+            add_item(cart, item['item_type'], item['item_id'], item['quantity'])
+        except Http404:
+            # The product was deleted since it was added
+            pass
+
+
+def merge_session_cart(request, user):
+    """Fold the anonymous cart of this session into user's cart"""
+    cart_id = request.session.pop(CART_SESSION_KEY, None)
+    anonymous = Cart.objects.filter(pk=cart_id, user__isnull=True).first() if cart_id else None
+    legacy = request.session.pop(LEGACY_SESSION_KEY, None)
+    if anonymous is None and not legacy:
+        return
+    cart, _ = Cart.objects.get_or_create(user=user)
+    if anonymous is not None:
+        merge_carts(anonymous, cart)
+    if legacy:
+        import_legacy_cart(cart, legacy)
+
+
+# ==================== CLEANUP ====================
+
+DEFAULT_ANONYMOUS_CART_DAYS = 30
+
+
+def stale_anonymous_carts(days=DEFAULT_ANONYMOUS_CART_DAYS):
+    """Anonymous carts with no line added, nor created, in the last days"""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return (Cart.objects
+            .filter(user__isnull=True, updated_at__lt=cutoff)
+            .exclude(items__added_at__gte=cutoff))
+
+
+def purge_anonymous_carts(days=DEFAULT_ANONYMOUS_CART_DAYS):
+    """Delete stale anonymous carts and their lines; returns the number of carts deleted"""
+    return stale_anonymous_carts(days).delete()[1].get(Cart._meta.label, 0)
+
+
+# ==================== ASYNC ====================
+
+# Counterparts of the functions above for the ASGI views: they use the async
+# ORM and session APIs and never block the event loop. Legacy session carts
+# are rare, so importing one is handed to the sync code in a thread.
+
+async def acart_items(request):
+    """Async cart_items()"""
+    if await request.session.aget(LEGACY_SESSION_KEY):
+        await sync_to_async(get_cart)(request)
+    user = await request.auser()
+    if user.is_authenticated:
+        return CartItem.objects.filter(cart__user=user)
+    cart_id = await request.session.aget(CART_SESSION_KEY)
+    if cart_id is None:
+        return CartItem.objects.none()
+    return CartItem.objects.filter(cart_id=cart_id, cart__user__isnull=True)
+
+
+async def aget_cart(request, create=False):
+    """Async get_cart()"""
+    if await request.session.aget(LEGACY_SESSION_KEY):
+        return await sync_to_async(get_cart)(request, create)
+    user = await request.auser()
+    if user.is_authenticated:
+        if create:
+            cart, _ = await Cart.objects.aget_or_create(user=user)
+        else:
+            cart = await Cart.objects.filter(user=user).afirst()
+        return cart
+    cart_id = await request.session.aget(CART_SESSION_KEY)
+    cart = await Cart.objects.filter(pk=cart_id, user__isnull=True).afirst() if cart_id else None
+    if cart is None and create:
+        cart = await Cart.objects.acreate()
+        await request.session.aset(CART_SESSION_KEY, cart.pk)
+    return cart
+
+
+async def aadd_item(cart, item_type, item_id, quantity=1):
+    """Async add_item()"""
+    field = _item_field(item_type)
+    lines = CartItem.objects.filter(cart=cart, **{field: item_id})
+    if await lines.aupdate(quantity=F('quantity') + quantity):
+        return
+    if not await CART_MODELS[item_type].objects.filter(pk=item_id).aexists():
+        raise Http404("No such product")
+    try:
+        # atomic() has no async form; this runs in autocommit, where a
+        # failed INSERT leaves no transaction behind to roll back
+        await CartItem.objects.acreate(cart=cart, item_type=item_type, quantity=quantity, **{field: item_id})
+    except IntegrityError:
+        await lines.aupdate(quantity=F('quantity') + quantity)
+
+
+async def aremove_item(items, item_type, item_id):
+    await items.filter(**{_item_field(item_type): item_id}).adelete()
+
+
+async def acart_contents(items):
+    return _summarize([item async for item in _with_products(items)])
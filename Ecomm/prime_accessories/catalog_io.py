@@ -0,0 +1,314 @@
+"""
+Bulk catalog import and export.
+
+Feeds are CSV or JSON Lines, one product per row, keyed by ``sku``. They are
+read and written as streams, so memory use depends on the batch size and
+not on the feed size.
+
+Each import batch is one transaction:
+
+1. categories named by the batch are resolved through an in-memory
+   name -> id map, and any that are missing are created in one INSERT,
+2. products are upserted in one ``INSERT ... ON CONFLICT (sku) DO UPDATE``;
+   columns a feed leaves out keep their stored values,
+3. for accessories, the Compatibility rows of the batch are replaced with
+   one DELETE and one bulk INSERT, carrying the accessory's type and price,
+4. the batch is added to the search index.
+
+bulk_create() skips save() and signals, so the importer normalizes phone
+specs itself and invalidates the catalog cache once at the end.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from . import caching, specs
+from .compatibility import sync_denormalized
+from .models import Phone, Accessories, Category, Compatibility
+from .search import SEARCH_FIELDS, get_backend
+
+
+FORMATS = ('csv', 'jsonl')
+
+# Columns of a feed row; category holds the category name and
+# compatible_phones a list of phone SKUs ("|"-separated in CSV)
+COLUMNS = {
+    'phone': [
+        'sku', 'name', 'brand', 'model', 'description', 'price', 'stock',
+        'processor', 'ram', 'storage', 'display_size', 'camera_mp', 'battery_mah', 'os',
+        'condition', 'color', 'image_url', 'category',
+    ],
+    'accessory': [
+        'sku', 'name', 'brand', 'description', 'price', 'stock', 'accessory_type',
+        'color', 'material', 'image_url', 'category', 'compatible_phones',
+    ],
+}
+
+MODELS = {
+    'phone': Phone,
+    'accessory': Accessories,
+}
+
+REQUIRED = ('sku', 'name', 'price')
+CSV_LIST_SEPARATOR = '|'
+# Rejected rows whose messages an importer keeps; the rest are only counted
+DEFAULT_MAX_ERRORS = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# ==================== READING ====================
+
+def read_rows(stream, fmt):
+    """Yield (line number, raw dict) pairs from a CSV or JSONL stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f"invalid JSON: {exc}")
+            continue
+        yield line_number, row
+
+
+def _decimal(value, name):
+    try:
+        value = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError(f"{name} is not a number: {value!r}")
+    if not value.is_finite():
+        raise RowError(f"{name} is not a number: {str(value)!r}")
+    if value < 0:
+        raise RowError(f"{name} is negative")
+    return value
+
+
+def _integer(value, name):
+    try:
+        value = int(str(value).strip())
+    except ValueError:
+        raise RowError(f"{name} is not an integer: {value!r}")
+    if value < 0:
+        raise RowError(f"{name} is negative")
+    return value
+
+
+def clean_row(kind, raw):
+    """Validate a raw feed row into model field values; absent columns stay absent"""
+    if isinstance(raw, RowError):
+        raise raw
+    if not isinstance(raw, dict):
+        raise RowError("row is not an object")
+    row = {}
+    for name in COLUMNS[kind]:
+        if name not in raw:
+            continue
+        value = raw[name]
+        row[name] = value.strip() if isinstance(value, str) else ('' if value is None else value)
+    missing = [name for name in REQUIRED if row.get(name, '') == '']
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+
+    row['sku'] = str(row['sku'])
+    row['price'] = _decimal(row['price'], 'price')
+    if 'stock' in row:
+        row['stock'] = _integer(row['stock'], 'stock') if row['stock'] != '' else 0
+    if kind == 'phone':
+        if 'battery_mah' in row:
+            row['battery_mah'] = _integer(row['battery_mah'], 'battery_mah') if row['battery_mah'] != '' else None
+        if 'condition' in row:
+            row['condition'] = row['condition'] or 'new'
+            if row['condition'] not in dict(Phone.CONDITION_CHOICES):
+                raise RowError(f"unknown condition {row['condition']!r}")
+    else:
+        if not row.get('accessory_type'):
+            raise RowError("missing accessory_type")
+        if 'compatible_phones' in row:
+            compatible = row['compatible_phones']
+            if isinstance(compatible, str):
+                compatible = [sku.strip() for sku in compatible.split(CSV_LIST_SEPARATOR) if sku.strip()]
+            row['compatible_phones'] = [str(sku) for sku in compatible or []]
+    return row
+
+
+# ==================== IMPORT ====================
+
+class CatalogImporter:
+    """
+    Upsert feed rows of one kind in batches; counters are kept on the instance.
+
+    errors holds (line number, message) for the first max_errors rejected
+    rows and error_count counts them all, so a broken feed can't fill memory.
+    """
+
+    def __init__(self, kind, batch_size=1000, max_errors=DEFAULT_MAX_ERRORS):
+        self.kind = kind
+        self.model = MODELS[kind]
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.phone_ids = {}
+        self.created = self.updated = self.links = 0
+        self.errors = []
+        self.error_count = 0
+        self.unknown_phones = set()
+
+    @property
+    def processed(self):
+        return self.created + self.updated
+
+    def run(self, rows, on_batch=None):
+        """Import (line number, raw row) pairs; on_batch() is called after each batch"""
+        batch = {}
+        for line_number, raw in rows:
+            try:
+                row = clean_row(self.kind, raw)
+            except RowError as exc:
+                self.error_count += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append((line_number, str(exc)))
+                continue
+            # A later row for the same SKU wins; one upsert can't touch a row twice
+            batch.pop(row['sku'], None)
+            batch[row['sku']] = row
+            if len(batch) >= self.batch_size:
+                self.import_batch(list(batch.values()))
+                batch = {}
+                if on_batch:
+                    on_batch(self)
+        if batch:
+            self.import_batch(list(batch.values()))
+            if on_batch:
+                on_batch(self)
+        caching.bump('catalog')
+
+    def import_batch(self, rows):
+        with transaction.atomic():
+            self.resolve_categories({row['category'] for row in rows if row.get('category')})
+            skus = [row['sku'] for row in rows]
+            existing = set(self.model.objects.filter(sku__in=skus).values_list('sku', flat=True))
+
+            self.model.objects.bulk_create(
+                [self.build(row) for row in rows],
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=self.update_fields(rows),
+            )
+
+            # Re-read what the index needs, with primary keys for every row
+            index_fields = {field for fields in SEARCH_FIELDS[self.kind].values() for field in fields}
+            fields = {'id', 'sku', *index_fields}
+            if self.kind == 'accessory':
+                fields |= {'accessory_type', 'price'}
+            saved = list(self.model.objects.filter(sku__in=skus).only(*fields))
+            if self.kind == 'accessory':
+                self.link_phones(rows, {obj.sku: obj for obj in saved})
+            else:
+                self.phone_ids.update((obj.sku, obj.pk) for obj in saved)
+            get_backend().index_many(saved)
+
+        self.created += len(rows) - len(existing)
+        self.updated += len(existing)
+
+    def update_fields(self, rows):
+        """Columns every row of the batch carries; the rest keep their stored values"""
+        present = set.intersection(*(set(row) for row in rows)) - {'sku', 'compatible_phones'}
+        fields = [name for name in COLUMNS[self.kind] if name in present]
+        if self.kind == 'phone':
+            fields += [column for field, column in specs.SPEC_COLUMNS.items() if field in present]
+        # auto_now only fills the INSERT values; the API's ETags need it on updates
+        fields.append('updated_at')
+        return fields
+
+    def resolve_categories(self, names):
+        missing = [name for name in names if name not in self.categories]
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+
+    def build(self, row):
+        values = {name: value for name, value in row.items() if name not in ('category', 'compatible_phones')}
+        if 'category' in row:
+            values['category_id'] = self.categories.get(row['category'])
+        obj = self.model(**values)
+        if self.kind == 'phone':
+            specs.normalize_phone(obj)
+        return obj
+
+    def link_phones(self, rows, accessories):
+        """Replace the compatibility rows of the batch's accessories"""
+        # Rows keeping their links still need the new type/price copied
+        kept = [accessories[row['sku']].pk for row in rows if 'compatible_phones' not in row]
+        if kept:
+            sync_denormalized(kept)
+        rows = [row for row in rows if 'compatible_phones' in row]
+        if not rows:
+            return
+        wanted = {sku for row in rows for sku in row['compatible_phones']} - set(self.phone_ids)
+        if wanted:
+            self.phone_ids.update(Phone.objects.filter(sku__in=wanted).values_list('sku', 'id'))
+
+        links = []
+        for row in rows:
+            for sku in row['compatible_phones']:
+                phone_id = self.phone_ids.get(sku)
+                if phone_id is None:
+                    self.unknown_phones.add(sku)
+                    continue
+                accessory = accessories[row['sku']]
+                links.append(Compatibility(accessory_id=accessory.pk, phone_id=phone_id,
+                                           accessory_type=accessory.accessory_type, price=accessory.price))
+        Compatibility.objects.filter(accessory_id__in=[accessories[row['sku']].pk for row in rows]).delete()
+        Compatibility.objects.bulk_create(links, ignore_conflicts=True)
+        self.links += len(links)
+
+
+# ==================== EXPORT ====================
+
+def export_rows(kind, chunk_size=2000):
+    """Yield feed rows for every product of kind, chunk_size rows per query"""
+    model = MODELS[kind]
+    queryset = model.objects.select_related('category').order_by('pk')
+    if kind == 'accessory':
+        queryset = queryset.prefetch_related(
+            Prefetch('compatible_phones', queryset=Phone.objects.only('id', 'sku')))
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        row = {name: getattr(obj, name) for name in COLUMNS[kind]
+               if name not in ('category', 'compatible_phones')}
+        row['category'] = obj.category.name if obj.category else ''
+        if kind == 'accessory':
+            row['compatible_phones'] = sorted(phone.sku for phone in obj.compatible_phones.all() if phone.sku)
+        yield row
+
+
+def write_rows(stream, kind, rows, fmt):
+    """Write feed rows as CSV or JSONL; return the number written"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=COLUMNS[kind])
+        writer.writeheader()
+        for row in rows:
+            if 'compatible_phones' in row:
+                row = dict(row, compatible_phones=CSV_LIST_SEPARATOR.join(row['compatible_phones']))
+            writer.writerow({name: '' if value is None else value for name, value in row.items()})
+            count += 1
+        return count
+    for row in rows:
+        stream.write(json.dumps(row, default=str) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,188 @@
+"""
+Checkout pipeline.
+
+An order is placed in a single transaction with a fixed number of queries
+no matter how many lines the cart has:
+
+1. one conditional UPDATE per product type reserves stock for every line
+   (rows without enough stock are simply not matched); lines of sharded
+   hot SKUs take a couple more statements each, see inventory.py,
+2. one SELECT per product type loads every product in the cart,
+3. one INSERT creates the order, one bulk INSERT creates its items and
+   one more records the stock taken in the stock ledger,
+4. one INSERT queues the order's sales rollup update as a background task
+   (see rollups.queue_order and tasks.py), and with stock holds on one
+   more queues the order's hold expiry,
+5. one DELETE empties the cart, when one is passed in.
+
+If any line cannot be reserved the whole transaction rolls back, queued
+tasks included.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Now
+
+from . import inventory, rollups
+from .models import Phone, Accessories, Order, OrderItem, StockEntry
+from .sequences import next_order_number
+
+
+CART_MODELS = {
+    'phone': Phone,
+    'accessory': Accessories,
+}
+
+CART_ITEM_TYPES = {model: item_type for item_type, model in CART_MODELS.items()}
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    def __init__(self):
+        super().__init__("Your cart is empty.")
+
+
+class UnknownProduct(CheckoutError):
+    def __init__(self, item_type, item_ids):
+        self.item_type = item_type
+        self.item_ids = sorted(item_ids)
+        super().__init__(f"Some items in your cart are no longer available: {item_type} {self.item_ids}")
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(str(product) for product in products)
+        super().__init__(f"Not enough stock for: {names}")
+
+
+def group_lines(lines):
+    """Merge (item_type, item_id, quantity) lines into {item_type: {item_id: quantity}}"""
+    grouped = {}
+    for item_type, item_id, quantity in lines:
+        if item_type not in CART_MODELS:
+            raise UnknownProduct(item_type, [item_id])
+        quantity = int(quantity)
+        if quantity < 1:
+            continue
+        wanted = grouped.setdefault(item_type, {})
+        wanted[int(item_id)] = wanted.get(int(item_id), 0) + quantity
+    return grouped
+
+
+def reserve_stock(model, quantities):
+    """
+    Decrement stock for every {pk: quantity} pair, or raise.
+
+    Returns the stock ledger entries for what was taken, unsaved. Sharded
+    SKUs (see inventory.py) don't match the UPDATE and are taken from
+    their shards instead.
+    """
+    item_type = CART_ITEM_TYPES[model]
+    available = Q()
+    for pk, quantity in quantities.items():
+        available |= Q(pk=pk, stock__gte=quantity)
+    taken = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = model.objects.filter(available, stock_shards=0).update(stock=F('stock') - taken, updated_at=Now())
+    sharded = set()
+    if updated != len(quantities):
+        sharded = set(model.objects.filter(pk__in=list(quantities), stock_shards__gt=0).values_list('pk', flat=True))
+    if updated != len(quantities) - len(sharded):
+        products = model.objects.in_bulk(list(quantities))
+        missing = set(quantities) - set(products)
+        if missing:
+            raise UnknownProduct(item_type, missing)
+        raise InsufficientStock([
+            product for pk, product in sorted(products.items())
+            if pk not in sharded and product.stock < quantities[pk]
+        ])
+
+    entries = [
+        StockEntry(item_type=item_type, product_id=pk, quantity=quantity)
+        for pk, quantity in quantities.items() if pk not in sharded
+    ]
+    short = []
+    for pk in sorted(sharded):
+        pieces = inventory.take_from_shards(item_type, pk, quantities[pk])
+        if pieces is None:
+            short.append(pk)
+            continue
+        entries.extend(
+            StockEntry(item_type=item_type, product_id=pk, shard=shard, quantity=quantity)
+            for shard, quantity in pieces
+        )
+    if short:
+        products = model.objects.in_bulk(short)
+        raise InsufficientStock([products[pk] for pk in short])
+    # Sharded SKUs' display stock is refreshed, and invalidated, by a task
+    if len(sharded) < len(quantities):
+        inventory.stock_changed(item_type, [pk for pk in quantities if pk not in sharded])
+    return entries
+
+
+def place_order(user, lines, shipping_address, discount=Decimal('0.00'), notes='', cart_items=None):
+    """
+    Create an order for lines, reserving stock atomically.
+
+    cart_items, if given, is a queryset of cart lines deleted in the same
+    transaction as the order is created.
+    """
+    grouped = group_lines(lines)
+    if not grouped:
+        raise EmptyCart()
+
+    # Allocated outside the order transaction; see sequences.BlockSequence
+    order_number = next_order_number(user)
+
+    with transaction.atomic():
+        items = []
+        lines = []
+        entries = []
+        total_amount = Decimal('0.00')
+        for item_type, quantities in grouped.items():
+            model = CART_MODELS[item_type]
+            # Write first: the reservation takes the write lock up front
+            # instead of upgrading a read lock, which SQLite cannot do
+            # while another writer is waiting
+            entries.extend(reserve_stock(model, quantities))
+            products = model.objects.only('id', 'name', 'brand', 'price', 'category_id').in_bulk(list(quantities))
+
+            for pk, quantity in quantities.items():
+                unit_price = products[pk].price
+                total_price = unit_price * quantity
+                total_amount += total_price
+                items.append(OrderItem(
+                    item_type=item_type,
+                    phone_id=pk if item_type == 'phone' else None,
+                    accessory_id=pk if item_type == 'accessory' else None,
+                    category_id=products[pk].category_id,
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    total_price=total_price,
+                ))
+                lines.append((item_type, pk, products[pk].category_id, quantity, total_price))
+
+        order = Order.objects.create(
+            customer=user,
+            order_number=order_number,
+            total_amount=total_amount,
+            discount=discount,
+            final_amount=total_amount - discount,
+            shipping_address=shipping_address,
+            notes=notes,
+        )
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        inventory.record_entries(order, entries)
+        rollups.queue_order(order, lines)
+        if cart_items is not None:
+            cart_items.delete()
+    return order
@@ -0,0 +1,127 @@
+"""
+"Accessories for my phone" lookups.
+
+Compatibility rows copy the accessory's type and price, and
+compatibility_lookup_idx orders them by (phone, accessory_type, price,
+accessory). A lookup for one phone, narrowed to some types and a price
+range and sorted by price, is therefore a range read of that index that
+never touches the table; the matching accessories are then fetched by
+primary key. The per-type counts shown next to the results come from the
+same index.
+
+Results are cached per phone on the ``phone:<pk>`` generation, which every
+catalog write that can change them bumps (see signals.py). They leave out
+stock, which checkouts change without touching the phone's generation.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, OuterRef, Subquery
+
+from .caching import get_cache, get_timeout, make_key
+from .models import Accessories, Compatibility
+from .pagination import CursorPaginator
+
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# Accessory columns returned for each result
+RESULT_FIELDS = (
+    'id', 'name', 'brand', 'accessory_type', 'price',
+    'rating', 'review_count', 'image_url', 'category',
+)
+
+
+def _price(params, name):
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise ValueError(f"{name} must be a number")
+    if not value.is_finite():
+        raise ValueError(f"{name} must be a number")
+    return value
+
+
+def parse_limit(params):
+    raw = params.get('limit')
+    if not raw:
+        return DEFAULT_LIMIT
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+
+def compatible_links(phone_id, params):
+    """Compatibility rows of a phone matching ?type= (repeatable), ?min_price= and ?max_price="""
+    links = Compatibility.objects.filter(phone_id=phone_id)
+    types = [value for value in params.getlist('type') if value]
+    if len(types) == 1:
+        links = links.filter(accessory_type=types[0])
+    elif types:
+        links = links.filter(accessory_type__in=types)
+    min_price = _price(params, 'min_price')
+    max_price = _price(params, 'max_price')
+    if min_price is not None:
+        links = links.filter(price__gte=min_price)
+    if max_price is not None:
+        links = links.filter(price__lte=max_price)
+    return links
+
+
+def type_counts(phone_id):
+    """{accessory_type: count} of everything that fits the phone"""
+    return dict(Compatibility.objects
+                .filter(phone_id=phone_id)
+                .order_by('accessory_type')
+                .values_list('accessory_type')
+                .annotate(Count('id')))
+
+
+def lookup(phone_id, params):
+    """
+    One page of accessories fitting a phone, cheapest first.
+
+    Returns {'types', 'results', 'next', 'previous'}; results are dicts of
+    RESULT_FIELDS and next/previous are cursors for ?cursor=. Raises
+    ValueError for bad filters and InvalidCursor for a bad cursor.
+    """
+    limit = parse_limit(params)
+    cursor = params.get('cursor') or ''
+    links = compatible_links(phone_id, params)
+    cache = get_cache()
+    key = make_key('compatibility', ['catalog', f'phone:{phone_id}'],
+                   f"{phone_id}|{sorted(params.getlist('type'))}|{params.get('min_price', '')}|"
+                   f"{params.get('max_price', '')}|{limit}|{cursor}")
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    paginator = CursorPaginator(links.values('price', 'accessory_id'), limit, ordering=('price', 'accessory_id'))
+    page = paginator.page(cursor or None)
+    ids = [row['accessory_id'] for row in page]
+    rows = {row['id']: row for row in Accessories.objects.filter(pk__in=ids).values(*RESULT_FIELDS)} if ids else {}
+    result = {
+        'types': type_counts(phone_id),
+        # An accessory deleted since the page was read just drops out
+        'results': [rows[pk] for pk in ids if pk in rows],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+    cache.set(key, result, get_timeout())
+    return result
+
+
+def sync_denormalized(accessory_ids=None):
+    """Refresh the copied accessory_type/price of the given accessories' rows (all when None)"""
+    links = Compatibility.objects.all()
+    if accessory_ids is not None:
+        links = links.filter(accessory_id__in=list(accessory_ids))
+    accessory = Accessories.objects.filter(pk=OuterRef('accessory_id'))
+    return links.update(
+        accessory_type=Subquery(accessory.values('accessory_type')[:1]),
+        price=Subquery(accessory.values('price')[:1]),
+    )
@@ -0,0 +1,172 @@
+"""
+Facet counts for the catalog lists.
+
+For the current filters, every facet value gets the number of results the
+list would show if that value were picked. All facets are counted from a
+single grouped query: the rows are grouped on every facet column at once
+(GROUP BY brand, condition, category, ..., price bucket) and the per-facet
+totals are summed in Python from the combinations.
+
+Facets with a GET filter (brand, category, condition, type) are counted
+disjunctively: each one ignores its own selection, so picking "Samsung"
+still shows how many phones the other brands have. Those filters are
+therefore applied in Python instead of SQL; search and the price range are
+applied in SQL as usual.
+
+Results are cached per filter signature in the catalog cache, keyed on the
+same generations as the list pages.
+"""
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .caching import amake_key, get_cache, get_timeout, make_key, normalize_filters
+from .filters import filter_accessories, filter_phones
+from .models import Phone, Accessories
+
+
+# (lower, upper) bounds; the last bucket is open-ended
+PRICE_BUCKETS = {
+    'phone': [(0, 200), (200, 400), (400, 700), (700, 1000), (1000, None)],
+    'accessory': [(0, 25), (25, 50), (50, 100), (100, None)],
+}
+
+# facet name -> (column, GET parameter that filters on it or None, sort by)
+FACETS = {
+    'phone': {
+        'brand': ('brand', 'brand', 'count'),
+        'condition': ('condition', 'condition', 'count'),
+        'category': ('category_id', 'category', 'count'),
+        'ram': ('ram_gb', None, 'value'),
+        'storage': ('storage_gb', None, 'value'),
+        'price': ('price_bucket', None, 'value'),
+    },
+    'accessory': {
+        'brand': ('brand', 'brand', 'count'),
+        'accessory_type': ('accessory_type', 'type', 'count'),
+        'category': ('category_id', 'category', 'count'),
+        'price': ('price_bucket', None, 'value'),
+    },
+}
+
+CATALOG = {
+    'phone': (Phone, filter_phones),
+    'accessory': (Accessories, filter_accessories),
+}
+
+
+def price_bucket_label(lower, upper):
+    if upper is None:
+        return f'${lower}+'
+    if lower == 0:
+        return f'Under ${upper}'
+    return f'${lower} - ${upper}'
+
+
+def format_size(gigabytes):
+    if gigabytes >= 1024 and gigabytes % 1024 == 0:
+        return f'{gigabytes // 1024} TB'
+    return f'{gigabytes.normalize():f} GB'
+
+
+def price_bucket(kind):
+    buckets = PRICE_BUCKETS[kind]
+    return Case(
+        *[When(price__lt=upper, then=Value(index)) for index, (_, upper) in enumerate(buckets[:-1])],
+        default=Value(len(buckets) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def facet_queryset(kind, params):
+    """The grouped query: one row per combination of facet values"""
+    model, filter_catalog = CATALOG[kind]
+    facets = FACETS[kind]
+    params = params.copy()
+    for _, param, _ in facets.values():
+        if param:
+            params.pop(param, None)
+    columns = [column for column, _, _ in facets.values() if column != 'price_bucket']
+    return (filter_catalog(model.objects.all(), params)
+            .order_by()
+            .values(*columns, 'category__name', price_bucket=price_bucket(kind))
+            .annotate(count=Count('id')))
+
+
+def count_facets(kind, rows, params):
+    """Sum the grouped rows into {facet: [{value, label, count, selected}]}"""
+    facets = FACETS[kind]
+    selected = {
+        name: params.get(param)
+        for name, (_, param, _) in facets.items()
+        if param and params.get(param)
+    }
+    counts = {name: defaultdict(int) for name in facets}
+    category_names = {}
+    for row in rows:
+        values = {name: row[column] for name, (column, _, _) in facets.items()}
+        category_names[row['category_id']] = row['category__name']
+        mismatched = [name for name, value in selected.items() if str(values[name]) != value]
+        for name, value in values.items():
+            # A row counts for a facet when it matches every other selection
+            if value in (None, '') or any(other != name for other in mismatched):
+                continue
+            counts[name][value] += row['count']
+
+    result = {}
+    for name, (_, param, order) in facets.items():
+        entries = []
+        for value, count in counts[name].items():
+            entry = {'value': value, 'label': value, 'count': count,
+                     'selected': selected.get(name) == str(value)}
+            if name == 'category':
+                entry['label'] = category_names[value]
+            elif name == 'condition':
+                entry['label'] = dict(Phone.CONDITION_CHOICES).get(value, value)
+            elif name in ('ram', 'storage'):
+                entry['label'] = format_size(value)
+            elif name == 'price':
+                lower, upper = PRICE_BUCKETS[kind][value]
+                entry.update(label=price_bucket_label(lower, upper), min_price=lower, max_price=upper)
+            entries.append(entry)
+        if order == 'count':
+            entries.sort(key=lambda entry: (-entry['count'], str(entry['label'])))
+        else:
+            entries.sort(key=lambda entry: entry['value'])
+        result[name] = entries
+    return result
+
+
+def _cache_key_parts(kind, params):
+    return f'facets:{kind}', ['catalog', f'{kind}:list'], normalize_filters(params, exclude=('page', 'pagination', 'cursor'))
+
+
+def get_facets(kind, params):
+    """Facet counts for the list of kind ('phone' or 'accessory') filtered by params"""
+    cache = get_cache()
+    prefix, generations, extra = _cache_key_parts(kind, params)
+    key = make_key(prefix, generations, extra)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_facets(kind, facet_queryset(kind, params), params)
+        cache.set(key, facets, get_timeout())
+    return facets
+
+
+async def aget_facets(kind, params):
+    """Async get_facets() for the ASGI views"""
+    cache = get_cache()
+    prefix, generations, extra = _cache_key_parts(kind, params)
+    key = await amake_key(prefix, generations, extra)
+    facets = await cache.aget(key)
+    if facets is None:
+        if params.get('search'):
+            # Searching queries the index as the queryset is built
+            queryset = await sync_to_async(facet_queryset)(kind, params)
+        else:
+            queryset = facet_queryset(kind, params)
+        rows = [row async for row in queryset]
+        facets = count_facets(kind, rows, params)
+        await cache.aset(key, facets, get_timeout())
+    return facets
@@ -0,0 +1,109 @@
+"""
+Catalog filters shared by the HTML list views and the JSON API.
+"""
+from asgiref.sync import sync_to_async
+
+from .search import search_queryset
+
+
+# GET parameter prefix -> normalized spec column, filtered as <prefix>_min/<prefix>_max
+PHONE_SPEC_RANGES = {
+    'ram': 'ram_gb',
+    'storage': 'storage_gb',
+    'display': 'display_inches',
+    'camera': 'main_camera_mp',
+}
+
+
+def filter_phones(queryset, params):
+    """Apply the phone list GET filters to queryset"""
+    # Filter by category
+    category = params.get('category')
+    if category:
+        queryset = queryset.filter(category__id=category)
+
+    # Filter by brand
+    brand = params.get('brand')
+    if brand:
+        queryset = queryset.filter(brand=brand)
+
+    # Filter by price range
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+
+    # Filter by condition
+    condition = params.get('condition')
+    if condition:
+        queryset = queryset.filter(condition=condition)
+
+    # Filter by spec ranges (indexed columns, see specs.py)
+    for prefix, column in PHONE_SPEC_RANGES.items():
+        low = params.get(f'{prefix}_min')
+        high = params.get(f'{prefix}_max')
+        if low:
+            queryset = queryset.filter(**{f'{column}__gte': low})
+        if high:
+            queryset = queryset.filter(**{f'{column}__lte': high})
+
+    # Search last: the result cap applies to the filtered rows
+    search_query = params.get('search')
+    if search_query:
+        queryset = search_queryset(queryset, search_query)
+
+    return queryset
+
+
+def filter_accessories(queryset, params):
+    """Apply the accessory list GET filters to queryset"""
+    # Filter by category
+    category = params.get('category')
+    if category:
+        queryset = queryset.filter(category__id=category)
+
+    # Filter by brand
+    brand = params.get('brand')
+    if brand:
+        queryset = queryset.filter(brand=brand)
+
+    # Filter by accessory type
+    accessory_type = params.get('type')
+    if accessory_type:
+        queryset = queryset.filter(accessory_type=accessory_type)
+
+    # Filter by price range
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+
+    # Search last: the result cap applies to the filtered rows
+    search_query = params.get('search')
+    if search_query:
+        queryset = search_queryset(queryset, search_query)
+
+    return queryset
+
+
+# ==================== ASYNC ====================
+
+# Filtering is lazy, but a search asks its backend for the matching ids
+# right away: the async views hand filters with a search to a thread.
+
+async def afilter_phones(queryset, params):
+    """Async filter_phones()"""
+    if params.get('search'):
+        return await sync_to_async(filter_phones)(queryset, params)
+    return filter_phones(queryset, params)
+
+
+async def afilter_accessories(queryset, params):
+    """Async filter_accessories()"""
+    if params.get('search'):
+        return await sync_to_async(filter_accessories)(queryset, params)
+    return filter_accessories(queryset, params)
@@ -0,0 +1,360 @@
+"""
+Per-view request instrumentation.
+
+RequestMetricsMiddleware records, for every request, the number of SQL
+queries, the time spent in the database, the time spent rendering templates
+and the total latency, and folds them into aggregates keyed by URL name
+(``phone_list``, ``checkout``, ``admin:index``...). Requests slower than
+PRIME_SLOW_REQUEST_MS are also kept in a bounded slow-request log together
+with the SQL they ran.
+
+Measurements flow through a context variable, so they follow a request
+into the sync-to-async bridge of async views:
+
+* queries are timed by a connection execute wrapper installed on every
+  database connection when it is opened (see signals.py),
+* template rendering is timed by InstrumentedDjangoTemplates, a drop-in
+  replacement for the Django template backend (only the outermost render
+  counts, so includes are not double-counted).
+
+Aggregates live in process memory: each worker reports its own, so scrape
+every worker (or sum them) behind a multi-process server. They are exposed
+to staff (or to a scraper presenting PRIME_METRICS_TOKEN) as JSON, in the
+Prometheus text format and as the slow-request log.
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .benchmarks import percentile
+
+
+logger = logging.getLogger('prime_accessories.slow_requests')
+
+DEFAULT_SLOW_REQUEST_MS = 500
+DEFAULT_SLOW_LOG_SIZE = 50
+# Recent latencies kept per view for the percentiles
+LATENCY_WINDOW = 1000
+# Queries kept per request for the slow-request log
+MAX_CAPTURED_SQL = 200
+# Prometheus histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = '<unresolved>'
+
+_current = contextvars.ContextVar('prime_request_recorder', default=None)
+
+
+def metrics_enabled():
+    return getattr(settings, 'PRIME_METRICS_ENABLED', True)
+
+
+def slow_request_seconds():
+    return getattr(settings, 'PRIME_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS) / 1000
+
+
+class RequestRecorder:
+    """Measurements of the request currently being served"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_depth = 0
+        self.sql = []
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        if len(self.sql) < MAX_CAPTURED_SQL:
+            self.sql.append((sql, duration))
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper; a no-op outside an instrumented request"""
+    recorder = _current.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_hook(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# ==================== TEMPLATES ====================
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        recorder = _current.get()
+        if recorder is None:
+            return super().render(context, request)
+        recorder.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            recorder.render_depth -= 1
+            if recorder.render_depth == 0:
+                recorder.render_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates report their render time to the current request"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+# ==================== AGGREGATES ====================
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.recent = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, status, queries, db_time, render_time, total_time):
+        self.requests += 1
+        if status >= 500:
+            self.errors += 1
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.db_time += db_time
+        self.render_time += render_time
+        self.total_time += total_time
+        self.max_time = max(self.max_time, total_time)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if total_time <= bound:
+                self.buckets[index] += 1
+                break
+        self.recent.append(total_time)
+
+    def as_dict(self):
+        ordered = sorted(self.recent)
+        count = self.requests or 1
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_queries': round(self.queries / count, 2),
+            'max_queries': self.max_queries,
+            'avg_db_ms': round(self.db_time * 1000 / count, 3),
+            'avg_render_ms': round(self.render_time * 1000 / count, 3),
+            'avg_ms': round(self.total_time * 1000 / count, 3),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+            'max_ms': round(self.max_time * 1000, 3),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe per-view aggregates and the slow-request log of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.slow = deque(maxlen=getattr(settings, 'PRIME_SLOW_REQUEST_LOG_SIZE', DEFAULT_SLOW_LOG_SIZE))
+            self.since = timezone.now()
+
+    def record(self, request, response, recorder):
+        total_time = time.perf_counter() - recorder.started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else UNRESOLVED
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.add(response.status_code, recorder.queries, recorder.db_time, recorder.render_time, total_time)
+        if total_time >= slow_request_seconds():
+            entry = {
+                'at': timezone.now().isoformat(),
+                'view': view,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(total_time * 1000, 3),
+                'db_ms': round(recorder.db_time * 1000, 3),
+                'render_ms': round(recorder.render_time * 1000, 3),
+                'queries': recorder.queries,
+                'sql': [{'sql': sql, 'ms': round(duration * 1000, 3)} for sql, duration in recorder.sql],
+            }
+            with self.lock:
+                self.slow.append(entry)
+            logger.warning("Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in the database",
+                           request.method, entry['path'], view, entry['total_ms'], recorder.queries, entry['db_ms'])
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'since': self.since.isoformat(),
+                'views': {view: stats.as_dict() for view, stats in sorted(self.views.items())},
+            }
+
+    def slow_requests(self):
+        with self.lock:
+            return list(reversed(self.slow))
+
+    def prometheus(self):
+        """The aggregates in the Prometheus text exposition format"""
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = []
+
+            def metric(name, kind, help_text, samples):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for suffix, labels, value in samples:
+                    label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+                    lines.append(f'{name}{suffix}{{{label_text}}} {_number(value)}')
+
+            metric('prime_http_requests_total', 'counter', 'Requests served, by URL name.',
+                   [('', [('view', view)], stats.requests) for view, stats in views])
+            metric('prime_http_request_errors_total', 'counter', 'Responses with a 5xx status, by URL name.',
+                   [('', [('view', view)], stats.errors) for view, stats in views])
+            histogram = []
+            for view, stats in views:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    histogram.append(('_bucket', [('view', view), ('le', _number(bound))], cumulative))
+                histogram.append(('_bucket', [('view', view), ('le', '+Inf')], stats.requests))
+                histogram.append(('_sum', [('view', view)], stats.total_time))
+                histogram.append(('_count', [('view', view)], stats.requests))
+            metric('prime_http_request_duration_seconds', 'histogram', 'Request latency, by URL name.', histogram)
+            metric('prime_db_queries_total', 'counter', 'SQL queries issued, by URL name.',
+                   [('', [('view', view)], stats.queries) for view, stats in views])
+            metric('prime_db_query_seconds_total', 'counter', 'Time spent in SQL queries, by URL name.',
+                   [('', [('view', view)], stats.db_time) for view, stats in views])
+            metric('prime_template_render_seconds_total', 'counter', 'Time spent rendering templates, by URL name.',
+                   [('', [('view', view)], stats.render_time) for view, stats in views])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else '+Inf'
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+
+# ==================== MIDDLEWARE ====================
+
+class RequestMetricsMiddleware:
+    """
+    Record query count, DB time, render time and latency per URL name.
+
+    Put it first in MIDDLEWARE so the latency covers the other middleware.
+    Streaming responses are measured up to the point the body starts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not metrics_enabled():
+            return self.get_response(request)
+        recorder = RequestRecorder()
+        token = _current.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.record(request, response, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+        recorder = RequestRecorder()
+        token = _current.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        registry.record(request, response, recorder)
+        return response
+
+
+# ==================== ENDPOINTS ====================
+
+def has_metrics_access(request):
+    """Staff users, or a scraper sending ``Authorization: Bearer <PRIME_METRICS_TOKEN>``"""
+    token = getattr(settings, 'PRIME_METRICS_TOKEN', None)
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and constant_time_compare(header[len('Bearer '):], token):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics_view(view):
+    def wrapper(request):
+        if not has_metrics_access(request):
+            return JsonResponse({'error': "Staff only"}, status=403)
+        return view(request)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+@metrics_view
+def metrics_json(request):
+    """Per-view aggregates of this process"""
+    return JsonResponse(registry.snapshot())
+
+
+@metrics_view
+def metrics_prometheus(request):
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@metrics_view
+def slow_requests(request):
+    """The slow-request log, newest first, with the SQL each request ran"""
+    return JsonResponse({
+        'threshold_ms': slow_request_seconds() * 1000,
+        'requests': registry.slow_requests(),
+    })
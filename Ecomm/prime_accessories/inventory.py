@@ -0,0 +1,289 @@
+"""
+Inventory.
+
+Phone.stock and Accessories.stock hold what is left to sell. Checkout
+takes from them with one conditional UPDATE (see checkout.reserve_stock),
+so a SKU can't be oversold, and records what it took in the stock ledger:
+one StockEntry per line, tied to the order.
+
+Entries are ``sold`` straight away unless PRIME_STOCK_HOLD_SECONDS is set.
+Then they are ``held`` until the order's payment completes, and an order
+still unpaid when the hold expires is cancelled by the
+``inventory.expire_order`` task queued with it. Cancelling an order, by
+hand or on expiry, releases its entries and puts their stock back. An
+order restored from ``cancelled`` does not take its stock again.
+
+Hot SKUs
+--------
+Every checkout of one SKU updates the same row, so concurrent buyers of a
+hot item wait on each other's row lock. shard_stock() splits that stock
+over StockShard rows; checkouts then take from a random shard with enough
+left, and only contend when they pick the same one. The product's stock
+column is kept as a display total, refreshed by an ``inventory.refresh_stock``
+task after each sale, and merge_shards() folds the shards back into it.
+SQLite locks the whole database for every write, so shards only pay off on
+PostgreSQL; ``manage.py bench_stock_contention`` measures both layouts.
+"""
+import datetime
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+
+from . import caching
+from .models import Phone, Accessories, Order, StockEntry, StockShard
+from .tasks import enqueue, task
+
+
+DEFAULT_SHARDS = 8
+# Conditional UPDATEs tried on single shards before a line is split across shards
+SHARD_ATTEMPTS = 3
+
+STOCK_MODELS = {
+    'phone': Phone,
+    'accessory': Accessories,
+}
+
+
+def hold_seconds():
+    return getattr(settings, 'PRIME_STOCK_HOLD_SECONDS', None)
+
+
+def stock_changed(item_type, product_ids, listed=None):
+    """
+    Invalidate the cached pages showing these SKUs' stock once the change
+    commits. Stock moves with queryset updates, which send no post_save.
+
+    Bumping the list pages on every sale would empty the catalog cache, so
+    they are only bumped when a SKU goes in or out of stock: when listed is
+    true, or, with listed None, when one of the SKUs is sold out after the
+    commit.
+    """
+    model = STOCK_MODELS[item_type]
+    product_ids = list(product_ids)
+
+    def bump():
+        names = [f'{item_type}:{pk}' for pk in product_ids]
+        if listed or (listed is None and model.objects.filter(pk__in=product_ids, stock__lte=0).exists()):
+            names.append(f'{item_type}:list')
+        caching.bump(*names)
+
+    transaction.on_commit(bump)
+
+
+# ==================== SHARDED STOCK ====================
+
+def take_from_shards(item_type, product_id, quantity):
+    """
+    Take quantity from a sharded SKU; returns [(shard, taken)], or None
+    when the shards don't hold enough between them.
+
+    Runs in the caller's transaction, which must roll back on None:
+    a line split across shards may have taken part of its quantity.
+    """
+    shards = StockShard.objects.filter(item_type=item_type, product_id=product_id)
+    for _ in range(SHARD_ATTEMPTS):
+        candidates = list(shards.filter(available__gte=quantity).values_list('shard', flat=True))
+        if not candidates:
+            break
+        shard = random.choice(candidates)
+        if shards.filter(shard=shard, available__gte=quantity).update(available=F('available') - quantity):
+            return [(shard, quantity)]
+
+    # No single shard has enough left: take what each one has
+    taken, remaining = [], quantity
+    rows = list(shards.filter(available__gt=0).values_list('shard', 'available'))
+    random.shuffle(rows)
+    for shard, available in rows:
+        take = min(available, remaining)
+        if shards.filter(shard=shard, available__gte=take).update(available=F('available') - take):
+            taken.append((shard, take))
+            remaining -= take
+            if not remaining:
+                return taken
+    return None
+
+
+def shard_stock(item_type, product_id, shards=DEFAULT_SHARDS):
+    """Split a SKU's stock evenly over shards StockShard rows (re-sharding if it already is)"""
+    if shards < 1:
+        raise ValueError("A sharded SKU needs at least one shard")
+    model = STOCK_MODELS[item_type]
+    with transaction.atomic():
+        merge_shards(item_type, product_id)
+        product = model.objects.select_for_update().only('stock').get(pk=product_id)
+        share, extra = divmod(product.stock, shards)
+        StockShard.objects.bulk_create([
+            StockShard(item_type=item_type, product_id=product_id, shard=index,
+                       available=share + (1 if index < extra else 0))
+            for index in range(shards)
+        ])
+        model.objects.filter(pk=product_id).update(stock_shards=shards, updated_at=Now())
+
+
+def merge_shards(item_type, product_id):
+    """Move a sharded SKU's stock back into its stock column"""
+    model = STOCK_MODELS[item_type]
+    with transaction.atomic():
+        rows = StockShard.objects.select_for_update().filter(item_type=item_type, product_id=product_id)
+        available = sum(row.available for row in rows)
+        if not rows:
+            return
+        rows.delete()
+        model.objects.filter(pk=product_id).update(stock=available, stock_shards=0, updated_at=Now())
+        stock_changed(item_type, [product_id], listed=True)
+
+
+def shard_totals(item_type):
+    """Subquery of a sharded product's stock summed over its shards"""
+    return Subquery(
+        StockShard.objects.filter(item_type=item_type, product_id=OuterRef('pk'))
+        .values('product_id').annotate(total=Sum('available')).values('total'),
+        output_field=IntegerField(),
+    )
+
+
+def refresh_display_stock(item_type, product_ids):
+    products = STOCK_MODELS[item_type].objects.filter(pk__in=product_ids, stock_shards__gt=0)
+    # Coming back from sold out, or (checked after the commit) selling out
+    restocked = products.filter(stock__lte=0).exists()
+    products.update(stock=Coalesce(shard_totals(item_type), 0))
+    stock_changed(item_type, product_ids, listed=True if restocked else None)
+
+
+@task('inventory.refresh_stock')
+def refresh_stock(item_type, product_ids):
+    """Task handler: copy sharded SKUs' shard totals into their stock column"""
+    refresh_display_stock(item_type, product_ids)
+
+
+# ==================== LEDGER ====================
+
+def record_entries(order, entries):
+    """
+    Save the entries checkout took for order, in its transaction.
+
+    One bulk INSERT, plus one task when stock came from shards and one
+    more when the entries are held.
+    """
+    seconds = hold_seconds()
+    for entry in entries:
+        entry.order = order
+        if seconds:
+            entry.status = 'held'
+            entry.expires_at = order.created_at + datetime.timedelta(seconds=seconds)
+        else:
+            entry.status = 'sold'
+    StockEntry.objects.bulk_create(entries)
+
+    sharded = {}
+    for entry in entries:
+        if entry.shard is not None:
+            sharded.setdefault(entry.item_type, set()).add(entry.product_id)
+    for item_type, product_ids in sharded.items():
+        enqueue('inventory.refresh_stock', {'item_type': item_type, 'product_ids': sorted(product_ids)})
+    if seconds:
+        enqueue('inventory.expire_order', {'order_id': order.pk}, delay=seconds)
+
+
+def confirm_order(order):
+    """The order is paid for: its held entries are sold"""
+    return StockEntry.objects.filter(order=order, status='held').update(
+        status='sold', expires_at=None, updated_at=Now())
+
+
+def release_order(order):
+    """Put back the stock of an order's live entries; returns the units released"""
+    with transaction.atomic():
+        entries = list(StockEntry.objects.select_for_update().filter(order=order, status__in=('held', 'sold')))
+        if not entries:
+            return 0
+        StockEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            status='released', expires_at=None, updated_at=Now())
+        restock(entries)
+    return sum(entry.quantity for entry in entries)
+
+
+def restock(entries):
+    """Add the entries' quantities back to their SKUs, sharded or not since they were taken"""
+    by_type = {}
+    for entry in entries:
+        by_type.setdefault(entry.item_type, []).append(entry)
+
+    for item_type, entries in by_type.items():
+        model = STOCK_MODELS[item_type]
+        layout = dict(model.objects.filter(pk__in={entry.product_id for entry in entries})
+                      .values_list('pk', 'stock_shards'))
+        rows, shards = {}, {}
+        for entry in entries:
+            count = layout.get(entry.product_id)
+            if count is None:
+                continue  # the product is gone
+            if count:
+                # Back to the shard it came from, if the SKU still has that many
+                key = (entry.product_id, (entry.shard or 0) % count)
+                shards[key] = shards.get(key, 0) + entry.quantity
+            else:
+                rows[entry.product_id] = rows.get(entry.product_id, 0) + entry.quantity
+
+        if rows:
+            returned = Case(
+                *[When(pk=pk, then=Value(quantity)) for pk, quantity in rows.items()],
+                output_field=IntegerField(),
+            )
+            restocked = model.objects.filter(pk__in=list(rows), stock__lte=0).exists()
+            model.objects.filter(pk__in=list(rows)).update(stock=F('stock') + returned, updated_at=Now())
+            stock_changed(item_type, rows, listed=restocked)
+        for (product_id, shard), quantity in shards.items():
+            StockShard.objects.filter(item_type=item_type, product_id=product_id, shard=shard).update(
+                available=F('available') + quantity)
+        if shards:
+            refresh_display_stock(item_type, {product_id for product_id, _ in shards})
+
+
+@task('inventory.expire_order')
+def expire_order(order_id):
+    """Task handler: cancel the order if its hold ran out before payment"""
+    order = Order.objects.filter(pk=order_id).exclude(status='cancelled').exclude(payment_status='completed').first()
+    if order is None or not order.stock_entries.filter(status='held', expires_at__lte=Now()).exists():
+        return
+    order.status = 'cancelled'
+    # The Order signal handlers release the stock and update the sales rollups
+    order.save(update_fields=['status', 'updated_at'])
+
+
+# ==================== STOCK LEVELS ====================
+
+def ledger_totals(item_type, status):
+    return Coalesce(Subquery(
+        StockEntry.objects.filter(item_type=item_type, product_id=OuterRef('pk'), status=status)
+        .values('product_id').annotate(total=Sum('quantity')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def stock_levels(search='', limit=50):
+    """
+    Live available/reserved/sold counts per SKU, best sellers first.
+
+    available reads the shards of sharded SKUs rather than their display
+    total; reserved is stock held for unpaid orders.
+    """
+    rows = []
+    for item_type, model in STOCK_MODELS.items():
+        products = model.objects.all()
+        if search:
+            products = products.filter(Q(name__icontains=search) | Q(sku__iexact=search))
+        products = products.annotate(
+            available=Case(
+                When(stock_shards__gt=0, then=Coalesce(shard_totals(item_type), 0)),
+                default=F('stock'),
+            ),
+            reserved=ledger_totals(item_type, 'held'),
+            sold=ledger_totals(item_type, 'sold'),
+        ).order_by('-sold', 'pk').values('pk', 'sku', 'name', 'stock_shards', 'available', 'reserved', 'sold')
+        rows.extend({'item_type': item_type, **row} for row in products[:limit])
+    rows.sort(key=lambda row: (-row['sold'], row['item_type'], row['pk']))
+    return rows[:limit]
@@ -0,0 +1,98 @@
+import json
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from prime_accessories.benchmarks import format_table, measure
+from prime_accessories.checkout import place_order
+from prime_accessories.models import Phone, Accessories, Category, Order, OrderItem
+
+
+def legacy_checkout(user, lines, prices):
+    """The pre-pipeline checkout: COUNT(*) order number and one INSERT per line"""
+    total_amount = sum(
+        (prices[(item_type, item_id)] * quantity for item_type, item_id, quantity in lines),
+        Decimal('0.00'),
+    )
+    order = Order.objects.create(
+        customer=user,
+        # The suffix only keeps repeated runs from tripping the unique constraint
+        order_number=f"ORD-{user.id}-{Order.objects.count() + 1}-{uuid.uuid4().hex[:8]}",
+        total_amount=total_amount,
+        discount=Decimal('0.00'),
+        final_amount=total_amount,
+        shipping_address='Benchmark',
+    )
+    for item_type, item_id, quantity in lines:
+        unit_price = prices[(item_type, item_id)]
+        OrderItem.objects.create(
+            order=order,
+            item_type=item_type,
+            phone_id=item_id if item_type == 'phone' else None,
+            accessory_id=item_id if item_type == 'accessory' else None,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_price=unit_price * quantity,
+        )
+    return order
+
+
+class Command(BaseCommand):
+    help = "Compare the legacy per-line checkout with the bulk checkout pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100],
+                            help="Cart sizes to benchmark")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        sizes = options['lines']
+        category = Category.objects.create(name=f'Benchmark {uuid.uuid4().hex[:8]}')
+        user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:8]}')
+        try:
+            results = self.run(user, category, sizes, options['repeat'])
+        finally:
+            Order.objects.filter(customer=user).delete()
+            Phone.objects.filter(category=category).delete()
+            Accessories.objects.filter(category=category).delete()
+            category.delete()
+            user.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(results, [
+                'implementation', 'lines', 'queries', 'min_ms', 'median_ms', 'p95_ms', 'max_ms',
+            ]))
+
+    def run(self, user, category, sizes, repeat):
+        count = max(sizes)
+        phones = Phone.objects.bulk_create([
+            Phone(name=f'Bench phone {i}', brand='Bench', model=f'B{i}', description='Benchmark',
+                  price=Decimal('100.00'), stock=1_000_000, category=category)
+            for i in range((count + 1) // 2)
+        ])
+        accessories = Accessories.objects.bulk_create([
+            Accessories(name=f'Bench accessory {i}', description='Benchmark', accessory_type='Case',
+                        price=Decimal('10.00'), stock=1_000_000, category=category)
+            for i in range(count // 2)
+        ])
+        if not phones[0].pk:
+            phones = list(Phone.objects.filter(category=category))
+            accessories = list(Accessories.objects.filter(category=category))
+        catalog = [('phone', p) for p in phones] + [('accessory', a) for a in accessories]
+        prices = {(item_type, product.pk): product.price for item_type, product in catalog}
+
+        results = []
+        for size in sizes:
+            lines = [(item_type, product.pk, 1) for item_type, product in catalog[:size]]
+            legacy = measure(lambda: legacy_checkout(user, lines, prices), repeat=repeat)
+            pipeline = measure(
+                lambda: place_order(user, lines, shipping_address='Benchmark'), repeat=repeat,
+            )
+            results.append({'implementation': 'legacy', 'lines': size, **legacy})
+            results.append({'implementation': 'pipeline', 'lines': size, **pipeline})
+        return results
@@ -0,0 +1,178 @@
+import json
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from Ecomm.db_profiles import PROFILES, sqlite_database
+from prime_accessories.benchmarks import format_table, summarize
+
+
+PRODUCTS = 50
+LINES_PER_ORDER = 3
+
+SCHEMA = [
+    'CREATE TABLE bench_product (id INTEGER PRIMARY KEY, price REAL NOT NULL, stock INTEGER NOT NULL)',
+    'CREATE TABLE bench_order (id INTEGER PRIMARY KEY AUTOINCREMENT, total REAL NOT NULL, created REAL NOT NULL)',
+    'CREATE TABLE bench_item (id INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER NOT NULL, '
+    'product_id INTEGER NOT NULL, quantity INTEGER NOT NULL)',
+]
+
+
+def add_database(alias, config):
+    """Register an extra connection alias for this process"""
+    connections.settings[alias] = connections.configure_settings({DEFAULT_DB_ALIAS: config})[DEFAULT_DB_ALIAS]
+
+
+def remove_database(alias):
+    connections[alias].close()
+    del connections.settings[alias]
+
+
+def place_order(alias, rng):
+    """A checkout-shaped write: read prices, take stock, insert an order and its lines"""
+    product_ids = rng.sample(range(1, PRODUCTS + 1), LINES_PER_ORDER)
+    placeholders = ','.join('%s' for _ in product_ids)
+    with transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'SELECT SUM(price) FROM bench_product WHERE id IN ({placeholders})', product_ids)
+            total = cursor.fetchone()[0]
+            cursor.execute(f'UPDATE bench_product SET stock = stock - 1 WHERE id IN ({placeholders})', product_ids)
+            cursor.execute('INSERT INTO bench_order (total, created) VALUES (%s, %s)', [total, time.time()])
+            order_id = cursor.lastrowid
+            cursor.executemany('INSERT INTO bench_item (order_id, product_id, quantity) VALUES (%s, %s, 1)',
+                               [(order_id, product_id) for product_id in product_ids])
+
+
+def read_report(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT COUNT(*), SUM(total) FROM bench_order')
+        cursor.fetchone()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent checkout-shaped writers (plus readers) against a scratch SQLite "
+        "database under each database profile of Ecomm/db_profiles.py: the development "
+        "profile (rollback journal, new connection per request) and the production one "
+        "(WAL, synchronous=NORMAL, busy_timeout, mmap, BEGIN IMMEDIATE, persistent connections)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Concurrent writer threads")
+        parser.add_argument('--transactions', type=int, default=200, help="Orders placed per writer")
+        parser.add_argument('--readers', type=int, default=2,
+                            help="Threads reading a report while the writers run")
+        parser.add_argument('--profile', action='append', choices=PROFILES, default=[],
+                            help="Only benchmark this profile (repeatable)")
+        parser.add_argument('--directory', help="Where to create the scratch databases (default: a temp dir)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        if options['writers'] < 1 or options['transactions'] < 1:
+            raise CommandError("--writers and --transactions must be at least 1")
+        profiles = options['profile'] or list(PROFILES)
+        with tempfile.TemporaryDirectory(dir=options['directory']) as directory:
+            results = [self.run_profile(profile, Path(directory), options) for profile in profiles]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(results, [
+                'profile', 'writers', 'commits', 'errors', 'tx_per_s', 'reads_per_s',
+                'median_ms', 'p95_ms', 'p99_ms', 'max_ms',
+            ]))
+
+    def run_profile(self, profile, directory, options):
+        alias = f'bench_{profile}'
+        # Only the environment's pragma overrides apply; the profile is picked here
+        config = sqlite_database({}, directory, profile)
+        config['NAME'] = directory / f'{profile}.sqlite3'
+        config['CONN_MAX_AGE'] = None if profile == 'production' else 0
+        add_database(alias, config)
+        try:
+            self.create_schema(alias)
+            return self.run_load(profile, alias, options)
+        finally:
+            remove_database(alias)
+
+    def create_schema(self, alias):
+        with connections[alias].cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+            cursor.executemany('INSERT INTO bench_product (id, price, stock) VALUES (%s, %s, %s)',
+                               [(pk, 10.0 + pk, 10 ** 9) for pk in range(1, PRODUCTS + 1)])
+        connections[alias].close()
+
+    def run_load(self, profile, alias, options):
+        timings = []
+        errors = []
+        reads = []
+        lock = threading.Lock()
+        writers_done = threading.Event()
+
+        def write(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            mine, failed = [], 0
+            try:
+                for _ in range(options['transactions']):
+                    started = time.perf_counter()
+                    try:
+                        place_order(alias, rng)
+                        mine.append(time.perf_counter() - started)
+                    except OperationalError:
+                        # "database is locked": the request would have failed
+                        failed += 1
+                    # What request_finished does: close unless CONN_MAX_AGE keeps it
+                    connections[alias].close_if_unusable_or_obsolete()
+            finally:
+                connections[alias].close()
+            with lock:
+                timings.extend(mine)
+                errors.append(failed)
+
+        def read():
+            count = 0
+            try:
+                while not writers_done.is_set():
+                    try:
+                        read_report(alias)
+                        count += 1
+                    except OperationalError:
+                        pass
+                    connections[alias].close_if_unusable_or_obsolete()
+            finally:
+                connections[alias].close()
+            with lock:
+                reads.append(count)
+
+        readers = [threading.Thread(target=read) for _ in range(options['readers'])]
+        writers = [threading.Thread(target=write, args=(index,)) for index in range(options['writers'])]
+        for thread in readers:
+            thread.start()
+        started = time.perf_counter()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        wall = time.perf_counter() - started
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+
+        row = {
+            'profile': profile,
+            'writers': options['writers'],
+            'commits': len(timings),
+            'errors': sum(errors),
+            'tx_per_s': round(len(timings) / wall, 1),
+            'reads_per_s': round(sum(reads) / wall, 1),
+        }
+        if timings:
+            row.update(summarize(timings))
+        return row
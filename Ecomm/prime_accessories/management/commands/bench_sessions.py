@@ -0,0 +1,126 @@
+import json
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from prime_accessories.benchmarks import format_table, summarize
+from prime_accessories.carts import CART_SESSION_KEY
+from prime_accessories.models import Phone, Accessories, Cart, Category
+
+
+HOST = 'localhost'
+
+# (label, SESSION_ENGINE, PRIME_SESSION_WRITE_MODE)
+ENGINES = [
+    ('db', 'django.contrib.sessions.backends.db', None),
+    ('cached_db', 'django.contrib.sessions.backends.cached_db', None),
+    ('prime-through', 'prime_accessories.session_backend', 'through'),
+    ('prime-behind', 'prime_accessories.session_backend', 'behind'),
+]
+
+
+def send(client, method, url):
+    response = getattr(client, method)(url)
+    if response.status_code >= 400:
+        raise CommandError(f"{method.upper()} {url} answered {response.status_code}")
+    return response
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the cart endpoints (add, view, remove) for an anonymous and a signed-in "
+        "shopper under each session engine, counting the django_session queries of each "
+        "request: Django's db and cached_db engines, and prime_accessories.session_backend "
+        "in write-through and write-behind modes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help="Add/view/remove rounds per shopper")
+        parser.add_argument('--engine', action='append', choices=[label for label, _, _ in ENGINES], default=[],
+                            help="Only benchmark this engine (repeatable)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Benchmark {suffix}')
+        phone = Phone.objects.create(name='Bench phone', brand='Bench', model='B1', description='Benchmark',
+                                     price=Decimal('100.00'), stock=1_000_000, category=category)
+        accessory = Accessories.objects.create(name='Bench case', description='Benchmark', accessory_type='Case',
+                                               price=Decimal('10.00'), stock=1_000_000, category=category)
+        user = User.objects.create_user(f'bench-{suffix}')
+        session_keys, cart_ids = set(), set()
+        try:
+            results = []
+            for label, engine, mode in ENGINES:
+                if options['engine'] and label not in options['engine']:
+                    continue
+                with override_settings(SESSION_ENGINE=engine, SESSION_CACHE_ALIAS='sessions',
+                                       PRIME_SESSION_WRITE_MODE=mode or 'through'):
+                    caches['sessions'].clear()
+                    results.extend(self.run_engine(label, user, phone, accessory, options['repeat'],
+                                                   session_keys, cart_ids))
+        finally:
+            Session.objects.filter(session_key__in=session_keys).delete()
+            Cart.objects.filter(user=user).delete()
+            Cart.objects.filter(pk__in=cart_ids).delete()
+            phone.delete()
+            accessory.delete()
+            category.delete()
+            user.delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(results, [
+                'engine', 'shopper', 'endpoint', 'queries', 'session_queries',
+                'median_ms', 'p95_ms', 'p99_ms', 'max_ms',
+            ]))
+
+    def run_engine(self, label, user, phone, accessory, repeat, session_keys, cart_ids):
+        anonymous = Client(SERVER_NAME=HOST)
+        signed_in = Client(SERVER_NAME=HOST)
+        signed_in.force_login(user)
+        requests = [
+            ('add', 'post', reverse('add_to_cart', args=['accessory', accessory.pk])),
+            ('add', 'post', reverse('add_to_cart', args=['phone', phone.pk])),
+            ('view', 'get', reverse('cart_view')),
+            ('remove', 'get', reverse('remove_from_cart', args=[f'accessory_{accessory.pk}'])),
+            ('remove', 'get', reverse('remove_from_cart', args=[f'phone_{phone.pk}'])),
+        ]
+        results = []
+        for shopper, client in (('anonymous', anonymous), ('signed-in', signed_in)):
+            # The first round creates the session and the cart
+            for _, method, url in requests:
+                send(client, method, url)
+            session_keys.add(client.cookies[settings.SESSION_COOKIE_NAME].value)
+            cart_ids.add(client.session.get(CART_SESSION_KEY))
+            stats = {}
+            for _ in range(repeat):
+                for endpoint, method, url in requests:
+                    timings, queries, session_queries = stats.setdefault(endpoint, ([], [], []))
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        send(client, method, url)
+                        timings.append(time.perf_counter() - started)
+                    queries.append(len(captured.captured_queries))
+                    session_queries.append(sum('django_session' in query['sql'] for query in captured.captured_queries))
+            for endpoint, (timings, queries, session_queries) in stats.items():
+                results.append({
+                    'engine': label,
+                    'shopper': shopper,
+                    'endpoint': endpoint,
+                    'queries': max(queries),
+                    'session_queries': max(session_queries),
+                    **summarize(timings),
+                })
+        return results
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from prime_accessories import inventory
+from prime_accessories.benchmarks import format_table, summarize
+from prime_accessories.checkout import InsufficientStock, place_order
+from prime_accessories.models import Accessories, Category, Order, StockEntry, StockShard
+
+
+LAYOUTS = ('row', 'sharded')
+# A buyer failing this many times in a row gives up
+MAX_CONSECUTIVE_ERRORS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent buyers against a single SKU until it sells out, with its stock in "
+        "one row and then spread over shards (see prime_accessories/inventory.py), and "
+        "check that every unit was sold exactly once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=16, help="Concurrent buyer threads")
+        parser.add_argument('--stock', type=int, default=1000, help="Units of the SKU on sale")
+        parser.add_argument('--quantity', type=int, default=1, help="Units bought per order")
+        parser.add_argument('--shards', type=int, default=inventory.DEFAULT_SHARDS,
+                            help="Shards of the sharded layout")
+        parser.add_argument('--layout', action='append', choices=LAYOUTS, default=[],
+                            help="Only benchmark this layout (repeatable)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        if min(options['buyers'], options['stock'], options['quantity'], options['shards']) < 1:
+            raise CommandError("--buyers, --stock, --quantity and --shards must be at least 1")
+        suffix = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Benchmark {suffix}')
+        users = [User.objects.create_user(f'bench-{suffix}-{index}') for index in range(options['buyers'])]
+        try:
+            results = [self.run_layout(layout, category, users, options)
+                       for layout in options['layout'] or LAYOUTS]
+        finally:
+            Order.objects.filter(customer__in=users).delete()
+            for product in Accessories.objects.filter(category=category):
+                StockShard.objects.filter(item_type='accessory', product_id=product.pk).delete()
+                StockEntry.objects.filter(item_type='accessory', product_id=product.pk).delete()
+                product.delete()
+            category.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(results, [
+                'layout', 'buyers', 'orders', 'errors', 'orders_per_s', 'sold', 'left', 'oversold',
+                'median_ms', 'p95_ms', 'p99_ms', 'max_ms',
+            ]))
+
+    def run_layout(self, layout, category, users, options):
+        product = Accessories.objects.create(
+            name=f'Hot SKU ({layout})', description='Benchmark', accessory_type='Case',
+            price=Decimal('10.00'), stock=options['stock'], category=category,
+        )
+        if layout == 'sharded':
+            inventory.shard_stock('accessory', product.pk, options['shards'])
+        line = [('accessory', product.pk, options['quantity'])]
+        timings, errors = [], []
+        lock = threading.Lock()
+
+        def buy(user):
+            mine, failed, streak = [], 0, 0
+            try:
+                while streak < MAX_CONSECUTIVE_ERRORS:
+                    started = time.perf_counter()
+                    try:
+                        place_order(user, line, shipping_address='Benchmark')
+                    except InsufficientStock:
+                        break
+                    except OperationalError:
+                        # "database is locked": the request would have failed
+                        failed += 1
+                        streak += 1
+                        continue
+                    streak = 0
+                    mine.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            with lock:
+                timings.extend(mine)
+                errors.append(failed)
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        sold = StockEntry.objects.filter(item_type='accessory', product_id=product.pk).aggregate(
+            units=Sum('quantity'))['units'] or 0
+        if layout == 'sharded':
+            left = StockShard.objects.filter(item_type='accessory', product_id=product.pk).aggregate(
+                units=Sum('available'))['units'] or 0
+        else:
+            left = Accessories.objects.values_list('stock', flat=True).get(pk=product.pk)
+        row = {
+            'layout': layout,
+            'buyers': len(users),
+            'orders': len(timings),
+            'errors': sum(errors),
+            'orders_per_s': round(len(timings) / wall, 1),
+            'sold': sold,
+            'left': left,
+            # Every unit sold once: what was sold and what is left add up to the stock
+            'oversold': sold + left != options['stock'] or left < 0,
+        }
+        if timings:
+            row.update(summarize(timings))
+        return row
@@ -0,0 +1,110 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory
+
+from prime_accessories import views
+from prime_accessories.compatibility import compatible_links
+from prime_accessories.models import Review
+
+
+# (label, view class, GET params) replayed against the list views. Add a row
+# here whenever a view learns a new filter.
+VIEW_SCENARIOS = [
+    ('phone_list', views.PhoneListView, {}),
+    ('phone_list category', views.PhoneListView, {'category': '1'}),
+    ('phone_list condition+price', views.PhoneListView,
+     {'condition': 'new', 'min_price': '100', 'max_price': '900'}),
+    ('phone_list price', views.PhoneListView, {'min_price': '100', 'max_price': '900'}),
+    ('phone_list brand', views.PhoneListView, {'brand': 'Samsung'}),
+    ('phone_list ram', views.PhoneListView, {'ram_min': '8'}),
+    ('phone_list storage', views.PhoneListView, {'storage_min': '128', 'storage_max': '512'}),
+    ('phone_list display', views.PhoneListView, {'display_min': '6', 'display_max': '6.5'}),
+    ('phone_list camera', views.PhoneListView, {'camera_min': '48'}),
+    ('accessories_list', views.AccessoriesListView, {}),
+    ('accessories_list category', views.AccessoriesListView, {'category': '1'}),
+    ('accessories_list type+price', views.AccessoriesListView,
+     {'type': 'Case', 'max_price': '50'}),
+    ('accessories_list price', views.AccessoriesListView, {'min_price': '10'}),
+    ('accessories_list brand', views.AccessoriesListView, {'brand': 'Spigen'}),
+    ('order_list', views.OrderListView, {}),
+]
+
+
+def get_view_queryset(view_class, params, user):
+    request = RequestFactory().get('/', params)
+    request.user = user
+    view = view_class()
+    view.setup(request)
+    queryset = view.get_queryset()
+    page_size = getattr(view, 'paginate_by', None)
+    if page_size:
+        queryset = queryset[:page_size]
+    return queryset
+
+
+def get_scenarios():
+    # Unsaved user: only its id is needed to build the order queryset
+    user = User(id=1, username='explain')
+    scenarios = [
+        (label, get_view_queryset(view_class, params, user))
+        for label, view_class, params in VIEW_SCENARIOS
+    ]
+    scenarios += [
+        ('phone_detail reviews', Review.objects.filter(phone_id=1)),
+        ('accessory_detail reviews', Review.objects.filter(accessory_id=1)),
+        ('compatible accessories type+price',
+         compatible_links(1, QueryDict('type=Case&max_price=50'))
+         .order_by('price', 'accessory_id').values('price', 'accessory_id')[:24]),
+    ]
+    return scenarios
+
+
+def find_full_scans(plan, vendor):
+    """Return the plan lines that read a whole table"""
+    lines = [line.strip() for line in plan.splitlines()]
+    if vendor == 'sqlite':
+        # "SCAN t" is a table scan; "SCAN t USING INDEX i" walks an index
+        return [line for line in lines if ' SCAN ' in f' {line} ' and 'USING' not in line]
+    if vendor == 'postgresql':
+        return [line for line in lines if 'Seq Scan' in line]
+    if vendor == 'mysql':
+        return [line for line in lines if 'type: ALL' in line or "'ALL'" in line]
+    return []
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the catalog and order view querysets and report full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help="Exit with an error if any query falls back to a full scan")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in ('sqlite', 'postgresql', 'mysql'):
+            self.stderr.write(f"Full-scan detection is not implemented for {vendor}; plans are printed as-is")
+
+        offenders = []
+        for label, queryset in get_scenarios():
+            plan = queryset.explain()
+            scans = find_full_scans(plan, vendor)
+            if scans:
+                offenders.append(label)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {label}"))
+                for line in scans:
+                    self.stdout.write(f"    {line}")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok         {label}"))
+            if options['verbosity'] > 1:
+                for line in plan.splitlines():
+                    self.stdout.write(f"    | {line}")
+
+        if offenders:
+            message = f"{len(offenders)} queries fall back to full scans: {', '.join(offenders)}"
+            if options['fail_on_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No full table scans found"))
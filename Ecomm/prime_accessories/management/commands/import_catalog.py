@@ -0,0 +1,56 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prime_accessories.catalog_io import FORMATS, MODELS, CatalogImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Upsert phones or accessories from a CSV or JSONL feed keyed by sku"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(MODELS))
+        parser.add_argument('path', help="Feed file, or - for stdin")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows upserted per transaction")
+        parser.add_argument('--max-errors', type=int, default=20,
+                            help="Rejected rows to list in the report")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        importer = CatalogImporter(options['kind'], batch_size=options['batch_size'],
+                                   max_errors=options['max_errors'])
+        started = time.perf_counter()
+
+        def progress(importer):
+            if options['verbosity'] > 1:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{importer.processed} rows ({importer.processed / elapsed:.0f} rows/s)")
+
+        try:
+            if path == '-':
+                importer.run(read_rows(sys.stdin, fmt), on_batch=progress)
+            else:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    importer.run(read_rows(stream, fmt), on_batch=progress)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        elapsed = time.perf_counter() - started
+        for line_number, message in importer.errors:
+            self.stderr.write(f"line {line_number}: {message}")
+        if importer.error_count > len(importer.errors):
+            self.stderr.write(f"... and {importer.error_count - len(importer.errors)} more rejected rows")
+        if importer.unknown_phones:
+            self.stderr.write(f"{len(importer.unknown_phones)} unknown phone SKUs in compatible_phones")
+
+        summary = (f"Imported {importer.processed} {options['kind']} rows "
+                   f"({importer.created} created, {importer.updated} updated")
+        if options['kind'] == 'accessory':
+            summary += f", {importer.links} compatibility links"
+        summary += (f", {importer.error_count} rejected) in {elapsed:.2f}s "
+                    f"- {importer.processed / elapsed if elapsed else 0:.0f} rows/s")
+        self.stdout.write(self.style.SUCCESS(summary))
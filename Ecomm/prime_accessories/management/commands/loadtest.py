@@ -0,0 +1,215 @@
+import asyncio
+import io
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+
+from prime_accessories.benchmarks import format_table, summarize
+from prime_accessories.models import Phone, Accessories
+
+
+# (sync view, async view) pairs; detail pages get the newest product's pk
+PAGES = [
+    ('phone_list', 'async_phone_list', None),
+    ('phone_detail', 'async_phone_detail', Phone),
+    ('accessories_list', 'async_accessories_list', None),
+    ('accessory_detail', 'async_accessory_detail', Accessories),
+    ('cart_view', 'async_cart_view', None),
+]
+
+HOST = 'localhost'
+
+
+def page_paths():
+    """Return [(label, sync path, async path)] for the pages that can be built"""
+    paths = []
+    for sync_name, async_name, model in PAGES:
+        args = []
+        if model is not None:
+            product = model.objects.order_by('-created_at').only('id').first()
+            if product is None:
+                continue
+            args = [product.pk]
+        paths.append((sync_name, reverse(sync_name, args=args), reverse(async_name, args=args)))
+    return paths
+
+
+def wsgi_request(handler, path):
+    """Run one GET through the WSGI handler, return the status code"""
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST,
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''), 'wsgi.errors': sys.stderr,
+    }
+    status = []
+    body = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        for _ in body:
+            pass
+    finally:
+        body.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_request(handler, path):
+    """Run one GET through the ASGI handler, return the status code"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'headers': [(b'host', HOST.encode())],
+        'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+    requested = False
+    status = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; the handler cancels this wait
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await handler(scope, receive, send)
+    return status[0]
+
+
+def http_request(url):
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def run_threads(call, count, concurrency):
+    """Issue count calls from concurrency threads; return (timings, statuses, wall time)"""
+    def timed(_):
+        started = time.perf_counter()
+        try:
+            status = call()
+        except Exception:
+            status = 'error'
+        finally:
+            connections.close_all()
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(count)))
+    return [r[0] for r in results], [r[1] for r in results], time.perf_counter() - started
+
+
+def run_coroutines(call, count, concurrency):
+    """Issue count calls as concurrency tasks on one event loop, like a single ASGI worker"""
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    status = await call()
+                except Exception:
+                    status = 'error'
+                return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[timed() for _ in range(count)])
+        return results, time.perf_counter() - started
+
+    results, wall = asyncio.run(main())
+    return [r[0] for r in results], [r[1] for r in results], wall
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/s and tail latency of the catalog and cart pages under WSGI "
+        "and ASGI. By default requests go through Django's WSGI and ASGI handlers in "
+        "process; --server benchmarks running servers (e.g. gunicorn vs uvicorn) over HTTP."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=10,
+                            help="Untimed requests per scenario (fills caches and connections)")
+        parser.add_argument('--path', action='append', default=[],
+                            help="Benchmark this path instead of the default pages (repeatable)")
+        parser.add_argument('--server', action='append', default=[], metavar='NAME=URL',
+                            help="Benchmark a running server over HTTP instead of in process (repeatable)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        scenarios = self.get_scenarios(options)
+        results = []
+        for label, path, run in scenarios:
+            if options['warmup']:
+                run(path, options['warmup'], options['concurrency'])
+            timings, statuses, wall = run(path, options['requests'], options['concurrency'])
+            row = {'scenario': label, 'path': path, **summarize(timings)}
+            row['rps'] = round(len(timings) / wall, 1)
+            row['errors'] = sum(1 for status in statuses if status == 'error' or status >= 400)
+            results.append(row)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(format_table(results, [
+                'scenario', 'path', 'rps', 'errors', 'median_ms', 'p95_ms', 'p99_ms', 'max_ms',
+            ]))
+
+    def get_scenarios(self, options):
+        if options['path']:
+            paths = [(path, path, path) for path in options['path']]
+        else:
+            paths = page_paths()
+
+        if options['server']:
+            scenarios = []
+            for spec in options['server']:
+                name, sep, base_url = spec.partition('=')
+                if not sep or not urlsplit(base_url).scheme:
+                    raise CommandError(f"Expected NAME=URL, got {spec!r}")
+                base_url = base_url.rstrip('/')
+                run = lambda path, count, concurrency, base_url=base_url: run_threads(
+                    lambda: http_request(base_url + path), count, concurrency)
+                for label, sync_path, async_path in paths:
+                    scenarios.append((f'{name} {label}', sync_path, run))
+                    if async_path != sync_path:
+                        scenarios.append((f'{name} {label} (async)', async_path, run))
+            return scenarios
+
+        wsgi = WSGIHandler()
+        asgi = ASGIHandler()
+
+        def run_wsgi(path, count, concurrency):
+            return run_threads(lambda: wsgi_request(wsgi, path), count, concurrency)
+
+        def run_asgi(path, count, concurrency):
+            return run_coroutines(lambda: asgi_request(asgi, path), count, concurrency)
+
+        scenarios = []
+        for label, sync_path, async_path in paths:
+            scenarios.append((f'wsgi {label}', sync_path, run_wsgi))
+            scenarios.append((f'asgi {label}', sync_path, run_asgi))
+            if async_path != sync_path:
+                scenarios.append((f'asgi {label} (async views)', async_path, run_asgi))
+        return scenarios
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from prime_accessories.carts import DEFAULT_ANONYMOUS_CART_DAYS, purge_anonymous_carts, stale_anonymous_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete anonymous carts nobody has added to for --days days. Run it from cron "
+        "alongside clearsessions, which drops the expired sessions that pointed at them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_ANONYMOUS_CART_DAYS,
+                            help="Days without activity after which an anonymous cart is stale")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count the stale carts without deleting them")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1")
+        if options['dry_run']:
+            count = stale_anonymous_carts(options['days']).count()
+            self.stdout.write(f"{count} anonymous carts would be deleted")
+        else:
+            count = purge_anonymous_carts(options['days'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {count} anonymous carts"))
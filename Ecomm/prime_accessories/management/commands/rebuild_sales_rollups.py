@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prime_accessories import rollups
+from prime_accessories.management.commands.export_orders import parse_day
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from the order tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=parse_day, help="First day, YYYY-MM-DD")
+        parser.add_argument('--to', dest='date_to', type=parse_day, help="Last day (inclusive), YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        date_from, date_to = options['date_from'], options['date_to']
+        if date_from and date_to and date_from > date_to:
+            raise CommandError("--from is after --to")
+        started = time.perf_counter()
+        days = rollups.rebuild(date_from, date_to)
+        elapsed = time.perf_counter() - started
+        span = f"{date_from or 'start'} to {date_to or 'today'}"
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {days} days of sales ({span}) in {elapsed:.2f}s"))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from prime_accessories.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Rows fetched and indexed per batch")
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        started = time.perf_counter()
+        with transaction.atomic():
+            total = backend.rebuild(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {total} items with {type(backend).__name__} in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from prime_accessories.ratings import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute review_count, rating_sum and rating from Review and repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report drifted products without fixing them")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = reconcile(dry_run=options['dry_run'])
+        verb = "would be repaired" if options['dry_run'] else "repaired"
+        for item_type, count in fixed.items():
+            self.stdout.write(f"{item_type}: {count} {verb}")
+        if not any(fixed.values()):
+            self.stdout.write(self.style.SUCCESS("All rating aggregates are in sync"))
@@ -0,0 +1,173 @@
+import datetime
+import json
+import platform
+import subprocess
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from prime_accessories.benchmarks import find_regressions, format_table, measure
+from prime_accessories.caching import get_cache
+from prime_accessories.carts import add_item
+from prime_accessories.models import Phone, Accessories, Cart, Order, Review
+
+
+HOST = 'localhost'
+BENCH_USERNAME = 'bench-runner'
+
+# (scenario, URL name, GET params) for the read paths; detail pages use the
+# most reviewed product, the heaviest page of its kind
+READ_SCENARIOS = [
+    ('phone_list', 'phone_list', {}),
+    ('phone_list filtered', 'phone_list', {'brand': 'Samsung', 'min_price': '300', 'max_price': '900', 'ram_min': '8'}),
+    ('phone_list cursor', 'phone_list', {'pagination': 'cursor', 'condition': 'new'}),
+    ('accessories_list filtered', 'accessories_list', {'type': 'Case', 'max_price': '50'}),
+    ('search phones', 'phone_list', {'search': 'galaxy camera'}),
+    ('search accessories', 'accessories_list', {'search': 'magsafe charger'}),
+    ('api phone_list', 'api_phone_list', {'brand': 'Apple', 'fields': 'id,name,price'}),
+    ('phone_detail', 'phone_detail', {}),
+    ('accessory_detail', 'accessory_detail', {}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the key shopper paths (lists, search, detail, cart, checkout, order history) "
+        "against the current database, ideally one filled by seed_catalog. With --baseline "
+        "the command fails when a scenario regresses, for gating merges."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per scenario")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed runs per scenario")
+        parser.add_argument('--scenario', action='append', default=[],
+                            help="Only run scenarios whose name contains this text (repeatable)")
+        parser.add_argument('--warm-cache', action='store_true',
+                            help="Keep the catalog cache between runs (default: clear it before each run)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+        parser.add_argument('-o', '--output', help="Also write the JSON results to this file")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed median slowdown against the baseline, as a fraction")
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help="Ignore slowdowns smaller than this many milliseconds")
+
+    def handle(self, *args, **options):
+        self.options = options
+        phone = Phone.objects.order_by('-review_count', 'pk').only('id').first()
+        accessory = Accessories.objects.order_by('-review_count', 'pk').only('id').first()
+        if phone is None or accessory is None:
+            raise CommandError("The catalog is empty; run seed_catalog first")
+
+        scenarios = self.get_scenarios(phone, accessory)
+        if options['scenario']:
+            scenarios = [s for s in scenarios if any(text in s[0] for text in options['scenario'])]
+        results = []
+        for name, run, setup in scenarios:
+            results.append({'scenario': name, **self.time(name, run, setup)})
+
+        report = {'meta': self.get_meta(), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(format_table(results, [
+                'scenario', 'queries', 'min_ms', 'median_ms', 'p95_ms', 'p99_ms', 'max_ms',
+            ]))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as stream:
+                baseline = json.load(stream)['results']
+            regressions = find_regressions(baseline, results, options['threshold'], options['min_delta_ms'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + '\n  '.join(regressions))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def time(self, name, run, setup):
+        def checked():
+            try:
+                response = run()
+            except Exception as exc:
+                raise CommandError(f"{name} failed: {type(exc).__name__}: {exc}")
+            if response.status_code >= 400:
+                raise CommandError(f"{name} answered {response.status_code}")
+
+        def prepare():
+            if setup is not None:
+                setup()
+            if not self.options['warm_cache']:
+                get_cache().clear()
+
+        for _ in range(self.options['warmup']):
+            prepare()
+            checked()
+        return measure(checked, repeat=self.options['repeat'], setup=prepare)
+
+    def get_scenarios(self, phone, accessory):
+        """[(name, run, setup)]; run issues one request and returns the response"""
+        anonymous = Client(SERVER_NAME=HOST)
+        scenarios = []
+        for name, url_name, params in READ_SCENARIOS:
+            args = {'phone_detail': [phone.pk], 'accessory_detail': [accessory.pk]}.get(url_name, [])
+            url = reverse(url_name, args=args)
+            scenarios.append((name, lambda url=url, params=params: anonymous.get(url, params), None))
+
+        shopper = Client(SERVER_NAME=HOST)
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        shopper.force_login(user)
+        cart, _ = Cart.objects.get_or_create(user=user)
+
+        def fill_cart():
+            cart.items.all().delete()
+            add_item(cart, 'phone', phone.pk)
+            add_item(cart, 'accessory', accessory.pk, 2)
+
+        add_url = reverse('add_to_cart', args=['accessory', accessory.pk])
+        scenarios += [
+            ('add_to_cart', lambda: shopper.post(add_url), None),
+            ('cart_view', lambda: shopper.get(reverse('cart_view')), fill_cart),
+            ('checkout', lambda: shopper.post(reverse('checkout'), {'shipping_address': '1 Bench Street'}),
+             fill_cart),
+        ]
+
+        # Order history of the customer with the most orders
+        busiest = (Order.objects.values('customer').annotate(orders=Count('id'))
+                   .order_by('-orders').first())
+        if busiest is not None:
+            customer = Client(SERVER_NAME=HOST)
+            customer.force_login(User.objects.get(pk=busiest['customer']))
+            order = Order.objects.filter(customer_id=busiest['customer']).order_by('-created_at').first()
+            scenarios += [
+                ('order_list', lambda: customer.get(reverse('order_list')), None),
+                ('order_detail', lambda: customer.get(reverse('order_detail', args=[order.pk])), None),
+            ]
+        return scenarios
+
+    def get_meta(self):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'commit': commit,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': self.options['repeat'],
+            'warm_cache': self.options['warm_cache'],
+            'rows': {
+                'phones': Phone.objects.count(),
+                'accessories': Accessories.objects.count(),
+                'orders': Order.objects.count(),
+                'reviews': Review.objects.count(),
+            },
+        }
@@ -0,0 +1,108 @@
+import multiprocessing
+import signal
+import threading
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from prime_accessories.tasks import DEFAULT_BATCH_SIZE, Worker, retention_days
+
+
+def run_threads(threads, batch_size, poll_interval, drain, keep_days, stop):
+    """Run worker threads until stop is set (or, with drain, the queue is empty)"""
+    def serve():
+        try:
+            Worker(batch_size=batch_size, retention_days=keep_days).run(stop, poll_interval, drain)
+        finally:
+            connections.close_all()
+
+    pool = [threading.Thread(target=serve, name=f'task-worker-{index}', daemon=True) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    # join() with a timeout, so signals still reach the main thread
+    for thread in pool:
+        while thread.is_alive():
+            thread.join(0.5)
+
+
+def serve_process(threads, batch_size, poll_interval, drain, keep_days):
+    """Entry point of a worker process"""
+    if not apps.ready:
+        # Started with the spawn method: this is a fresh interpreter
+        django.setup()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    run_threads(threads, batch_size, poll_interval, drain, keep_days, stop)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background task workers: --processes processes of --threads worker threads each "
+        "drain the task outbox, retrying failures with backoff, and delete done tasks after "
+        "--retention-days. Stops cleanly on SIGINT/SIGTERM after the tasks in hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help="Worker threads per process")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Worker processes; 1 runs the threads in this process")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Tasks a worker claims at a time")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking for tasks again")
+        parser.add_argument('--drain', action='store_true',
+                            help="Exit once no task is due instead of waiting for more")
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help="Days done tasks are kept (default: PRIME_TASK_RETENTION_DAYS)")
+        parser.add_argument('--no-purge', action='store_true', help="Keep done tasks forever")
+
+    def handle(self, *args, **options):
+        threads, processes = options['threads'], options['processes']
+        if threads < 1 or processes < 1:
+            raise CommandError("--threads and --processes must be at least 1")
+        keep_days = options['retention_days']
+        if keep_days is None:
+            keep_days = retention_days()
+        if keep_days is not None and keep_days < 0:
+            raise CommandError("--retention-days can't be negative")
+        if options['no_purge']:
+            keep_days = None
+        args = (threads, options['batch_size'], options['poll_interval'], options['drain'], keep_days)
+        self.stdout.write(f"Starting {processes} x {threads} task workers")
+
+        if processes == 1:
+            stop = threading.Event()
+            previous = self.handle_signals(lambda *_: stop.set())
+            try:
+                run_threads(*args, stop)
+            finally:
+                self.handle_signals(previous)
+        else:
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            pool = [multiprocessing.Process(target=serve_process, args=args, name=f'task-workers-{index}')
+                    for index in range(processes)]
+            for process in pool:
+                process.start()
+
+            def forward(*_):
+                # Children finish the tasks in hand, then exit
+                for process in pool:
+                    if process.is_alive():
+                        process.terminate()
+
+            previous = self.handle_signals(forward)
+            try:
+                for process in pool:
+                    process.join()
+            finally:
+                self.handle_signals(previous)
+        self.stdout.write(self.style.SUCCESS("Task workers stopped"))
+
+    def handle_signals(self, handler):
+        """Install handler (or {signal: handler}) for SIGINT/SIGTERM; returns the previous handlers"""
+        handlers = handler if isinstance(handler, dict) else {sig: handler for sig in (signal.SIGINT, signal.SIGTERM)}
+        return {sig: signal.signal(sig, new) for sig, new in handlers.items()}
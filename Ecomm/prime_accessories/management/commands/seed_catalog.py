@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from prime_accessories.seeding import (
+    AlreadySeeded, CatalogSeeder, DEFAULT_COMPATIBLE_PHONES, DEFAULT_COUNTS, DEFAULT_DAYS,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill an empty database with a large synthetic catalog, orders and reviews for "
+        "run_benchmarks. Defaults are production volumes; use --scale for a smaller copy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Multiply every default volume, e.g. 0.01 for a quick run")
+        for name, count in DEFAULT_COUNTS.items():
+            parser.add_argument(f'--{name}', type=int, help=f"Rows to create (default {count:,} x scale)")
+        parser.add_argument('--compatible-phones', type=int, default=DEFAULT_COMPATIBLE_PHONES,
+                            help="Compatible phones per accessory")
+        parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="Spread orders and reviews over this many days")
+        parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT transaction")
+
+    def handle(self, *args, **options):
+        counts = {
+            name: options[name] if options[name] is not None else max(1, int(count * options['scale']))
+            for name, count in DEFAULT_COUNTS.items()
+        }
+        self.stdout.write(', '.join(f"{count:,} {name}" for name, count in counts.items()))
+
+        verbosity = options['verbosity']
+
+        def report(phase, done, total, elapsed):
+            if verbosity >= 1:
+                rate = done / elapsed if elapsed else 0
+                self.stdout.write(f"\r{phase}: {done:,}/{total:,} ({rate:,.0f} rows/s)", ending='')
+                if done == total:
+                    self.stdout.write('')
+
+        seeder = CatalogSeeder(
+            seed=options['seed'], batch_size=options['batch_size'], days=options['days'],
+            compatible_phones=options['compatible_phones'], report=report,
+        )
+        try:
+            timings = seeder.run(**counts)
+        except AlreadySeeded as exc:
+            raise CommandError(str(exc))
+        for phase, elapsed in timings.items():
+            self.stdout.write(f"{phase}: {elapsed:.1f}s")
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {sum(timings.values()):.1f}s"))
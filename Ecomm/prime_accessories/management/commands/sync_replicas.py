@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+def copy_database(source, target, pages=1024):
+    """Copy the SQLite file source over target with the online backup API"""
+    primary = sqlite3.connect(source)
+    replica = sqlite3.connect(target)
+    try:
+        # Readers of the replica keep their snapshot until the copy commits
+        primary.backup(replica, pages=pages)
+    finally:
+        primary.close()
+        replica.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the SQLite replicas (PRIME_DB_REPLICAS) from the primary, standing in for "
+        "replication on a development machine. With --interval it keeps doing so, which "
+        "gives the replicas a realistic lag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help="Copy again every this many seconds")
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = settings.PRIME_DB_REPLICAS
+        if not replicas:
+            raise CommandError("No replicas configured; set PRIME_DB_REPLICAS")
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("Only SQLite replicas are copied; other databases replicate on their own")
+
+        while True:
+            started = time.perf_counter()
+            for alias in replicas:
+                copy_database(primary['NAME'], settings.DATABASES[alias]['NAME'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Copied {primary['NAME']} to {len(replicas)} replicas in {elapsed:.2f}s")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+FTS_TABLE = 'prime_accessories_search_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, name, brand, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('phone', 'Phone'), ('accessory', 'Accessory')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.FloatField(default=1)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token'], name='search_kind_token_idx'), models.Index(fields=['kind', 'object_id'], name='search_kind_object_idx')],
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
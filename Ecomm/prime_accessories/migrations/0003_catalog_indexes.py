@@ -0,0 +1,63 @@
+# Generated by Django 5.2 on 2026-10-18 04:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0002_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accessories',
+            index=models.Index(fields=['category', '-created_at'], name='accessory_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessories',
+            index=models.Index(fields=['accessory_type', 'price'], name='accessory_type_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessories',
+            index=models.Index(fields=['price'], name='accessory_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accessories',
+            index=models.Index(fields=['-created_at'], name='accessory_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', '-created_at'], name='order_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['category', '-created_at'], name='phone_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['condition', 'price'], name='phone_condition_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['price'], name='phone_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['-created_at'], name='phone_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['phone', '-created_at'], name='review_phone_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['accessory', '-created_at'], name='review_accessory_created_idx'),
+        ),
+    ]
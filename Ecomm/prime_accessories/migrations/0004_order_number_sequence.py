@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-18 04:59
+
+from django.db import migrations, models
+
+
+def seed_order_number_sequence(apps, schema_editor):
+    # Legacy numbers are ORD-<user id>-<count + 1>; start past the largest
+    # suffix so new numbers can never collide with them
+    Order = apps.get_model('prime_accessories', 'Order')
+    Sequence = apps.get_model('prime_accessories', 'Sequence')
+    highest = 0
+    numbers = Order.objects.using(schema_editor.connection.alias).values_list('order_number', flat=True)
+    for number in numbers.iterator():
+        suffix = number.rsplit('-', 1)[-1]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    Sequence.objects.using(schema_editor.connection.alias).create(name='order_number', next_value=highest + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0003_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_order_number_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 05:02
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Review = apps.get_model('prime_accessories', 'Review')
+    alias = schema_editor.connection.alias
+    for model_name, attname in (('Phone', 'phone_id'), ('Accessories', 'accessory_id')):
+        model = apps.get_model('prime_accessories', model_name)
+        rows = (Review.objects.using(alias)
+                .filter(**{f'{attname}__isnull': False})
+                .order_by()
+                .values(attname)
+                .annotate(count=Count('id'), total=Sum('rating')))
+        for row in rows.iterator():
+            model.objects.using(alias).filter(pk=row[attname]).update(
+                review_count=row['count'],
+                rating_sum=row['total'],
+                rating=row['total'] / row['count'],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0004_order_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accessories',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='accessories',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
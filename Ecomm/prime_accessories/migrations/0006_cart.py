@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 05:05
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0005_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cart', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('phone', 'Phone'), ('accessory', 'Accessory')], max_length=20)),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('accessory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='prime_accessories.accessories')),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='prime_accessories.cart')),
+                ('phone', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='prime_accessories.phone')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('phone__isnull', False)), fields=('cart', 'phone'), name='cartitem_unique_phone'), models.UniqueConstraint(condition=models.Q(('accessory__isnull', False)), fields=('cart', 'accessory'), name='cartitem_unique_accessory')],
+            },
+        ),
+    ]
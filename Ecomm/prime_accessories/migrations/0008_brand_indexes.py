@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 05:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0007_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accessories',
+            index=models.Index(fields=['brand', '-created_at'], name='accessory_brand_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['brand', '-created_at'], name='phone_brand_created_idx'),
+        ),
+    ]
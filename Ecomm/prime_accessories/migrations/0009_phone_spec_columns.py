@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-18 05:16
+
+from django.db import migrations, models
+
+from prime_accessories.specs import normalize_phone, SPEC_COLUMNS
+
+
+def normalize_specs(apps, schema_editor):
+    Phone = apps.get_model('prime_accessories', 'Phone')
+    phones = Phone.objects.using(schema_editor.connection.alias)
+    columns = list(SPEC_COLUMNS.values())
+    batch = []
+    for phone in phones.only('id', *SPEC_COLUMNS).order_by('pk').iterator(chunk_size=2000):
+        batch.append(normalize_phone(phone))
+        if len(batch) == 2000:
+            phones.bulk_update(batch, columns)
+            batch = []
+    phones.bulk_update(batch, columns)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0008_brand_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phone',
+            name='display_inches',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='main_camera_mp',
+            field=models.DecimalField(blank=True, decimal_places=1, editable=False, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='ram_gb',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='storage_gb',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=8, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['ram_gb'], name='phone_ram_gb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['storage_gb'], name='phone_storage_gb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['display_inches'], name='phone_display_inches_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(fields=['main_camera_mp'], name='phone_main_camera_mp_idx'),
+        ),
+        migrations.RunPython(normalize_specs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0009_phone_spec_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accessories',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
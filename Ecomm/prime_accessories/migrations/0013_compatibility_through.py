@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-18 05:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_accessory_columns(apps, schema_editor):
+    Accessories = apps.get_model('prime_accessories', 'Accessories')
+    Compatibility = apps.get_model('prime_accessories', 'Compatibility')
+    accessory = Accessories.objects.filter(pk=OuterRef('accessory_id'))
+    Compatibility.objects.update(
+        accessory_type=Subquery(accessory.values('accessory_type')[:1]),
+        price=Subquery(accessory.values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Turn the auto-created compatible_phones table into the explicit
+    Compatibility model in place: the table, its columns, the unique
+    (accessories_id, phone_id) index and the FK indexes already exist, so
+    only the state changes; the denormalized columns and the lookup index
+    are then added to the existing table.
+    """
+
+    dependencies = [
+        ('prime_accessories', '0012_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Compatibility',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('accessory', models.ForeignKey(db_column='accessories_id', on_delete=django.db.models.deletion.CASCADE, related_name='compatibility', to='prime_accessories.accessories')),
+                        ('phone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatibility', to='prime_accessories.phone')),
+                    ],
+                    options={
+                        'verbose_name_plural': 'Compatibility',
+                        'db_table': 'prime_accessories_accessories_compatible_phones',
+                        'unique_together': {('accessory', 'phone')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='accessories',
+                    name='compatible_phones',
+                    field=models.ManyToManyField(blank=True, related_name='accessories', through='prime_accessories.Compatibility', to='prime_accessories.phone'),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name='compatibility',
+            name='accessory_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='compatibility',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(copy_accessory_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='compatibility',
+            index=models.Index(fields=['phone', 'accessory_type', 'price', 'accessory'], name='compatibility_lookup_idx'),
+        ),
+    ]
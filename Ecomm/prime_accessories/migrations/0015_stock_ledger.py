@@ -0,0 +1,58 @@
+# Generated by Django 5.2 on 2026-10-18 05:49
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0014_task_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accessories',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='phone',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(max_length=20)),
+                ('product_id', models.PositiveIntegerField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('available', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item_type', 'product_id', 'shard'), name='stockshard_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(max_length=20)),
+                ('product_id', models.PositiveIntegerField()),
+                ('shard', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('sold', 'Sold'), ('released', 'Released')], max_length=20)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_entries', to='prime_accessories.order')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock entries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['item_type', 'product_id', 'status'], name='stockentry_product_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 07:02
+
+from django.db import migrations
+
+from prime_accessories.specs import normalize_phone, SPEC_COLUMNS
+
+
+def renormalize_specs(apps, schema_editor):
+    """Clear spec columns parsed from implausible values before they were range-checked"""
+    Phone = apps.get_model('prime_accessories', 'Phone')
+    phones = Phone.objects.using(schema_editor.connection.alias)
+    columns = list(SPEC_COLUMNS.values())
+    batch = []
+    for phone in phones.only('id', *SPEC_COLUMNS).order_by('pk').iterator(chunk_size=2000):
+        batch.append(normalize_phone(phone))
+        if len(batch) == 2000:
+            phones.bulk_update(batch, columns)
+            batch = []
+    phones.bulk_update(batch, columns)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0015_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalize_specs, migrations.RunPython.noop),
+    ]
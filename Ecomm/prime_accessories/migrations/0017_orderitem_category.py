@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 07:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_categories(apps, schema_editor):
+    """Existing lines take their product's current category, as the rollups already counted them"""
+    OrderItem = apps.get_model('prime_accessories', 'OrderItem')
+    items = OrderItem.objects.using(schema_editor.connection.alias)
+    for model_name, attname in (('Phone', 'phone_id'), ('Accessories', 'accessory_id')):
+        model = apps.get_model('prime_accessories', model_name)
+        items.filter(**{f'{attname}__isnull': False}).update(category_id=Subquery(
+            model.objects.filter(pk=OuterRef(attname)).values('category_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prime_accessories', '0016_renormalize_phone_specs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='prime_accessories.category'),
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+    ]
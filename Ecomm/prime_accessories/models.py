@@ -1,12 +1,17 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from . import specs
+
 # Category Model
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -23,12 +28,14 @@ class Phone(models.Model):
         ('used', 'Used'),
     ]
     
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # supplier key for catalog imports
     name = models.CharField(max_length=200)
     brand = models.CharField(max_length=100)
     model = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    stock_shards = models.PositiveSmallIntegerField(default=0)  # >0: stock lives in StockShard rows, see inventory.py
     
     # Technical specifications
     processor = models.CharField(max_length=100, blank=True)
@@ -39,11 +46,19 @@ class Phone(models.Model):
     battery_mah = models.IntegerField(blank=True, null=True)
     os = models.CharField(max_length=100, blank=True)  # e.g., "Android 14", "iOS 17"
     
+    # Parsed from the specs above by prime_accessories.specs, for range filters
+    ram_gb = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, editable=False)
+    storage_gb = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, editable=False)
+    display_inches = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True, editable=False)
+    main_camera_mp = models.DecimalField(max_digits=5, decimal_places=1, null=True, blank=True, editable=False)
+    
     # Additional info
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, default='new')
     color = models.CharField(max_length=50, blank=True)
     image_url = models.URLField(blank=True)
     rating = models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(5)])
+    review_count = models.PositiveIntegerField(default=0)  # maintained by prime_accessories.ratings
+    rating_sum = models.PositiveIntegerField(default=0)
     
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='phones')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -52,27 +67,50 @@ class Phone(models.Model):
     def __str__(self):
         return f"{self.brand} {self.name}"
     
+    def save(self, *args, **kwargs):
+        specs.normalize_phone(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(specs.SPEC_COLUMNS):
+            kwargs['update_fields'] = set(update_fields) | set(specs.SPEC_COLUMNS.values())
+        super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name_plural = "Phones"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['category', '-created_at'], name='phone_category_created_idx'),
+            models.Index(fields=['condition', 'price'], name='phone_condition_price_idx'),
+            models.Index(fields=['brand', '-created_at'], name='phone_brand_created_idx'),
+            models.Index(fields=['price'], name='phone_price_idx'),
+            models.Index(fields=['-created_at'], name='phone_created_idx'),
+            models.Index(fields=['ram_gb'], name='phone_ram_gb_idx'),
+            models.Index(fields=['storage_gb'], name='phone_storage_gb_idx'),
+            models.Index(fields=['display_inches'], name='phone_display_inches_idx'),
+            models.Index(fields=['main_camera_mp'], name='phone_main_camera_mp_idx'),
+        ]
 
 
 # Accessories Model
 class Accessories(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # supplier key for catalog imports
     name = models.CharField(max_length=200)
     brand = models.CharField(max_length=100, blank=True)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     stock = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    stock_shards = models.PositiveSmallIntegerField(default=0)  # >0: stock lives in StockShard rows, see inventory.py
     
     # Accessory specific
     accessory_type = models.CharField(max_length=100)  # e.g., "Screen Protector", "Case", "Charger"
     color = models.CharField(max_length=50, blank=True)
     material = models.CharField(max_length=100, blank=True)
-    compatible_phones = models.ManyToManyField(Phone, related_name='accessories', blank=True)
+    compatible_phones = models.ManyToManyField(Phone, related_name='accessories', blank=True,
+                                               through='Compatibility')
     
     image_url = models.URLField(blank=True)
     rating = models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(5)])
+    review_count = models.PositiveIntegerField(default=0)  # maintained by prime_accessories.ratings
+    rating_sum = models.PositiveIntegerField(default=0)
     
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='accessories')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -84,6 +122,48 @@ class Accessories(models.Model):
     class Meta:
         verbose_name_plural = "Accessories"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['category', '-created_at'], name='accessory_category_created_idx'),
+            models.Index(fields=['accessory_type', 'price'], name='accessory_type_price_idx'),
+            models.Index(fields=['brand', '-created_at'], name='accessory_brand_created_idx'),
+            models.Index(fields=['price'], name='accessory_price_idx'),
+            models.Index(fields=['-created_at'], name='accessory_created_idx'),
+        ]
+
+
+# Compatibility Model (the compatible_phones through table)
+class Compatibility(models.Model):
+    """
+    One accessory fits one phone.
+
+    accessory_type and price are copies of the accessory's, kept in sync by
+    save(), the Accessories signals and prime_accessories.compatibility, so
+    "accessories for phone X by type and price" is answered from
+    compatibility_lookup_idx alone.
+    """
+    # db_column keeps the column of the auto-created M2M table this replaces
+    accessory = models.ForeignKey(Accessories, on_delete=models.CASCADE, db_column='accessories_id',
+                                  related_name='compatibility')
+    phone = models.ForeignKey(Phone, on_delete=models.CASCADE, related_name='compatibility')
+    accessory_type = models.CharField(max_length=100, blank=True, editable=False)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    
+    def __str__(self):
+        return f"{self.accessory_id} fits {self.phone_id}"
+    
+    def save(self, *args, **kwargs):
+        self.accessory_type = self.accessory.accessory_type
+        self.price = self.accessory.price
+        super().save(*args, **kwargs)
+    
+    class Meta:
+        db_table = 'prime_accessories_accessories_compatible_phones'
+        verbose_name_plural = "Compatibility"
+        # (accessory, phone) is covered by this unique index
+        unique_together = [('accessory', 'phone')]
+        indexes = [
+            models.Index(fields=['phone', 'accessory_type', 'price', 'accessory'], name='compatibility_lookup_idx'),
+        ]
 
 
 # Customer Profile Model
@@ -140,6 +220,21 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['customer', '-created_at'], name='order_customer_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
+
+# Sequence Model
+class Sequence(models.Model):
+    """Named counter handed out in blocks by prime_accessories.sequences"""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"{self.name} @ {self.next_value}"
 
 
 # Order Items Model
@@ -155,6 +250,10 @@ class OrderItem(models.Model):
     phone = models.ForeignKey(Phone, on_delete=models.SET_NULL, null=True, blank=True)
     accessory = models.ForeignKey(Accessories, on_delete=models.SET_NULL, null=True, blank=True)
     
+    # The product's category when the order was placed, which the sales
+    # rollups keep counting the line under
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
@@ -164,6 +263,41 @@ class OrderItem(models.Model):
         return f"{item} - Order {self.order.order_number}"
 
 
+# Cart Models
+class Cart(models.Model):
+    # Anonymous carts have no user and are found through the session
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='cart')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Cart of {self.user.username}" if self.user_id else f"Anonymous cart {self.pk}"
+
+
+class CartItem(models.Model):
+    ITEM_TYPE_CHOICES = OrderItem.ITEM_TYPE_CHOICES
+    
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    item_type = models.CharField(max_length=20, choices=ITEM_TYPE_CHOICES)
+    
+    phone = models.ForeignKey(Phone, on_delete=models.CASCADE, null=True, blank=True)
+    accessory = models.ForeignKey(Accessories, on_delete=models.CASCADE, null=True, blank=True)
+    
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    added_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.phone or self.accessory}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'phone'], condition=models.Q(phone__isnull=False),
+                                    name='cartitem_unique_phone'),
+            models.UniqueConstraint(fields=['cart', 'accessory'], condition=models.Q(accessory__isnull=False),
+                                    name='cartitem_unique_accessory'),
+        ]
+
+
 # Review/Rating Model
 class Review(models.Model):
     RATING_CHOICES = [(i, str(i)) for i in range(1, 6)]
@@ -188,5 +322,168 @@ class Review(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['phone', '-created_at'], name='review_phone_created_idx'),
+            models.Index(fields=['accessory', '-created_at'], name='review_accessory_created_idx'),
+        ]
     
     
+
+
+# Search Index Model
+class SearchToken(models.Model):
+    """Inverted index posting used by the portable search backend"""
+    KIND_CHOICES = [
+        ('phone', 'Phone'),
+        ('accessory', 'Accessory'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    token = models.CharField(max_length=64)
+    weight = models.FloatField(default=1)
+    
+    def __str__(self):
+        return f"{self.token} -> {self.kind}:{self.object_id}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'token'], name='search_kind_token_idx'),
+            models.Index(fields=['kind', 'object_id'], name='search_kind_object_idx'),
+        ]
+
+
+# Sales Rollup Models (maintained by prime_accessories.rollups)
+class DailySales(models.Model):
+    """Per-day order totals, excluding cancelled orders"""
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    unit_count = models.IntegerField(default=0)
+    gross_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"Sales on {self.date}"
+    
+    class Meta:
+        verbose_name_plural = "Daily sales"
+        ordering = ['-date']
+
+
+class DailyProductSales(models.Model):
+    """Units and line revenue per product per day"""
+    date = models.DateField()
+    item_type = models.CharField(max_length=20, choices=OrderItem.ITEM_TYPE_CHOICES)
+    product_id = models.IntegerField()  # no FK: history outlives deleted products
+    unit_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.item_type} {self.product_id} on {self.date}"
+    
+    class Meta:
+        verbose_name_plural = "Daily product sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'item_type', 'product_id'], name='dailyproductsales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['item_type', 'product_id', 'date'], name='dailyproductsales_product_idx'),
+        ]
+
+
+class DailyCategorySales(models.Model):
+    """Units and line revenue per category per day (uncategorized lines are left out)"""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+    unit_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.category_id} on {self.date}"
+    
+    class Meta:
+        verbose_name_plural = "Daily category sales"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='dailycategorysales_unique'),
+        ]
+
+
+# Task Outbox Model (drained by prime_accessories.tasks workers)
+class Task(models.Model):
+    """A queued background job, written in the transaction that needs it"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers claim due pending rows oldest first
+            models.Index(fields=['status', 'run_after', 'id'], name='task_due_idx'),
+        ]
+
+
+# Inventory Models (maintained by prime_accessories.inventory)
+class StockShard(models.Model):
+    """One slice of a hot SKU's stock; checkouts take from a random slice"""
+    item_type = models.CharField(max_length=20)  # 'phone' or 'accessory'
+    product_id = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    available = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    
+    def __str__(self):
+        return f"{self.item_type} {self.product_id} shard {self.shard}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item_type', 'product_id', 'shard'], name='stockshard_unique'),
+        ]
+
+
+class StockEntry(models.Model):
+    """The stock ledger: a quantity taken from a SKU (or one of its shards) and what became of it"""
+    STATUS_CHOICES = [
+        ('held', 'Held'),
+        ('sold', 'Sold'),
+        ('released', 'Released'),
+    ]
+    
+    item_type = models.CharField(max_length=20)
+    product_id = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_entries')
+    expires_at = models.DateTimeField(null=True, blank=True)  # held entries only
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.item_type} {self.product_id} ({self.status})"
+    
+    class Meta:
+        verbose_name_plural = "Stock entries"
+        ordering = ['-created_at']
+        indexes = [
+            # Reserved/sold totals per SKU
+            models.Index(fields=['item_type', 'product_id', 'status'], name='stockentry_product_idx'),
+        ]
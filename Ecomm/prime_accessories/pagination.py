@@ -0,0 +1,177 @@
+"""
+Keyset (cursor) pagination.
+
+Page-number pagination runs COUNT(*) over the filtered queryset and then an
+OFFSET query, both of which get slower the deeper a client pages. A cursor
+page instead remembers the sort key of its last row and asks for the rows
+after it, so every page is a single indexed range read and no count is run.
+
+Cursors are opaque, URL-safe strings. They are not signed: a tampered
+cursor can only select a different slice of the same queryset.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates datetimes to milliseconds, which would make
+    # the cursor skip rows created within the same millisecond
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['v'], payload['d']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, direction
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Paginate a queryset on a unique, indexed ordering such as (-created_at, -id)"""
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = list(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def _reverse_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def _parse_values(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        opts = self.queryset.model._meta
+        parsed = []
+        for name, value in zip(self.fields, values):
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+            try:
+                parsed.append(field.to_python(value))
+            except ValidationError:
+                raise InvalidCursor(values)
+        return parsed
+
+    def _seek(self, values, forward):
+        """Build the lexicographic "rows after this key" filter"""
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def _key(self, obj):
+        # obj is a model instance, or a dict when paginating .values()
+        if isinstance(obj, dict):
+            return [obj[name] for name in self.fields]
+        return [getattr(obj, name) for name in self.fields]
+
+    def _window(self, cursor):
+        """Return (queryset slice to fetch, cursor values, forward)"""
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            values = self._parse_values(values)
+        else:
+            values, direction = None, 'next'
+        forward = direction == 'next'
+
+        queryset = self.queryset.order_by(*(self.ordering if forward else self._reverse_ordering()))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        # Fetch one extra row to learn whether another page exists
+        return queryset[:self.per_page + 1], values, forward
+
+    def page(self, cursor=None):
+        window, values, forward = self._window(cursor)
+        return self._make_page(list(window), values, forward)
+
+    async def apage(self, cursor=None):
+        window, values, forward = self._window(cursor)
+        return self._make_page([row async for row in window], values, forward)
+
+    def _make_page(self, rows, values, forward):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor(self._key(rows[-1]), 'next')
+            if (has_more and not forward) or (forward and values is not None):
+                previous_cursor = encode_cursor(self._key(rows[0]), 'prev')
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """
+    Opt-in cursor mode for ListView subclasses.
+
+    Requests carrying ``?pagination=cursor`` or a ``cursor`` parameter are
+    paginated with CursorPaginator; everything else keeps page numbers.
+    Cursor mode always orders by cursor_ordering.
+    """
+    cursor_ordering = ('-created_at', '-id')
+
+    def use_cursor_pagination(self):
+        return self.request.GET.get('pagination') == 'cursor' or 'cursor' in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, ordering=self.cursor_ordering)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,90 @@
+"""
+Denormalized product ratings.
+
+Phone and Accessories carry review_count and rating_sum alongside rating,
+so pages and list sorts read the average without touching Review. The
+columns are adjusted with F() expressions from the Review signal handlers,
+inside the same transaction as the review write, and reconcile() repairs
+any drift left by writes that bypass signals (queryset.update, raw SQL).
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Now
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from . import caching
+
+
+REVIEW_TARGETS = {
+    'phone': 'phone_id',
+    'accessory': 'accessory_id',
+}
+
+
+def get_rated_models():
+    from .models import Phone, Accessories
+    return {'phone': Phone, 'accessory': Accessories}
+
+
+def review_target(review):
+    """Return (item_type, product id) for the product a review is attached to"""
+    for item_type, attname in REVIEW_TARGETS.items():
+        product_id = getattr(review, attname)
+        if product_id is not None:
+            return item_type, product_id
+    return None
+
+
+def apply_rating_delta(item_type, product_id, count_delta, sum_delta):
+    """Shift a product's review_count/rating_sum and recompute its average"""
+    model = get_rated_models()[item_type]
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    # rating is listed first: MySQL evaluates SET clauses left to right
+    # against already-updated values, every other backend uses the old row
+    model.objects.filter(pk=product_id).update(
+        rating=Case(
+            When(GreaterThan(new_count, 0), then=Cast(new_sum, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        review_count=new_count,
+        rating_sum=new_sum,
+        # queryset.update() skips auto_now; the API's ETags depend on it
+        updated_at=Now(),
+    )
+
+
+def reconcile(dry_run=False, chunk_size=2000):
+    """Recompute aggregates from Review and fix drifted rows; return {item_type: fixed}"""
+    from .models import Review
+    fixed = {}
+    for item_type, model in get_rated_models().items():
+        attname = REVIEW_TARGETS[item_type]
+        actual = {
+            row[attname]: (row['count'], row['total'])
+            for row in (Review.objects
+                        .filter(**{f'{attname}__isnull': False})
+                        .order_by()
+                        .values(attname)
+                        .annotate(count=Count('id'), total=Sum('rating')))
+        }
+        drifted = []
+        now = timezone.now()
+        products = model.objects.only('id', 'review_count', 'rating_sum', 'rating')
+        for product in products.order_by().iterator(chunk_size=chunk_size):
+            count, total = actual.get(product.pk, (0, 0))
+            rating = total / count if count else 0.0
+            if (product.review_count, product.rating_sum) != (count, total) or abs(product.rating - rating) > 1e-9:
+                product.review_count, product.rating_sum, product.rating = count, total, rating
+                product.updated_at = now
+                drifted.append(product)
+        if drifted and not dry_run:
+            # bulk_update() sends no post_save, so the cached pages and the
+            # API's ETags are invalidated here
+            model.objects.bulk_update(drifted, ['review_count', 'rating_sum', 'rating', 'updated_at'], batch_size=500)
+            names = [f'{item_type}:list', *[f'{item_type}:{product.pk}' for product in drifted]]
+            transaction.on_commit(lambda names=names: caching.bump(*names))
+        fixed[item_type] = len(drifted)
+    return fixed
@@ -0,0 +1,260 @@
+"""
+Sales rollups.
+
+DailySales, DailyProductSales and DailyCategorySales summarize orders per
+day, so reports read a few hundred summary rows instead of aggregating the
+whole order history. Cancelled orders are excluded.
+
+The tables are kept current incrementally:
+
+* place_order() queues the new order's deltas as a ``rollups.record_order``
+  task in its own transaction, so they are applied once, shortly after
+  checkout, by a task worker (see tasks.py),
+* an order moving into or out of ``cancelled`` (or being deleted) is
+  subtracted or added back by the Order signal handlers.
+
+Lines count toward the category their product had when the order was
+placed (OrderItem.category), so recategorizing a product moves neither its
+past sales nor a later cancellation of them. Lines saved without one (built
+in the admin) fall back to the product's current category.
+
+Deltas only ever add up, so it makes no difference whether an order is
+cancelled before or after its queued deltas are applied.
+
+Each table is updated with a fixed two statements however many lines the
+order has: a bulk INSERT that ignores conflicts, which makes sure every
+touched row exists, then one UPDATE adding the deltas with F() expressions
+picked per row by Case/When. Concurrent orders therefore never overwrite
+each other's totals.
+
+Writes that skip the ORM signals (queryset.update(), raw SQL, orders built
+line by line in the admin) are repaired by ``manage.py rebuild_sales_rollups``.
+A rebuild counts every order of its days, so in the same transaction it
+marks the ``rollups.record_order`` tasks still queued for those days done.
+A worker running one of them at that moment loses its lock and rolls back.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.utils import timezone
+
+from .exports import filter_orders
+from .tasks import enqueue, task
+from .models import (
+    Phone, Accessories, Order, OrderItem, DailySales, DailyProductSales, DailyCategorySales, Task,
+)
+
+
+EXCLUDED_STATUSES = ('cancelled',)
+
+LINE_CATEGORY = Coalesce('category_id', 'phone__category_id', 'accessory__category_id')
+
+
+def counts_toward_sales(status):
+    return status not in EXCLUDED_STATUSES
+
+
+def _add_deltas(model, keys, deltas):
+    """Add {key: {field: delta}} to the rows of model identified by key dicts"""
+    if not deltas:
+        return
+    model.objects.bulk_create([model(**dict(key)) for key in deltas], ignore_conflicts=True)
+    rows = Q()
+    for key in deltas:
+        rows |= Q(**dict(key))
+    updates = {}
+    for field in keys:
+        output = DecimalField() if isinstance(next(iter(deltas.values()))[field], Decimal) else IntegerField()
+        updates[field] = F(field) + Case(
+            *[When(Q(**dict(key)), then=Value(values[field])) for key, values in deltas.items()],
+            default=Value(0),
+            output_field=output,
+        )
+    model.objects.filter(rows).update(**updates)
+
+
+def record_lines(day, order_delta, lines, sign=1):
+    """
+    Apply one order to the rollups.
+
+    order_delta is (gross, discount, net) of the order; lines are
+    (item_type, product_id, category_id, quantity, line_total) tuples.
+    sign is 1 to add the order and -1 to take it back out.
+    """
+    gross, discount, net = order_delta
+    units = sum(quantity for _, _, _, quantity, _ in lines)
+    _add_deltas(DailySales, ['order_count', 'unit_count', 'gross_revenue', 'discount_total', 'net_revenue'], {
+        (('date', day),): {
+            'order_count': sign,
+            'unit_count': sign * units,
+            'gross_revenue': sign * gross,
+            'discount_total': sign * discount,
+            'net_revenue': sign * net,
+        },
+    })
+
+    products = defaultdict(lambda: {'unit_count': 0, 'revenue': Decimal('0.00')})
+    categories = defaultdict(lambda: {'unit_count': 0, 'revenue': Decimal('0.00')})
+    for item_type, product_id, category_id, quantity, line_total in lines:
+        targets = [products[(('date', day), ('item_type', item_type), ('product_id', product_id))]]
+        if category_id:
+            targets.append(categories[(('date', day), ('category_id', category_id))])
+        for totals in targets:
+            totals['unit_count'] += sign * quantity
+            totals['revenue'] += sign * line_total
+    _add_deltas(DailyProductSales, ['unit_count', 'revenue'], products)
+    _add_deltas(DailyCategorySales, ['unit_count', 'revenue'], categories)
+
+
+def queue_order(order, lines):
+    """Queue a just-created order's rollup lines, in the order's transaction"""
+    return enqueue('rollups.record_order', {
+        'day': order_day(order),
+        'totals': [order.total_amount, order.discount, order.final_amount],
+        'lines': lines,
+    })
+
+
+@task('rollups.record_order')
+def record_order(day, totals, lines):
+    """Task handler for queue_order(); the payload arrives as JSON"""
+    record_lines(datetime.date.fromisoformat(day), [Decimal(value) for value in totals], [
+        (item_type, product_id, category_id, quantity, Decimal(line_total))
+        for item_type, product_id, category_id, quantity, line_total in lines
+    ])
+
+
+def order_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def order_lines(order):
+    """Rollup lines of a saved order, under the categories recorded when it was placed"""
+    return [
+        (row['item_type'], row['phone_id'] or row['accessory_id'], row['line_category'],
+         row['quantity'], row['total_price'])
+        for row in OrderItem.objects.filter(order=order).values(
+            'item_type', 'phone_id', 'accessory_id', 'quantity', 'total_price', line_category=LINE_CATEGORY,
+        )
+        if row['phone_id'] or row['accessory_id']
+    ]
+
+
+def apply_order(order, sign):
+    """Add (sign=1) or remove (sign=-1) a saved order from the rollups"""
+    record_lines(order_day(order), (order.total_amount, order.discount, order.final_amount),
+                 order_lines(order), sign)
+
+
+# ==================== REBUILD ====================
+
+def supersede_queued(date_from=None, date_to=None):
+    """Mark the unapplied rollups.record_order tasks of [date_from, date_to] done; returns how many"""
+    queued = (Task.objects.filter(name=record_order.task_name, status__in=('pending', 'running', 'failed'))
+              .alias(day=Cast(KT('payload__day'), CharField())))
+    # ISO dates compare correctly as text
+    if date_from:
+        queued = queued.filter(day__gte=date_from.isoformat())
+    if date_to:
+        queued = queued.filter(day__lte=date_to.isoformat())
+    # Clearing locked_by makes a worker running one of them discard its deltas
+    return queued.update(
+        status='done', locked_by='', locked_at=None, finished_at=timezone.now())
+
+
+def rebuild(date_from=None, date_to=None):
+    """Recompute the rollups for [date_from, date_to] (inclusive) from the order tables"""
+    with transaction.atomic():
+        # First, so orders whose tasks are dropped are read below
+        supersede_queued(date_from, date_to)
+        return _rebuild(date_from, date_to)
+
+
+def _rebuild(date_from, date_to):
+    tz = timezone.get_current_timezone()
+    orders = filter_orders(Order.objects.exclude(status__in=EXCLUDED_STATUSES), date_from, date_to)
+    items = OrderItem.objects.filter(order__in=orders.values('id'))
+    days = {}
+    if date_from:
+        days['date__gte'] = date_from
+    if date_to:
+        days['date__lte'] = date_to
+
+    daily = {
+        row['day']: row for row in orders.order_by()
+        .values(day=TruncDate('created_at', tzinfo=tz))
+        .annotate(order_count=Count('id'), gross_revenue=Sum('total_amount'),
+                  discount_total=Sum('discount'), net_revenue=Sum('final_amount'))
+    }
+    units = dict(items.order_by()
+                 .values_list(TruncDate('order__created_at', tzinfo=tz))
+                 .annotate(Sum('quantity')))
+    product_rows = (items.order_by()
+                    .filter(Q(phone__isnull=False) | Q(accessory__isnull=False))
+                    .values('item_type', day=TruncDate('order__created_at', tzinfo=tz),
+                            product_id=Coalesce('phone_id', 'accessory_id'))
+                    .annotate(unit_count=Sum('quantity'), revenue=Sum('total_price')))
+    category_rows = (items.order_by()
+                     .annotate(line_category=LINE_CATEGORY)
+                     .filter(line_category__isnull=False)
+                     .values('line_category', day=TruncDate('order__created_at', tzinfo=tz))
+                     .annotate(unit_count=Sum('quantity'), revenue=Sum('total_price')))
+
+    for model in (DailySales, DailyProductSales, DailyCategorySales):
+        model.objects.filter(**days).delete()
+    DailySales.objects.bulk_create([
+        DailySales(date=day, order_count=row['order_count'], unit_count=units.get(day) or 0,
+                   gross_revenue=row['gross_revenue'], discount_total=row['discount_total'],
+                   net_revenue=row['net_revenue'])
+        for day, row in daily.items()
+    ], batch_size=500)
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(date=row['day'], item_type=row['item_type'], product_id=row['product_id'],
+                          unit_count=row['unit_count'], revenue=row['revenue'])
+        for row in product_rows
+    ], batch_size=500)
+    DailyCategorySales.objects.bulk_create([
+        DailyCategorySales(date=row['day'], category_id=row['line_category'],
+                           unit_count=row['unit_count'], revenue=row['revenue'])
+        for row in category_rows
+    ], batch_size=500)
+    return len(daily)
+
+
+# ==================== REPORTS ====================
+
+def sales_summary(date_from, date_to, top=10):
+    """Dashboard data for [date_from, date_to], read from the rollup tables only"""
+    days = list(DailySales.objects.filter(date__range=(date_from, date_to)).order_by('date'))
+    totals = {
+        field: sum((getattr(day, field) for day in days), start)
+        for field, start in (('order_count', 0), ('unit_count', 0), ('gross_revenue', Decimal('0.00')),
+                             ('discount_total', Decimal('0.00')), ('net_revenue', Decimal('0.00')))
+    }
+
+    top_products = list(DailyProductSales.objects
+                        .filter(date__range=(date_from, date_to))
+                        .values('item_type', 'product_id')
+                        .annotate(units=Sum('unit_count'), revenue=Sum('revenue'))
+                        .filter(units__gt=0)
+                        .order_by('-units', '-revenue')[:top])
+    names = {}
+    for item_type, model in (('phone', Phone), ('accessory', Accessories)):
+        ids = [row['product_id'] for row in top_products if row['item_type'] == item_type]
+        if ids:
+            names.update(((item_type, pk), str(obj)) for pk, obj in model.objects.in_bulk(ids).items())
+    for row in top_products:
+        row['name'] = names.get((row['item_type'], row['product_id']),
+                                f"Deleted {row['item_type']} #{row['product_id']}")
+
+    categories = list(DailyCategorySales.objects
+                      .filter(date__range=(date_from, date_to))
+                      .values('category_id', name=F('category__name'))
+                      .annotate(units=Sum('unit_count'), revenue=Sum('revenue'))
+                      .order_by('-revenue'))
+    return {'days': days, 'totals': totals, 'top_products': top_products, 'categories': categories}
@@ -0,0 +1,159 @@
+"""
+Primary/replica database routing.
+
+With replicas configured (PRIME_DB_REPLICAS, see Ecomm/db_profiles.py),
+PrimaryReplicaRouter sends the reads a request makes of the catalog and of
+order history (REPLICA_MODELS) to a replica picked once per request, and
+everything else to ``default``, the primary:
+
+* every write, and every read of the other models (carts, sessions,
+  users, the task outbox...), which are read to be written,
+* reads inside a transaction on the primary, which must see its writes,
+* reads outside a request: management commands and task workers,
+* reads inside ``with use_primary():``,
+* every read of a client that wrote a catalog or order row (checked out,
+  posted a review) in the last PRIME_REPLICA_STICKY_SECONDS, so it reads
+  its own writes while replicas catch up. ReplicaRoutingMiddleware tracks
+  that in a cookie, so it works for anonymous clients and across workers.
+
+Replica lag still shows to other clients, and a page rendered from a
+lagging replica can be cached (see caching.py) until the next write or
+the cache timeout, so replicas should stay well under a second behind.
+
+Locally, any SQLite file can act as a replica of db.sqlite3 and is
+refreshed with ``manage.py sync_replicas``.
+"""
+import contextlib
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+DEFAULT_STICKY_SECONDS = 10
+COOKIE_NAME = 'prime_primary'
+
+# Read-mostly models whose reads replicas may serve, by lowercase name
+REPLICA_MODELS = {
+    'category', 'phone', 'accessories', 'compatibility', 'review', 'searchtoken',
+    'order', 'orderitem', 'dailysales', 'dailyproductsales', 'dailycategorysales',
+}
+
+
+class RoutingState:
+    """How the current request reads: its replica, unless it must use the primary"""
+
+    def __init__(self, replica, pinned=False):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('prime_db_routing', default=None)
+_forced = contextvars.ContextVar('prime_db_use_primary', default=False)
+
+
+def get_replicas():
+    return getattr(settings, 'PRIME_DB_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'PRIME_REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+
+def is_routed(model):
+    return model._meta.app_label == 'prime_accessories' and model._meta.model_name in REPLICA_MODELS
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Read from the primary inside this block"""
+    token = _forced.set(True)
+    try:
+        yield
+    finally:
+        _forced.reset(token)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or state.replica is None or state.pinned or state.wrote
+                or _forced.get() or not is_routed(model)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and is_routed(model):
+            # Read our own writes from here on, and for a while after
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema by replication
+        return db not in get_replicas()
+
+
+# ==================== MIDDLEWARE ====================
+
+class ReplicaRoutingMiddleware:
+    """
+    Pick a replica per request and keep clients that just wrote on the primary.
+
+    The cookie holds the time until which the client reads from the primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        replicas = get_replicas()
+        try:
+            pinned = float(request.COOKIES.get(COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        return _state.set(RoutingState(random.choice(replicas) if replicas else None, pinned))
+
+    def finish(self, response, token):
+        state = _state.get()
+        _state.reset(token)
+        if state.wrote and state.replica is not None:
+            seconds = sticky_seconds()
+            response.set_cookie(COOKIE_NAME, str(int(time.time() + seconds)), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _state.reset(token)
+            raise
+        return self.finish(response, token)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _state.reset(token)
+            raise
+        return self.finish(response, token)
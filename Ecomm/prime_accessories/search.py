@@ -0,0 +1,301 @@
+"""
+Catalog search engine.
+
+Phones and accessories are tokenized into three weighted columns (name,
+brand and body) and stored in an inverted index. Queries match every term
+as a prefix and results come back ranked by relevance.
+
+Two backends ship with the app:
+
+* ``SQLiteFTS5Backend`` keeps the index in an FTS5 virtual table and ranks
+  with bm25. It is the default on SQLite.
+* ``InvertedIndexBackend`` keeps postings in the ``SearchToken`` table and
+  works on any database Django supports.
+
+Set ``PRIME_SEARCH_BACKEND`` to a dotted path to force a backend.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Sum, When
+from django.utils.module_loading import import_string
+
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TOKEN_LENGTH = 64
+DEFAULT_MAX_RESULTS = 1000
+
+# Model name -> index kind (matches the item_type used by the cart)
+KINDS = {
+    'phone': 'phone',
+    'accessories': 'accessory',
+}
+
+# Index kind -> column -> model fields concatenated into that column
+SEARCH_FIELDS = {
+    'phone': {
+        'name': ['name'],
+        'brand': ['brand', 'model'],
+        'body': ['description'],
+    },
+    'accessory': {
+        'name': ['name'],
+        'brand': ['brand', 'accessory_type'],
+        'body': ['description'],
+    },
+}
+
+COLUMN_WEIGHTS = {'name': 10.0, 'brand': 5.0, 'body': 1.0}
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall((text or '').lower())]
+
+
+def get_kind(model):
+    """Return the index kind for a model class or instance"""
+    return KINDS[model._meta.model_name]
+
+
+def get_searchable_models():
+    from .models import Phone, Accessories
+    return [Phone, Accessories]
+
+
+def build_document(obj):
+    """Return the column -> text mapping that gets indexed for obj"""
+    document = {}
+    for column, fields in SEARCH_FIELDS[get_kind(obj)].items():
+        document[column] = ' '.join(str(getattr(obj, field) or '') for field in fields)
+    return document
+
+
+class BaseSearchBackend:
+    """Interface every search backend implements"""
+
+    def index(self, obj):
+        """Add or replace the index entry for obj"""
+        raise NotImplementedError
+
+    def index_many(self, objs):
+        for obj in objs:
+            self.index(obj)
+
+    def remove(self, obj):
+        """Drop the index entry for obj"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Drop every index entry"""
+        raise NotImplementedError
+
+    def search(self, model, query, limit=DEFAULT_MAX_RESULTS, restrict=None):
+        """
+        Return primary keys of model matching query, best match first.
+
+        restrict is an optional queryset of model: only its rows are
+        candidates, so filters are applied before the limit.
+        """
+        raise NotImplementedError
+
+    def rebuild(self, chunk_size=500):
+        """Re-index the whole catalog and return the number of indexed rows"""
+        self.clear()
+        total = 0
+        for model in get_searchable_models():
+            batch = []
+            for obj in model.objects.order_by().iterator(chunk_size=chunk_size):
+                batch.append(obj)
+                if len(batch) >= chunk_size:
+                    self.index_many(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                self.index_many(batch)
+                total += len(batch)
+        return total
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Index stored in an FTS5 virtual table, ranked with bm25"""
+    table = 'prime_accessories_search_fts'
+
+    # rowid is derived from (kind, object_id) so updates and deletes are
+    # rowid lookups instead of scans over the unindexed columns
+    KIND_OFFSETS = {'phone': 0, 'accessory': 1}
+
+    def ensure_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "kind UNINDEXED, object_id UNINDEXED, name, brand, body, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+
+    def rebuild(self, chunk_size=500):
+        self.ensure_table()
+        return super().rebuild(chunk_size=chunk_size)
+
+    def _rowid(self, kind, object_id):
+        return object_id * len(self.KIND_OFFSETS) + self.KIND_OFFSETS[kind]
+
+    def _row(self, obj):
+        kind = get_kind(obj)
+        document = build_document(obj)
+        return (self._rowid(kind, obj.pk), kind, obj.pk,
+                document['name'], document['brand'], document['body'])
+
+    def index(self, obj):
+        self.index_many([obj])
+
+    def index_many(self, objs):
+        rows = [self._row(obj) for obj in objs]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (rowid, kind, object_id, name, brand, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove(self, obj):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [self._rowid(get_kind(obj), obj.pk)],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, model, query, limit=DEFAULT_MAX_RESULTS, restrict=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Tokens are pure word characters, so quoting them is enough to
+        # keep FTS5 query syntax out of user input
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(COLUMN_WEIGHTS[column]) for column in ('name', 'brand', 'body'))
+        where, params = '', []
+        if restrict is not None:
+            sql, params = restrict.order_by().values('pk').query.get_compiler(connection=connection).as_sql()
+            where, params = f"AND object_id IN ({sql}) ", list(params)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT object_id FROM {self.table} "
+                f"WHERE {self.table} MATCH %s AND kind = %s {where}"
+                f"ORDER BY bm25({self.table}, 0, 0, {weights}) LIMIT %s",
+                [match, get_kind(model), *params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """Portable index stored as SearchToken postings"""
+
+    def _tokens(self, obj):
+        from .models import SearchToken
+        kind = get_kind(obj)
+        weights = Counter()
+        for column, text in build_document(obj).items():
+            for token in tokenize(text):
+                weights[token] += COLUMN_WEIGHTS[column]
+        return [
+            SearchToken(kind=kind, object_id=obj.pk, token=token, weight=weight)
+            for token, weight in weights.items()
+        ]
+
+    def index(self, obj):
+        self.index_many([obj])
+
+    def index_many(self, objs):
+        from .models import SearchToken
+        objs = list(objs)
+        if not objs:
+            return
+        by_kind = {}
+        for obj in objs:
+            by_kind.setdefault(get_kind(obj), []).append(obj.pk)
+        for kind, ids in by_kind.items():
+            SearchToken.objects.filter(kind=kind, object_id__in=ids).delete()
+        SearchToken.objects.bulk_create(
+            [token for obj in objs for token in self._tokens(obj)],
+            batch_size=1000,
+        )
+
+    def remove(self, obj):
+        from .models import SearchToken
+        SearchToken.objects.filter(kind=get_kind(obj), object_id=obj.pk).delete()
+
+    def clear(self):
+        from .models import SearchToken
+        SearchToken.objects.all().delete()
+
+    def search(self, model, query, limit=DEFAULT_MAX_RESULTS, restrict=None):
+        from .models import SearchToken
+        terms = tokenize(query)
+        if not terms:
+            return []
+        kind = get_kind(model)
+        scores = None
+        # Every term must match (as a prefix) for an object to be returned
+        for term in dict.fromkeys(terms):
+            rows = SearchToken.objects.filter(kind=kind, token__startswith=term)
+            if restrict is not None:
+                rows = rows.filter(object_id__in=restrict.order_by().values('pk'))
+            rows = (rows
+                    .values('object_id')
+                    .annotate(score=Sum('weight'))
+                    .values_list('object_id', 'score'))
+            term_scores = dict(rows)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pk: scores[pk] + score for pk, score in term_scores.items() if pk in scores}
+            if not scores:
+                return []
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], pk))
+        return ranked[:limit]
+
+
+_backend = None
+
+
+def get_backend():
+    """Return the configured search backend instance"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'PRIME_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        elif connection.vendor == 'sqlite':
+            backend_class = SQLiteFTS5Backend
+        else:
+            backend_class = InvertedIndexBackend
+        _backend = backend_class()
+    return _backend
+
+
+def search_queryset(queryset, query):
+    """
+    Restrict queryset to search matches, ordered by relevance.
+
+    Filter queryset before searching it: PRIME_SEARCH_MAX_RESULTS caps the
+    matches among its rows, so filters added afterwards only narrow the
+    capped list.
+    """
+    limit = getattr(settings, 'PRIME_SEARCH_MAX_RESULTS', DEFAULT_MAX_RESULTS)
+    restrict = queryset if queryset.query.where else None
+    ids = get_backend().search(queryset.model, query, limit=limit, restrict=restrict)
+    if not ids:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(ranking)
@@ -0,0 +1,308 @@
+"""
+Synthetic catalog, order and review data for benchmarks.
+
+CatalogSeeder fills an empty database with production-like volumes (by
+default 100k phones, 200k accessories with ~20 compatible phones each,
+1M orders and 5M reviews) so run_benchmarks measures the query plans real
+traffic would get. Generation is deterministic for a given seed, so two
+runs against freshly seeded databases are comparable.
+
+Rows are written with bulk_create in batches of one transaction each, which
+skips save() and signals; the derived data the signals would maintain
+(normalized specs, rating aggregates, search index, sales rollups, cache
+generations) is rebuilt once at the end.
+"""
+import contextlib
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, ratings, rollups, specs
+from .models import Phone, Accessories, Category, Compatibility, Order, OrderItem, Review
+from .search import get_backend
+
+
+SEED_PREFIX = 'SEED-'
+
+DEFAULT_COUNTS = {
+    'users': 50_000,
+    'phones': 100_000,
+    'accessories': 200_000,
+    'orders': 1_000_000,
+    'reviews': 5_000_000,
+}
+DEFAULT_COMPATIBLE_PHONES = 20
+DEFAULT_DAYS = 365
+SEED_STOCK = 1_000_000_000
+
+CATEGORIES = [
+    'Flagship Phones', 'Mid-range Phones', 'Budget Phones', 'Refurbished Phones', 'Foldables',
+    'Cases', 'Chargers', 'Cables', 'Screen Protectors', 'Audio', 'Power Banks', 'Mounts', 'Wearables',
+]
+
+PHONE_BRANDS = {
+    'Apple': ['iPhone'],
+    'Samsung': ['Galaxy S', 'Galaxy A', 'Galaxy Z'],
+    'Google': ['Pixel'],
+    'OnePlus': ['OnePlus', 'Nord'],
+    'Xiaomi': ['Redmi Note', 'Xiaomi'],
+    'Motorola': ['Moto G', 'Edge'],
+    'Sony': ['Xperia'],
+    'Nokia': ['G'],
+}
+PROCESSORS = ['Snapdragon 8 Gen 3', 'Snapdragon 7 Gen 1', 'A17 Pro', 'A16 Bionic', 'Tensor G3',
+              'Dimensity 9200', 'Exynos 2400', 'Helio G99']
+RAM = ['3GB', '4GB', '6GB', '8GB', '12GB', '16GB']
+STORAGE = ['32GB', '64GB', '128GB', '256GB', '512GB', '1TB']
+DISPLAYS = ['5.8 inches', '6.1 inches', '6.4 inches', '6.7 inches', '6.8 inches', '7.6 inches']
+CAMERAS = ['12MP', '48MP + 12MP', '50MP + 12MP + 10MP', '64MP', '108MP + 12MP', '200MP + 12MP']
+OS = ['iOS 17', 'Android 14', 'Android 13']
+COLORS = ['Black', 'White', 'Blue', 'Green', 'Silver', 'Gold', 'Purple', 'Red']
+CONDITIONS = ['new'] * 7 + ['refurbished'] * 2 + ['used']
+
+ACCESSORY_TYPES = {
+    'Case': (['Spigen', 'OtterBox', 'Caseology', 'ESR'], ['Clear', 'Rugged', 'Slim', 'Leather', 'Wallet']),
+    'Charger': (['Anker', 'Belkin', 'Ugreen', 'Samsung'], ['USB-C 20W', 'USB-C 65W', 'MagSafe', 'Wireless']),
+    'Cable': (['Anker', 'Belkin', 'Ugreen'], ['USB-C to USB-C', 'USB-C to Lightning', 'Braided']),
+    'Screen Protector': (['ZAGG', 'Spigen', 'ESR'], ['Tempered Glass', 'Privacy', 'Matte']),
+    'Earbuds': (['Sony', 'Jabra', 'Samsung', 'Apple'], ['Wireless', 'Noise Cancelling', 'Sport']),
+    'Power Bank': (['Anker', 'Mophie', 'Xiaomi'], ['10000mAh', '20000mAh', 'MagSafe']),
+    'Mount': (['iOttie', 'Belkin'], ['Car Vent', 'Dashboard', 'Bike']),
+}
+MATERIALS = ['Silicone', 'TPU', 'Polycarbonate', 'Leather', 'Aluminium', 'Glass', 'Nylon']
+
+STATUSES = ['delivered'] * 12 + ['shipped'] * 3 + ['processing'] * 2 + ['pending'] * 2 + ['cancelled']
+RATINGS = [5] * 45 + [4] * 30 + [3] * 12 + [2] * 6 + [1] * 7
+REVIEW_TITLES = ['Great value', 'Works as expected', 'Not bad', 'Disappointed', 'Excellent quality',
+                 'Fast delivery', 'Would buy again', 'Battery could be better']
+REVIEW_WORDS = ('solid build battery screen camera fast charging fits perfectly grip price '
+                'quality shipping sound bright display sturdy light comfortable').split()
+
+
+class AlreadySeeded(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*models):
+    """
+    Let bulk_create keep the created_at/updated_at values set on instances.
+
+    This flips the auto_now flags on the model fields themselves, process
+    wide, so it is only for the seeding command.
+    """
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class CatalogSeeder:
+    """Generate seed data in batches; report(phase, done, total, elapsed) tracks progress"""
+
+    def __init__(self, seed=42, batch_size=5000, days=DEFAULT_DAYS,
+                 compatible_phones=DEFAULT_COMPATIBLE_PHONES, report=None):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.days = days
+        self.compatible_phones = compatible_phones
+        self.report = report or (lambda phase, done, total, elapsed: None)
+        self.now = timezone.now()
+        self.categories = {}
+        self.user_ids = []
+        self.phone_prices = {}
+        self.accessory_prices = {}
+        self.product_categories = {}
+        self.product_ids = None
+
+    def run(self, users, phones, accessories, orders, reviews):
+        if Phone.objects.filter(sku__startswith=SEED_PREFIX).exists():
+            raise AlreadySeeded("The database already holds seed data; seed a fresh database")
+        timings = {}
+        for phase, count, step in (
+            ('users', users, self.seed_users),
+            ('phones', phones, self.seed_phones),
+            ('accessories', accessories, self.seed_accessories),
+            ('orders', orders, self.seed_orders),
+            ('reviews', reviews, self.seed_reviews),
+        ):
+            started = time.perf_counter()
+            self.in_batches(phase, count, step)
+            timings[phase] = time.perf_counter() - started
+        started = time.perf_counter()
+        self.finish()
+        timings['derived data'] = time.perf_counter() - started
+        return timings
+
+    def in_batches(self, phase, count, step):
+        started = time.perf_counter()
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            with transaction.atomic(), explicit_timestamps(Order, Review):
+                step(offset, size)
+            self.report(phase, offset + size, count, time.perf_counter() - started)
+
+    def past(self):
+        """A random moment in the last self.days days"""
+        return self.now - datetime.timedelta(seconds=self.rng.randrange(self.days * 86400))
+
+    def category_id(self, name):
+        if not self.categories:
+            Category.objects.bulk_create([Category(name=name) for name in CATEGORIES], ignore_conflicts=True)
+            self.categories = dict(Category.objects.filter(name__in=CATEGORIES).values_list('name', 'id'))
+        return self.categories[name]
+
+    # ==================== ROWS ====================
+
+    def seed_users(self, offset, size):
+        users = User.objects.bulk_create([
+            # "!" marks an unusable password, so no hashing is needed
+            User(username=f'seed-user-{n}', email=f'seed-user-{n}@example.com', password='!')
+            for n in range(offset, offset + size)
+        ])
+        self.user_ids += [user.pk for user in users]
+
+    def seed_phones(self, offset, size):
+        rng = self.rng
+        rows = []
+        for n in range(offset, offset + size):
+            brand = rng.choice(list(PHONE_BRANDS))
+            series = rng.choice(PHONE_BRANDS[brand])
+            price = Decimal(rng.randrange(9900, 199900)) / 100
+            tier = ('Flagship Phones' if price >= 900 else 'Mid-range Phones' if price >= 400 else 'Budget Phones')
+            condition = rng.choice(CONDITIONS)
+            phone = Phone(
+                sku=f'{SEED_PREFIX}PH-{n}', name=f'{brand} {series} {n % 40 + 1}', brand=brand,
+                model=f'{brand[:2].upper()}-{n}',
+                description=f'{series} with {rng.choice(REVIEW_WORDS)} {rng.choice(REVIEW_WORDS)} and a '
+                            f'{rng.choice(REVIEW_WORDS)} camera',
+                price=price, stock=SEED_STOCK, processor=rng.choice(PROCESSORS), ram=rng.choice(RAM),
+                storage=rng.choice(STORAGE), display_size=rng.choice(DISPLAYS), camera_mp=rng.choice(CAMERAS),
+                battery_mah=rng.randrange(3000, 6000, 100), os='iOS 17' if brand == 'Apple' else rng.choice(OS[1:]),
+                condition=condition, color=rng.choice(COLORS),
+                category_id=self.category_id('Refurbished Phones' if condition == 'refurbished' else tier),
+            )
+            rows.append(specs.normalize_phone(phone))
+        for phone in Phone.objects.bulk_create(rows):
+            self.phone_prices[phone.pk] = phone.price
+            self.product_categories['phone', phone.pk] = phone.category_id
+
+    def seed_accessories(self, offset, size):
+        rng = self.rng
+        rows = []
+        for n in range(offset, offset + size):
+            accessory_type = rng.choice(list(ACCESSORY_TYPES))
+            brands, styles = ACCESSORY_TYPES[accessory_type]
+            brand = rng.choice(brands)
+            rows.append(Accessories(
+                sku=f'{SEED_PREFIX}AC-{n}', name=f'{brand} {rng.choice(styles)} {accessory_type} {n % 50 + 1}',
+                brand=brand, description=f'{rng.choice(styles)} {accessory_type.lower()}, {rng.choice(REVIEW_WORDS)}',
+                price=Decimal(rng.randrange(499, 14999)) / 100, stock=SEED_STOCK, accessory_type=accessory_type,
+                color=rng.choice(COLORS), material=rng.choice(MATERIALS),
+                category_id=self.category_id({
+                    'Case': 'Cases', 'Charger': 'Chargers', 'Cable': 'Cables',
+                    'Screen Protector': 'Screen Protectors', 'Earbuds': 'Audio',
+                    'Power Bank': 'Power Banks', 'Mount': 'Mounts',
+                }[accessory_type]),
+            ))
+        accessories = Accessories.objects.bulk_create(rows)
+        for accessory in accessories:
+            self.accessory_prices[accessory.pk] = accessory.price
+            self.product_categories['accessory', accessory.pk] = accessory.category_id
+
+        # Dense compatibility: each accessory fits a run of neighbouring
+        # phones, which keeps rows for one model clustered like real data
+        phone_ids = list(self.phone_prices)
+        if not phone_ids:
+            return
+        links = []
+        for accessory in accessories:
+            width = min(len(phone_ids), self.compatible_phones)
+            start = rng.randrange(len(phone_ids) - width + 1)
+            links += [Compatibility(accessory_id=accessory.pk, phone_id=phone_id,
+                                    accessory_type=accessory.accessory_type, price=accessory.price)
+                      for phone_id in phone_ids[start:start + width]]
+        Compatibility.objects.bulk_create(links, batch_size=self.batch_size)
+
+    def seed_orders(self, offset, size):
+        rng = self.rng
+        orders = []
+        lines = []
+        for n in range(offset, offset + size):
+            created = self.past()
+            items = []
+            total = Decimal('0.00')
+            for _ in range(rng.choice((1, 1, 2, 2, 3, 4))):
+                item_type, product_id = self.random_product()
+                prices = self.phone_prices if item_type == 'phone' else self.accessory_prices
+                quantity = rng.choice((1, 1, 1, 2, 3))
+                line_total = prices[product_id] * quantity
+                total += line_total
+                items.append(OrderItem(
+                    item_type=item_type,
+                    phone_id=product_id if item_type == 'phone' else None,
+                    accessory_id=product_id if item_type == 'accessory' else None,
+                    category_id=self.product_categories[item_type, product_id],
+                    quantity=quantity, unit_price=prices[product_id], total_price=line_total,
+                ))
+            discount = Decimal(rng.choice((0, 0, 0, 5, 10, 25)))
+            discount = min(discount, total)
+            orders.append(Order(
+                customer_id=rng.choice(self.user_ids), order_number=f'{SEED_PREFIX}{n}',
+                total_amount=total, discount=discount, final_amount=total - discount,
+                status=rng.choice(STATUSES), payment_status='completed', shipping_address='1 Seed Street',
+                created_at=created, updated_at=created,
+            ))
+            lines.append(items)
+        for order, items in zip(Order.objects.bulk_create(orders), lines):
+            for item in items:
+                item.order_id = order.pk
+        OrderItem.objects.bulk_create([item for items in lines for item in items])
+
+    def random_product(self):
+        """(item_type, pk) of a seeded product; 70% of picks are accessories"""
+        if self.product_ids is None:
+            self.product_ids = (list(self.phone_prices), list(self.accessory_prices))
+        phone_ids, accessory_ids = self.product_ids
+        if accessory_ids and (not phone_ids or self.rng.random() < 0.7):
+            return 'accessory', self.rng.choice(accessory_ids)
+        return 'phone', self.rng.choice(phone_ids)
+
+    def seed_reviews(self, offset, size):
+        rng = self.rng
+        reviews = []
+        for _ in range(size):
+            item_type, product_id = self.random_product()
+            created = self.past()
+            reviews.append(Review(
+                phone_id=product_id if item_type == 'phone' else None,
+                accessory_id=product_id if item_type == 'accessory' else None,
+                customer_id=rng.choice(self.user_ids), rating=rng.choice(RATINGS),
+                title=rng.choice(REVIEW_TITLES),
+                review_text=' '.join(rng.choices(REVIEW_WORDS, k=rng.randrange(5, 30))),
+                is_verified_purchase=rng.random() < 0.6, helpful_count=rng.randrange(0, 20),
+                created_at=created, updated_at=created,
+            ))
+        Review.objects.bulk_create(reviews)
+
+    # ==================== DERIVED DATA ====================
+
+    def finish(self):
+        """Rebuild what the skipped signals would have maintained"""
+        with transaction.atomic():
+            ratings.reconcile()
+        with transaction.atomic():
+            get_backend().rebuild(chunk_size=self.batch_size)
+        rollups.rebuild()
+        caching.bump('catalog', 'phone:list', 'accessory:list')
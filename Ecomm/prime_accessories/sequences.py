@@ -0,0 +1,95 @@
+"""
+Block-allocating sequences for unique, human-readable numbers.
+
+Each process reserves a block of values with a single conditional UPDATE on
+its Sequence row and then hands them out from memory, so the database is
+touched once per ``block_size`` numbers. Values are unique across processes
+and threads but only roughly ordered, and a process that exits leaves the
+rest of its block unused.
+
+A block reserved inside the caller's transaction is only kept once that
+transaction commits: until then just its first value is handed out, since
+a rollback returns the whole block to the pool. The Sequence row also stays
+locked until the caller commits, so reserve outside transactions where
+possible (as checkout does).
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Sequence
+
+
+DEFAULT_BLOCK_SIZE = 50
+
+
+class BlockSequence:
+    def __init__(self, name, block_size=DEFAULT_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def _reserve_block(self):
+        with transaction.atomic():
+            updated = (Sequence.objects
+                       .filter(name=self.name)
+                       .update(next_value=F('next_value') + self.block_size))
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        Sequence.objects.create(name=self.name, next_value=1 + self.block_size)
+                except IntegrityError:
+                    # Another process created the row first
+                    (Sequence.objects
+                     .filter(name=self.name)
+                     .update(next_value=F('next_value') + self.block_size))
+            end = Sequence.objects.filter(name=self.name).values_list('next_value', flat=True).get()
+        return end - self.block_size, end
+
+    def next_value(self):
+        with self._lock:
+            if self._next >= self._end:
+                start, end = self._reserve_block()
+                if in_caller_transaction():
+                    transaction.on_commit(lambda: self._keep_block(start + 1, end))
+                    return start
+                self._next, self._end = start, end
+            value = self._next
+            self._next += 1
+            return value
+
+    def _keep_block(self, start, end):
+        with self._lock:
+            # Another block may have been reserved meanwhile; this one's
+            # remainder is then left unused
+            if self._next >= self._end:
+                self._next, self._end = start, end
+
+
+def in_caller_transaction():
+    # The test the durable=True flag of atomic() makes: TestCase's own
+    # wrapping blocks don't count
+    blocks = transaction.get_connection().atomic_blocks
+    return bool(blocks) and not blocks[-1]._from_testcase
+
+
+_order_numbers = None
+_order_numbers_lock = threading.Lock()
+
+
+def get_order_number_sequence():
+    global _order_numbers
+    with _order_numbers_lock:
+        if _order_numbers is None:
+            block_size = getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+            _order_numbers = BlockSequence('order_number', block_size)
+        return _order_numbers
+
+
+def next_order_number(user):
+    """Return a new unique order number for user"""
+    return f"ORD-{user.id}-{get_order_number_sequence().next_value()}"
@@ -0,0 +1,206 @@
+"""
+Session engine for cart-heavy traffic.
+
+SESSION_ENGINE = 'prime_accessories.session_backend' keeps sessions in the
+PRIME_SESSION_CACHE cache, with django_session as the fallback copy that
+survives evictions and restarts. Compared with Django's cached_db engine:
+
+* a request whose session didn't change writes nothing. SessionMiddleware
+  saves whenever a key was assigned, even to its old value; this store
+  compares the serialized data with what it loaded and skips the write,
+* the cache holds the session as compact JSON, unsigned and uncompressed,
+  so a read costs a cache GET and a json.loads; the database copy keeps
+  Django's signed encoding, so sessions carry over between engines,
+* PRIME_SESSION_WRITE_MODE picks when a changed session reaches the
+  database. ``through`` writes it in the request, like cached_db.
+  ``behind`` writes the cache in the request and the database at most once
+  per PRIME_SESSION_WRITE_BEHIND_SECONDS per session. A change deferred
+  that way queues one ``sessions.flush`` task (see tasks.py) that writes
+  the session's latest cached copy when the window ends; an eviction
+  before then loses the deferred changes. New sessions, logins, logouts
+  and expiry changes are always written in the request, so an eviction
+  never signs anyone in or out.
+
+The cart itself lives in CartItem rows (see carts.py), so shopping only
+writes a session when it creates one. Each server process has its own
+locmem cache, so with more than one process the sessions cache must be
+shared (SESSION_CACHE_BACKEND=redis), or a process may serve a session
+another one has changed or logged out. The task workers flushing
+write-behind sessions are other processes too.
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+
+from .tasks import enqueue, task
+
+
+logger = logging.getLogger('django.contrib.sessions')
+
+KEY_PREFIX = 'prime.session:'
+# Set while a session has changes the database copy lacks and a flush is queued
+DIRTY_KEY_PREFIX = 'prime.session.dirty:'
+WRITE_MODES = ('through', 'behind')
+DEFAULT_WRITE_BEHIND_SECONDS = 60
+# Keys whose changes are never deferred: the user signed in and the expiry
+THROUGH_KEYS = (SESSION_KEY, BACKEND_SESSION_KEY, HASH_SESSION_KEY, '_session_expiry')
+
+
+class CompactJSONSerializer:
+    """JSON without whitespace and with sorted keys, so equal sessions serialize to equal bytes"""
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+def write_mode():
+    mode = getattr(settings, 'PRIME_SESSION_WRITE_MODE', 'through')
+    if mode not in WRITE_MODES:
+        raise ValueError(f"PRIME_SESSION_WRITE_MODE must be one of {', '.join(WRITE_MODES)}, not {mode!r}")
+    return mode
+
+
+def write_behind_seconds():
+    return getattr(settings, 'PRIME_SESSION_WRITE_BEHIND_SECONDS', DEFAULT_WRITE_BEHIND_SECONDS)
+
+
+class SessionStore(DBStore):
+    cache_key_prefix = KEY_PREFIX
+    payload_serializer = CompactJSONSerializer()
+
+    def __init__(self, session_key=None):
+        self._cache = caches[getattr(settings, 'PRIME_SESSION_CACHE', 'sessions')]
+        # The payload last read or written, and when the database copy was
+        self._stored_payload = None
+        self._db_saved_at = 0.0
+        super().__init__(session_key)
+
+    @property
+    def cache_key(self):
+        return self.cache_key_prefix + self._get_or_create_session_key()
+
+    def _cache_set(self, payload, **expiry):
+        try:
+            self._cache.set(self.cache_key, (payload, self._db_saved_at), self.get_expiry_age(**expiry))
+        except Exception:
+            logger.exception("Error saving to cache (%s)", self._cache)
+
+    def load(self):
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends reject malformed keys; treat as a miss
+            entry = None
+        if entry is not None:
+            self._stored_payload, self._db_saved_at = entry
+            return self.payload_serializer.loads(self._stored_payload)
+
+        stored = self._get_session_from_db()
+        if not stored:
+            self._stored_payload = None
+            return {}
+        data = self.decode(stored.session_data)
+        self._stored_payload = self.payload_serializer.dumps(data)
+        self._db_saved_at = time.time()
+        # Loading the expiry from the session would load it again
+        self._cache_set(self._stored_payload, expiry=stored.expire_date)
+        return data
+
+    def exists(self, session_key):
+        if session_key and (self.cache_key_prefix + session_key) in self._cache:
+            return True
+        return super().exists(session_key)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        payload = self.payload_serializer.dumps(data)
+        if not must_create and payload == self._stored_payload:
+            # Unchanged since it was read: nothing to write
+            return
+        now = time.time()
+        if must_create or write_mode() == 'through' or self._must_write_through(data, now):
+            super().save(must_create)
+            self._db_saved_at = now
+        else:
+            self._defer(now)
+        self._stored_payload = payload
+        self._cache_set(payload)
+
+    def _must_write_through(self, data, now):
+        if now - self._db_saved_at >= write_behind_seconds() or self._stored_payload is None:
+            return True
+        stored = self.payload_serializer.loads(self._stored_payload)
+        return any(stored.get(key) != data.get(key) for key in THROUGH_KEYS)
+
+    def _defer(self, now):
+        """Queue one flush for the end of the write-behind window, unless one is queued"""
+        delay = max(0, write_behind_seconds() - (now - self._db_saved_at))
+        try:
+            # The marker outlives the flush a little, in case the flush is lost
+            marked = self._cache.add(DIRTY_KEY_PREFIX + self.session_key, True, delay + write_behind_seconds())
+        except Exception:
+            logger.exception("Error saving to cache (%s)", self._cache)
+            marked = True
+        if marked:
+            enqueue('sessions.flush', {'session_key': self.session_key}, delay=delay)
+
+    def write_deferred(self):
+        """Write the session's cached copy to the database; returns False when there is none"""
+        self._cache.delete(DIRTY_KEY_PREFIX + self.session_key)
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception:
+            entry = None
+        if entry is None:
+            # Evicted or deleted: there is nothing newer than the database copy
+            return False
+        self._stored_payload, self._db_saved_at = entry
+        self._session_cache = self.payload_serializer.loads(self._stored_payload)
+        try:
+            super().save()
+        except UpdateError:
+            # Deleted from the database since, by a logout or clearsessions
+            return False
+        return True
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._cache.delete(self.cache_key_prefix + session_key)
+        self._cache.delete(DIRTY_KEY_PREFIX + session_key)
+
+    # Async views reach the same code through a thread, like carts.py's
+    # helpers, so both paths see the same cache entry
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def aexists(self, session_key):
+        return await sync_to_async(self.exists)(session_key)
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
+
+
+@task('sessions.flush')
+def flush_session(session_key):
+    """Task handler: write a write-behind session's deferred changes to the database"""
+    SessionStore(session_key).write_deferred()
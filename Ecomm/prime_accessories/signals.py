@@ -0,0 +1,243 @@
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import DEFERRED
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import caching, carts, compatibility, instrumentation, inventory, ratings, rollups, search
+from .models import Phone, Accessories, Category, Compatibility, Order, Review
+
+
+# ==================== SEARCH INDEX ====================
+
+@receiver(post_save, sender=Phone)
+@receiver(post_save, sender=Accessories)
+def index_catalog_item(sender, instance, raw=False, **kwargs):
+    """Keep the search index in sync with catalog writes"""
+    if raw:
+        return
+    search.get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Phone)
+@receiver(post_delete, sender=Accessories)
+def unindex_catalog_item(sender, instance, **kwargs):
+    search.get_backend().remove(instance)
+
+
+# ==================== RATING AGGREGATES ====================
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    # Read __dict__ directly so deferred fields don't trigger a query per row
+    values = instance.__dict__
+    if all(values.get(name, DEFERRED) is not DEFERRED for name in ('rating', 'phone_id', 'accessory_id')):
+        instance._rating_snapshot = (ratings.review_target(instance), instance.rating)
+    else:
+        instance._rating_snapshot = None
+
+
+@receiver(pre_save, sender=Review)
+def load_review_rating(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or instance._rating_snapshot is not None:
+        return
+    old = Review.objects.filter(pk=instance.pk).only('rating', 'phone_id', 'accessory_id').first()
+    instance._rating_snapshot = (ratings.review_target(old), old.rating) if old else (None, 0)
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    target = ratings.review_target(instance)
+    rating = int(instance.rating)
+    old_target, old_rating = instance._rating_snapshot
+    if created or old_target is None:
+        if target:
+            ratings.apply_rating_delta(*target, 1, rating)
+    elif old_target != target:
+        ratings.apply_rating_delta(*old_target, -1, -int(old_rating))
+        if target:
+            ratings.apply_rating_delta(*target, 1, rating)
+    elif rating != int(old_rating):
+        ratings.apply_rating_delta(*target, 0, rating - int(old_rating))
+    instance._rating_snapshot = (target, rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    if instance._rating_snapshot is None:
+        # Deleted from a deferred load; the row is gone, so reconcile_ratings
+        # has to pick this one up
+        return
+    old_target, old_rating = instance._rating_snapshot
+    if old_target:
+        ratings.apply_rating_delta(*old_target, -1, -int(old_rating))
+
+
+# ==================== CATALOG CACHE ====================
+
+# Phone/Accessories deletions bump on pre_delete, while the compatibility
+# rows that say which other pages mention them still exist. Bumps wait for
+# the commit so a request can't re-cache the old rows in between.
+
+def bump_on_commit(*names):
+    transaction.on_commit(lambda: caching.bump(*names))
+
+
+@receiver(post_save, sender=Phone)
+@receiver(pre_delete, sender=Phone)
+def invalidate_phone(sender, instance, **kwargs):
+    # Accessory pages list the phones they fit
+    accessory_ids = Compatibility.objects.filter(
+        phone_id=instance.pk).values_list('accessory_id', flat=True)
+    bump_on_commit('phone:list', f'phone:{instance.pk}',
+                   *[f'accessory:{pk}' for pk in accessory_ids])
+
+
+@receiver(post_save, sender=Accessories)
+@receiver(pre_delete, sender=Accessories)
+def invalidate_accessory(sender, instance, **kwargs):
+    # Phone pages list their compatible accessories
+    phone_ids = Compatibility.objects.filter(
+        accessory_id=instance.pk).values_list('phone_id', flat=True)
+    bump_on_commit('accessory:list', f'accessory:{instance.pk}',
+                   *[f'phone:{pk}' for pk in phone_ids])
+
+
+@receiver(m2m_changed, sender=Compatibility)
+def invalidate_compatibility(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    through = Compatibility.objects
+    if reverse:
+        # instance is a Phone
+        accessory_ids = pk_set if pk_set else through.filter(phone_id=instance.pk).values_list('accessory_id', flat=True)
+        names = [f'phone:{instance.pk}'] + [f'accessory:{pk}' for pk in accessory_ids]
+    else:
+        phone_ids = pk_set if pk_set else through.filter(accessory_id=instance.pk).values_list('phone_id', flat=True)
+        names = [f'accessory:{instance.pk}'] + [f'phone:{pk}' for pk in phone_ids]
+    bump_on_commit(*names)
+
+
+@receiver(post_save, sender=Compatibility)
+@receiver(post_delete, sender=Compatibility)
+def invalidate_compatibility_row(sender, instance, raw=False, **kwargs):
+    # Rows edited one by one, e.g. from the admin inline
+    if not raw:
+        bump_on_commit(f'phone:{instance.phone_id}', f'accessory:{instance.accessory_id}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, instance, **kwargs):
+    bump_on_commit('catalog')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_item(sender, instance, **kwargs):
+    # Reviews move the product's rating, which list pages show too
+    target = ratings.review_target(instance)
+    if target:
+        item_type, product_id = target
+        bump_on_commit(f'{item_type}:list', f'{item_type}:{product_id}')
+
+
+# ==================== SALES ROLLUPS AND STOCK ====================
+
+# New orders are recorded by checkout.place_order(); these handlers follow
+# an order moving into or out of a status that counts toward sales, and
+# release or sell the stock it holds (see inventory.py)
+
+ORDER_SNAPSHOT_FIELDS = ('status', 'payment_status')
+
+
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._status_snapshot = instance.__dict__.get('status', DEFERRED)
+    instance._payment_snapshot = instance.__dict__.get('payment_status', DEFERRED)
+
+
+@receiver(pre_save, sender=Order)
+def load_order_status(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if DEFERRED in (instance._status_snapshot, instance._payment_snapshot):
+        old = Order.objects.filter(pk=instance.pk).values_list(*ORDER_SNAPSHOT_FIELDS).first() or (None, None)
+        if instance._status_snapshot is DEFERRED:
+            instance._status_snapshot = old[0]
+        if instance._payment_snapshot is DEFERRED:
+            instance._payment_snapshot = old[1]
+
+
+@receiver(post_save, sender=Order)
+def update_rollups_on_status(sender, instance, created, raw=False, **kwargs):
+    old_status, instance._status_snapshot = instance._status_snapshot, instance.status
+    old_payment, instance._payment_snapshot = instance._payment_snapshot, instance.payment_status
+    if raw or created or old_status in (None, DEFERRED):
+        return
+    was_counted = rollups.counts_toward_sales(old_status)
+    if was_counted != rollups.counts_toward_sales(instance.status):
+        rollups.apply_order(instance, -1 if was_counted else 1)
+    if instance.status == 'cancelled' and old_status != 'cancelled':
+        inventory.release_order(instance)
+    elif instance.payment_status == 'completed' and old_payment != 'completed':
+        inventory.confirm_order(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    # pre_delete runs while the order's items still exist
+    status = instance._status_snapshot
+    if status is DEFERRED:
+        status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    if status is not None and rollups.counts_toward_sales(status):
+        rollups.apply_order(instance, -1)
+
+
+# ==================== COMPATIBILITY COPIES ====================
+
+@receiver(post_save, sender=Accessories)
+def sync_compatibility_copies(sender, instance, created, raw=False, **kwargs):
+    """Keep the accessory_type/price copied onto Compatibility rows current"""
+    if raw or created:
+        return
+    (Compatibility.objects
+     .filter(accessory_id=instance.pk)
+     .exclude(accessory_type=instance.accessory_type, price=instance.price)
+     .update(accessory_type=instance.accessory_type, price=instance.price))
+
+
+@receiver(m2m_changed, sender=Compatibility)
+def fill_compatibility_copies(sender, instance, action, reverse, pk_set, **kwargs):
+    # .add() and .set() bulk insert rows with the field defaults
+    if action == 'post_add' and pk_set:
+        compatibility.sync_denormalized(pk_set if reverse else [instance.pk])
+
+
+# ==================== CART ====================
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        carts.merge_session_cart(request, user)
+
+
+# ==================== INSTRUMENTATION ====================
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    instrumentation.install_query_hook(connection)
+
+
+# ==================== SETTINGS ====================
+
+@receiver(setting_changed)
+def reset_search_backend(setting, **kwargs):
+    if setting == 'PRIME_SEARCH_BACKEND':
+        search._backend = None
+    elif setting == 'PRIME_SLOW_REQUEST_LOG_SIZE':
+        instrumentation.registry.reset()
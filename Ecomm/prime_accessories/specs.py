@@ -0,0 +1,108 @@
+"""
+Phone spec normalization.
+
+Phone.ram, storage, display_size and camera_mp are free text as typed by
+staff ("8GB", "1 TB", "6.1 inches", "50MP + 12MP"). Each is parsed into a
+typed, indexed column (ram_gb, storage_gb, display_inches, main_camera_mp)
+so lists can filter and sort on ranges with an index instead of parsing
+strings in a table scan. Unparseable text, or a value outside the
+plausible range of its column (a resolution typed as the display size),
+leaves the column NULL.
+
+Phone.save() normalizes automatically; bulk writes that bypass save() must
+call normalize_phone() on each instance themselves.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+
+NUMBER_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*([a-z"\']*)', re.IGNORECASE)
+
+# Size units in gigabytes
+SIZE_UNITS = {
+    'tb': Decimal(1024),
+    'gb': Decimal(1),
+    'g': Decimal(1),
+    'mb': Decimal(1) / Decimal(1024),
+}
+
+# Plausible values, (exclusive low, inclusive high); every high fits its column
+SIZE_RANGE = (Decimal(0), Decimal('999999.99'))
+INCHES_RANGE = (Decimal(0), Decimal(20))
+MEGAPIXELS_RANGE = (Decimal(0), Decimal(1000))
+
+# raw text field -> normalized column
+SPEC_COLUMNS = {
+    'ram': 'ram_gb',
+    'storage': 'storage_gb',
+    'display_size': 'display_inches',
+    'camera_mp': 'main_camera_mp',
+}
+
+
+def _numbers(text):
+    """Yield (Decimal value, lowercase unit) pairs found in text"""
+    for number, unit in NUMBER_RE.findall(text or ''):
+        try:
+            yield Decimal(number.replace(',', '.')), unit.lower()
+        except InvalidOperation:
+            continue
+
+
+def _plausible(value, bounds):
+    low, high = bounds
+    return value if low < value <= high else None
+
+
+def parse_size_gb(text, default_unit='gb'):
+    """'8GB' -> 8, '1 TB' -> 1024, '512MB' -> 0.5; the first plausible size wins"""
+    for value, unit in _numbers(text):
+        factor = SIZE_UNITS.get(unit or default_unit)
+        if factor is not None:
+            size = _plausible((value * factor).quantize(Decimal('0.01')), SIZE_RANGE)
+            if size is not None:
+                return size
+    return None
+
+
+def parse_inches(text):
+    """'6.1 inches' -> 6.1, '6.7"' -> 6.7, '17 cm' -> 6.69; '2400x1080' -> None"""
+    for value, unit in _numbers(text):
+        if unit in ('', 'in', 'inch', 'inches', '"', "''"):
+            inches = value
+        elif unit == 'cm':
+            inches = value / Decimal('2.54')
+        else:
+            continue
+        inches = _plausible(inches.quantize(Decimal('0.01')), INCHES_RANGE)
+        if inches is not None:
+            return inches
+    return None
+
+
+def parse_megapixels(text):
+    """Main (largest) camera: '50MP + 12MP' -> 50, '108 MP' -> 108"""
+    numbers = list(_numbers(text))
+    values = [value for value, unit in numbers if unit in ('mp', 'megapixel', 'megapixels')]
+    if not values:
+        # Bare numbers ("48") only count when none is marked MP
+        values = [value for value, unit in numbers if not unit]
+    values = [value for value in values if _plausible(value.quantize(Decimal('0.1')), MEGAPIXELS_RANGE)]
+    if not values:
+        return None
+    return max(values).quantize(Decimal('0.1'))
+
+
+PARSERS = {
+    'ram': parse_size_gb,
+    'storage': parse_size_gb,
+    'display_size': parse_inches,
+    'camera_mp': parse_megapixels,
+}
+
+
+def normalize_phone(phone):
+    """Set the normalized spec columns of phone from its raw spec text"""
+    for field, column in SPEC_COLUMNS.items():
+        setattr(phone, column, PARSERS[field](getattr(phone, field)))
+    return phone
@@ -0,0 +1,262 @@
+"""
+Background tasks.
+
+Side effects that don't have to finish before the response (sales rollups,
+emails, reindexing...) are queued as Task rows by enqueue(), inside the
+transaction of the write that needs them. The task commits with the order
+or not at all, so it can neither be lost nor run for a rolled-back order.
+
+``manage.py run_workers`` drains the table with a pool of threads and/or
+processes. A worker claims a batch of due rows by marking them running, then
+runs each handler in a transaction that also marks its row done, so a
+handler that only writes to the database takes effect exactly once. A
+failing handler is retried with exponential backoff until the task's
+max_attempts, after which the row stays ``failed`` for inspection and can be
+retried from the admin. Rows left running by a worker that died are
+reclaimed after PRIME_TASK_LOCK_TIMEOUT seconds, so handlers with external
+effects (sending an email) must tolerate running twice. Workers started by
+run_workers delete done rows PRIME_TASK_RETENTION_DAYS after they finished.
+
+Handlers are registered under a name and receive the JSON payload as
+keyword arguments:
+
+    @task('orders.send_confirmation', max_attempts=3)
+    def send_confirmation(order_id):
+        ...
+
+    enqueue('orders.send_confirmation', {'order_id': order.pk})
+
+A module registering handlers must be imported when the app loads (the
+app's signals module imports rollups, for one), or workers won't know them.
+
+With PRIME_TASKS_EAGER the handler runs inline in enqueue() instead, for
+scripts and tests that want the side effect immediately.
+"""
+import datetime
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+
+logger = logging.getLogger('prime_accessories.tasks')
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_LOCK_TIMEOUT = 300
+# Retry n waits RETRY_BASE_DELAY * 2 ** (n - 1) seconds, jittered, at most RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 3600
+# Tracebacks kept on the row
+MAX_ERROR_LENGTH = 4000
+DEFAULT_RETENTION_DAYS = 7
+# Seconds between a worker's purges of old done tasks, and rows deleted per statement
+PURGE_INTERVAL = 3600
+PURGE_BATCH_SIZE = 1000
+
+_registry = {}
+
+
+class UnknownTask(LookupError):
+    def __init__(self, name):
+        super().__init__(f"No task registered as {name!r}")
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register the decorated function as the handler of name"""
+    def register(func):
+        _registry[name] = (func, max_attempts)
+        func.task_name = name
+        return func
+    return register
+
+
+def get_handler(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTask(name)
+
+
+def is_eager():
+    return getattr(settings, 'PRIME_TASKS_EAGER', False)
+
+
+def lock_timeout():
+    return getattr(settings, 'PRIME_TASK_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+
+
+def retention_days():
+    return getattr(settings, 'PRIME_TASK_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def enqueue(name, payload=None, delay=0):
+    """
+    Queue a task in the current transaction and return its Task row.
+
+    payload is a dict of the handler's keyword arguments, stored as JSON
+    (Decimals and dates become strings, and handlers get them back that
+    way); delay postpones the task by that many seconds.
+    """
+    payload = payload or {}
+    func, max_attempts = get_handler(name)
+    if is_eager():
+        func(**json.loads(json.dumps(payload, cls=DjangoJSONEncoder)))
+        return None
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a task that has failed attempts times"""
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    # Jitter, so tasks failing together don't all come back together
+    return delay * random.uniform(0.5, 1.0)
+
+
+# ==================== WORKER ====================
+
+class LostLock(Exception):
+    """The row was reclaimed while its handler ran; the handler's writes are rolled back"""
+
+
+def purge_done(days):
+    """Delete tasks that finished successfully more than days days ago; returns how many"""
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    old = Task.objects.filter(status='done', finished_at__lt=cutoff)
+    purged = 0
+    # In batches, so a large backlog doesn't hold one long write lock
+    while True:
+        ids = list(old.order_by().values_list('id', flat=True)[:PURGE_BATCH_SIZE])
+        if not ids:
+            return purged
+        purged += Task.objects.filter(id__in=ids).delete()[0]
+
+
+class Worker:
+    """
+    Claims due tasks and runs them; one per thread.
+
+    With retention_days set, the worker also purges old done tasks once
+    every PURGE_INTERVAL seconds.
+    """
+
+    def __init__(self, name=None, batch_size=DEFAULT_BATCH_SIZE, retention_days=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.last_reclaim = 0.0
+        self.last_purge = 0.0
+
+    def claim(self):
+        """Mark up to batch_size due tasks as running for this worker and return them"""
+        now = timezone.now()
+        due = (Task.objects.filter(status='pending', run_after__lte=now)
+               .order_by('run_after', 'id').values('id')[:self.batch_size])
+        claim = {'status': 'running', 'locked_by': self.name, 'locked_at': now, 'attempts': F('attempts') + 1}
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers skip each other's rows instead of queueing on them
+            with transaction.atomic():
+                ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True))
+                Task.objects.filter(id__in=ids).update(**claim)
+        else:
+            # A single UPDATE takes SQLite's write lock up front; a worker
+            # racing for the same rows finds them no longer pending
+            Task.objects.filter(id__in=due, status='pending').update(**claim)
+        return list(Task.objects.filter(status='running', locked_by=self.name, locked_at=now)
+                    .order_by('run_after', 'id'))
+
+    def reclaim_stale(self):
+        """Requeue (or fail, when out of attempts) tasks whose worker stopped responding"""
+        cutoff = timezone.now() - datetime.timedelta(seconds=lock_timeout())
+        stale = Task.objects.filter(status='running', locked_at__lt=cutoff)
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            status='failed', last_error="Worker lost while running the task", finished_at=timezone.now())
+        requeued = stale.update(status='pending', locked_by='', locked_at=None)
+        if failed or requeued:
+            logger.warning("Reclaimed %d stale tasks (%d out of attempts)", failed + requeued, failed)
+        return failed + requeued
+
+    def execute(self, task):
+        try:
+            func, _ = get_handler(task.name)
+            with transaction.atomic():
+                func(**task.payload)
+                done = (Task.objects.filter(pk=task.pk, status='running', locked_by=self.name)
+                        .update(status='done', finished_at=timezone.now(), last_error=''))
+                if not done:
+                    raise LostLock()
+        except LostLock:
+            logger.warning("Task %s was reclaimed while running; its result was discarded", task)
+            return False
+        except Exception as exc:
+            self.fail(task, exc)
+            return False
+        return True
+
+    def fail(self, task, exc):
+        error = traceback.format_exc()[-MAX_ERROR_LENGTH:]
+        owned = Task.objects.filter(pk=task.pk, status='running', locked_by=self.name)
+        if isinstance(exc, UnknownTask) or task.attempts >= task.max_attempts:
+            owned.update(status='failed', last_error=error, finished_at=timezone.now())
+            logger.error("Task %s failed for good after %d attempts: %s", task, task.attempts, exc)
+        else:
+            run_after = timezone.now() + datetime.timedelta(seconds=retry_delay(task.attempts))
+            owned.update(status='pending', last_error=error, run_after=run_after, locked_by='', locked_at=None)
+            logger.warning("Task %s failed (attempt %d of %d), retrying at %s: %s",
+                           task, task.attempts, task.max_attempts, run_after.isoformat(), exc)
+
+    def run_once(self):
+        """Claim and run one batch; returns the number of tasks claimed"""
+        if time.monotonic() - self.last_reclaim >= lock_timeout() / 2:
+            self.reclaim_stale()
+            self.last_reclaim = time.monotonic()
+        if self.retention_days is not None and time.monotonic() - self.last_purge >= PURGE_INTERVAL:
+            purged = purge_done(self.retention_days)
+            if purged:
+                logger.info("Purged %d done tasks older than %d days", purged, self.retention_days)
+            self.last_purge = time.monotonic()
+        tasks = self.claim()
+        for task in tasks:
+            self.execute(task)
+        return len(tasks)
+
+    def run(self, stop, poll_interval=1.0, drain=False):
+        """Run batches until stop is set (or, with drain, until nothing is due)"""
+        while not stop.is_set():
+            try:
+                claimed = self.run_once()
+            except DatabaseError:
+                # e.g. a lock timeout; the claim is retried on the next poll
+                logger.exception("Worker %s could not claim tasks", self.name)
+                claimed = 0
+            finally:
+                # Honour CONN_MAX_AGE and drop broken connections, as requests do;
+                # run_pending() may be called inside a transaction, which must survive
+                if not connection.in_atomic_block:
+                    close_old_connections()
+            if not claimed:
+                if drain:
+                    return
+                stop.wait(poll_interval)
+
+
+def run_pending(batch_size=DEFAULT_BATCH_SIZE):
+    """Run every due task in this thread, then return"""
+    Worker(batch_size=batch_size).run(threading.Event(), drain=True)
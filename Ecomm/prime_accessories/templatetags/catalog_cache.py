@@ -0,0 +1,44 @@
+from django import template
+
+from prime_accessories.caching import get_cache, get_timeout, make_key, object_generation
+
+
+register = template.Library()
+
+
+class CatalogFragmentNode(template.Node):
+    def __init__(self, nodelist, name, obj):
+        self.nodelist = nodelist
+        self.name = name
+        self.obj = obj
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        obj = self.obj.resolve(context)
+        key = make_key(f'fragment:{name}', ['catalog', object_generation(obj)], obj.pk)
+        cache = get_cache()
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, get_timeout())
+        return content
+
+
+@register.tag
+def catalog_fragment(parser, token):
+    """
+    Cache a template fragment for one phone or accessory until it changes.
+
+    Usage::
+
+        {% load catalog_cache %}
+        {% catalog_fragment "card" phone %}
+            ... markup for the product card ...
+        {% endcatalog_fragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag takes a fragment name and an object")
+    nodelist = parser.parse(('endcatalog_fragment',))
+    parser.delete_first_token()
+    return CatalogFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
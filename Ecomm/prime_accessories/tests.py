@@ -1,3 +1,2155 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import connection, connections, transaction
+from django.http import QueryDict
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from Ecomm.db_profiles import database_settings, replica_aliases
+
+from . import compatibility, inventory, rollups, routers
+from .benchmarks import find_regressions
+from .caching import get_cache, normalize_filters
+from .facets import get_facets
+from .filters import filter_phones
+from .instrumentation import registry
+from .checkout import InsufficientStock, UnknownProduct, place_order
+from .models import (
+    Phone, Accessories, Cart, CartItem, Category, Compatibility, Order, OrderItem, Review, Sequence,
+    DailySales, DailyProductSales, DailyCategorySales, Task, StockEntry, StockShard,
+)
+from .management.commands.bench_db_writers import add_database, remove_database
+from .management.commands.explain_queries import find_full_scans
+from .management.commands.sync_replicas import copy_database
+from .pagination import CursorPaginator, InvalidCursor, decode_cursor
+from .rollups import sales_summary
+from .routers import PrimaryReplicaRouter, RoutingState
+from .seeding import CatalogSeeder
+from .search import get_backend, search_queryset, tokenize
+from .session_backend import SessionStore
+from .sequences import BlockSequence
+from .specs import parse_inches, parse_megapixels, parse_size_gb
+from .tasks import Worker, enqueue, purge_done, retry_delay, run_pending, task
+
+
+# The project ships without templates, so view tests render these stubs
+TEST_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'context_processors': [
+            'django.template.context_processors.request',
+            'django.contrib.auth.context_processors.auth',
+        ],
+        'loaders': [('django.template.loaders.locmem.Loader', {
+            'prime_accessories/phone_list.html':
+                '{% for phone in phones %}{{ phone.name }};{% endfor %}',
+            'prime_accessories/accessories_list.html':
+                '{% for accessory in accessories %}{{ accessory.name }};{% endfor %}',
+            'prime_accessories/phone_detail.html':
+                '{{ phone.name }} {{ phone.rating }} {{ phone.category.name }}|{% for review in reviews %}{{ review.customer.username }};{% endfor %}'
+                '|{% for accessory in compatible_accessories %}{{ accessory.name }} {{ accessory.category.name }};{% endfor %}',
+            'prime_accessories/accessory_detail.html':
+                '{{ accessory.name }} {{ accessory.category.name }}|{% for review in reviews %}{{ review.customer.username }};{% endfor %}'
+                '|{% for phone in compatible_phones %}{{ phone.name }} {{ phone.category.name }};{% endfor %}',
+            'prime_accessories/cart.html':
+                '{% for item in cart_items %}{{ item.key }}={{ item.quantity }}x{{ item.price }};{% endfor %}'
+                'total={{ total_amount }}',
+            'prime_accessories/order_list.html':
+                '{% for order in orders %}{{ order.order_number }}:{{ order.item_count }};{% endfor %}',
+            'prime_accessories/order_detail.html':
+                '{% for item in order.items.all %}{{ item.phone.name }}{{ item.accessory.name }};{% endfor %}',
+            'prime_accessories/compatible_accessories.html':
+                '{{ phone.name }}|{% for accessory in accessories %}{{ accessory.name }}={{ accessory.price }};{% endfor %}'
+                '|{{ next_cursor|default:"" }}',
+        })],
+    },
+}]
+
+
+def make_phone(**kwargs):
+    defaults = {
+        'name': 'Galaxy S24',
+        'brand': 'Samsung',
+        'model': 'SM-S921',
+        'description': 'Flagship phone with a bright display',
+        'price': Decimal('799.00'),
+        'stock': 10,
+    }
+    defaults.update(kwargs)
+    return Phone.objects.create(**defaults)
+
+
+def make_accessory(**kwargs):
+    defaults = {
+        'name': 'Clear Case',
+        'brand': 'Spigen',
+        'description': 'Slim protective case',
+        'price': Decimal('19.99'),
+        'stock': 50,
+        'accessory_type': 'Case',
+    }
+    defaults.update(kwargs)
+    return Accessories.objects.create(**defaults)
+
+
+# ==================== SEARCH TESTS ====================
+
+class SearchTestsMixin:
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones')
+        self.galaxy = make_phone(category=self.category)
+        self.pixel = make_phone(name='Pixel 8', brand='Google', model='GKWS6',
+                                description='Camera phone that pairs with a Galaxy watch')
+        self.case = make_accessory()
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Galaxy S24-Ultra, 256GB!"), ['galaxy', 's24', 'ultra', '256gb'])
+
+    def test_prefix_match(self):
+        ids = get_backend().search(Phone, 'gala')
+        self.assertIn(self.galaxy.pk, ids)
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(get_backend().search(Phone, 'pixel samsung'), [])
+
+    def test_name_match_ranks_above_description_match(self):
+        ids = get_backend().search(Phone, 'galaxy')
+        self.assertEqual(ids, [self.galaxy.pk, self.pixel.pk])
+
+    def test_kinds_are_separate(self):
+        self.assertEqual(get_backend().search(Accessories, 'galaxy'), [])
+        self.assertEqual(get_backend().search(Accessories, 'case'), [self.case.pk])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.galaxy.name = 'Nova 12'
+        self.galaxy.save()
+        self.assertEqual(get_backend().search(Phone, 'nova'), [self.galaxy.pk])
+        self.galaxy.delete()
+        self.assertEqual(get_backend().search(Phone, 'nova'), [])
+
+    def test_rebuild(self):
+        backend = get_backend()
+        backend.clear()
+        self.assertEqual(backend.search(Phone, 'pixel'), [])
+        self.assertEqual(backend.rebuild(chunk_size=2), 3)
+        self.assertEqual(backend.search(Phone, 'pixel'), [self.pixel.pk])
+
+    def test_search_queryset_keeps_rank_and_filters(self):
+        queryset = search_queryset(Phone.objects.all(), 'galaxy')
+        self.assertEqual(list(queryset), [self.galaxy, self.pixel])
+        queryset = queryset.filter(category=self.category)
+        self.assertEqual(list(queryset), [self.galaxy])
+
+    @override_settings(PRIME_SEARCH_MAX_RESULTS=1)
+    def test_filters_apply_before_result_cap(self):
+        # The galaxy phone ranks first for 'galaxy' but is filtered out
+        queryset = filter_phones(Phone.objects.all(), {'search': 'galaxy', 'brand': 'Google'})
+        self.assertEqual(list(queryset), [self.pixel])
+
+
+@override_settings(PRIME_SEARCH_BACKEND='prime_accessories.search.SQLiteFTS5Backend')
+class SQLiteFTS5BackendTests(SearchTestsMixin, TestCase):
+    pass
+
+
+@override_settings(PRIME_SEARCH_BACKEND='prime_accessories.search.InvertedIndexBackend')
+class InvertedIndexBackendTests(SearchTestsMixin, TestCase):
+    pass
+
+
+# ==================== INDEX ADVISOR TESTS ====================
+
+class ExplainQueriesTests(TestCase):
+
+    def test_view_querysets_use_indexes(self):
+        out = StringIO()
+        call_command('explain_queries', '--fail-on-scan', stdout=out)
+        self.assertIn("No full table scans found", out.getvalue())
+
+    def test_find_full_scans(self):
+        plan = "2 0 0 SCAN prime_accessories_phone\n9 0 0 USE TEMP B-TREE FOR ORDER BY"
+        self.assertEqual(find_full_scans(plan, 'sqlite'), ["2 0 0 SCAN prime_accessories_phone"])
+        plan = "3 0 0 SCAN prime_accessories_phone USING INDEX phone_created_idx"
+        self.assertEqual(find_full_scans(plan, 'sqlite'), [])
+        self.assertEqual(find_full_scans("Seq Scan on prime_accessories_order", 'postgresql'),
+                         ["Seq Scan on prime_accessories_order"])
+
+
+# ==================== PAGINATION TESTS ====================
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        # Identical timestamps force the id tie-breaker to do its job
+        self.phones = [make_phone(name=f'Phone {i}') for i in range(7)]
+        Phone.objects.update(created_at=self.phones[0].created_at)
+        self.expected = sorted(self.phones, key=lambda phone: -phone.pk)
+
+    def test_walks_forward_and_back(self):
+        paginator = CursorPaginator(Phone.objects.all(), 3)
+        first = paginator.page()
+        self.assertEqual(list(first), self.expected[:3])
+        self.assertFalse(first.has_previous())
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(list(second), self.expected[3:6])
+        third = paginator.page(second.next_cursor)
+        self.assertEqual(list(third), self.expected[6:])
+        self.assertFalse(third.has_next())
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), self.expected[3:6])
+        self.assertEqual(list(paginator.page(back.previous_cursor)), self.expected[:3])
+
+    def test_page_does_not_count(self):
+        paginator = CursorPaginator(Phone.objects.all(), 3)
+        with self.assertNumQueries(1):
+            paginator.page()
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor')
+
+    @override_settings(TEMPLATES=TEST_TEMPLATES)
+    def test_list_view_cursor_mode(self):
+        response = self.client.get(reverse('phone_list'), {'pagination': 'cursor'})
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 7)
+        self.assertIsNone(page.next_cursor)
+        response = self.client.get(reverse('phone_list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(TEMPLATES=TEST_TEMPLATES)
+    def test_list_view_page_mode_unchanged(self):
+        response = self.client.get(reverse('phone_list'))
+        self.assertEqual(response.context['paginator'].count, 7)
+
+
+# ==================== ORDER NUMBER TESTS ====================
+
+def run_in_threads(target, count):
+    errors = []
+
+    def runner(index):
+        try:
+            target(index)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=runner, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class BlockSequenceTests(TransactionTestCase):
+
+    def test_blocks_are_reserved_once_per_block_size(self):
+        sequence = BlockSequence('test', block_size=10)
+        self.assertEqual([sequence.next_value() for _ in range(25)], list(range(1, 26)))
+        self.assertEqual(Sequence.objects.get(name='test').next_value, 31)
+
+    def test_reserving_inside_a_transaction(self):
+        sequence = BlockSequence('nested', block_size=10)
+        with transaction.atomic():
+            self.assertEqual(sequence.next_value(), 1)
+            self.assertEqual(sequence.next_value(), 11)
+        # Committed: the first block's remainder is handed out
+        self.assertEqual(sequence.next_value(), 2)
+        other = BlockSequence('nested', block_size=10)
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.assertEqual(other.next_value(), 21)
+            raise ValueError
+        # Rolled back: the block went back to the pool and nothing of it was kept
+        self.assertEqual(other.next_value(), 21)
+        self.assertEqual(Sequence.objects.get(name='nested').next_value, 31)
+
+    def test_parallel_allocators_never_collide(self):
+        # Each allocator stands in for a separate worker process
+        allocators = [BlockSequence('stress', block_size=7) for _ in range(4)]
+        values = [[] for _ in range(8)]
+
+        def allocate(index):
+            allocator = allocators[index % len(allocators)]
+            for _ in range(50):
+                values[index].append(allocator.next_value())
+
+        self.assertEqual(run_in_threads(allocate, 8), [])
+        issued = [value for chunk in values for value in chunk]
+        self.assertEqual(len(issued), 400)
+        self.assertEqual(len(set(issued)), 400)
+
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class ParallelCheckoutTests(TransactionTestCase):
+    # The catalog reads of these requests may go to replicas (PRIME_DB_REPLICAS)
+    databases = '__all__'
+
+    def test_parallel_checkouts_get_unique_order_numbers(self):
+        phone = make_phone(stock=1000)
+        clients = []
+        for index in range(8):
+            client = Client()
+            client.force_login(User.objects.create_user(f'buyer{index}', password='pw'))
+            clients.append(client)
+
+        def buy(index):
+            client = clients[index]
+            for _ in range(3):
+                client.post(reverse('add_to_cart', args=['phone', phone.pk]))
+                response = client.post(reverse('checkout'), {'shipping_address': 'Somewhere'})
+                self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(run_in_threads(buy, len(clients)), [])
+        numbers = list(Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(len(numbers), 24)
+        self.assertEqual(len(set(numbers)), 24)
+
+
+# ==================== CHECKOUT TESTS ====================
+
+class PlaceOrderTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.phone = make_phone(stock=5)
+        self.case = make_accessory(stock=2)
+
+    def test_reserves_stock_and_creates_items(self):
+        order = place_order(self.user, [('phone', self.phone.pk, 2), ('accessory', self.case.pk, 1)],
+                            shipping_address='Somewhere', discount=Decimal('10.00'))
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.case.stock), (3, 1))
+        self.assertEqual(order.total_amount, Decimal('1617.99'))
+        self.assertEqual(order.final_amount, Decimal('1607.99'))
+        self.assertEqual(order.items.count(), 2)
+
+    def test_duplicate_lines_are_merged(self):
+        order = place_order(self.user, [('phone', self.phone.pk, 1), ('phone', self.phone.pk, 1)],
+                            shipping_address='Somewhere')
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [2])
+
+    def test_insufficient_stock_rolls_back(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            place_order(self.user, [('phone', self.phone.pk, 1), ('accessory', self.case.pk, 3)],
+                        shipping_address='Somewhere')
+        self.assertEqual(ctx.exception.products, [self.case])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_unknown_product(self):
+        with self.assertRaises(UnknownProduct):
+            place_order(self.user, [('phone', 9999, 1)], shipping_address='Somewhere')
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        category = Category.objects.create(name='Phones')
+        phones = [make_phone(name=f'Phone {i}', stock=5, category=category) for i in range(20)]
+        # Warm the order number block so both runs start from the same state
+        place_order(self.user, [('phone', self.phone.pk, 1)], shipping_address='Somewhere')
+        # savepoint, reserve, load, order, items, stock ledger, rollup task, release
+        with self.assertNumQueries(8):
+            place_order(self.user, [('phone', phones[0].pk, 1)], shipping_address='Somewhere')
+        with self.assertNumQueries(8):
+            place_order(self.user, [('phone', phone.pk, 1) for phone in phones],
+                        shipping_address='Somewhere')
+
+
+# ==================== ORDER HISTORY TESTS ====================
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class OrderViewQueryCountTests(TestCase):
+    # user (the session is cached), then the view's own queries
+    LIST_QUERIES = 3
+    DETAIL_QUERIES = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client.force_login(self.user)
+        self.phones = [make_phone(name=f'Phone {i}', stock=100) for i in range(5)]
+        self.cases = [make_accessory(name=f'Case {i}', stock=100) for i in range(5)]
+
+    def place(self, lines):
+        lines = [('phone', phone.pk, 1) for phone in self.phones[:lines]] + \
+                [('accessory', case.pk, 1) for case in self.cases[:lines]]
+        return place_order(self.user, lines, shipping_address='Somewhere')
+
+    def test_order_list_query_count_is_constant(self):
+        self.place(1)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            self.client.get(reverse('order_list'))
+        for _ in range(8):
+            self.place(5)
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get(reverse('order_list'))
+        self.assertEqual(response.context['orders'][0].item_count, 10)
+
+    def test_order_detail_query_count_is_constant(self):
+        small = self.place(1)
+        large = self.place(5)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            self.client.get(reverse('order_detail', args=[small.pk]))
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(reverse('order_detail', args=[large.pk]))
+        self.assertContains(response, 'Phone 4')
+        self.assertContains(response, 'Case 4')
+
+
+# ==================== RATING AGGREGATE TESTS ====================
+
+class RatingAggregateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reviewer', password='pw')
+        self.phone = make_phone()
+        self.case = make_accessory()
+
+    def review(self, rating, **target):
+        return Review.objects.create(customer=self.user, rating=rating, title='t', review_text='r', **target)
+
+    def assertAggregates(self, product, count, total, rating):
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.rating_sum), (count, total))
+        self.assertAlmostEqual(product.rating, rating)
+
+    def test_create_edit_delete(self):
+        first = self.review(5, phone=self.phone)
+        self.review(2, phone=self.phone)
+        self.assertAggregates(self.phone, 2, 7, 3.5)
+        first.rating = 3
+        first.save()
+        self.assertAggregates(self.phone, 2, 5, 2.5)
+        first.delete()
+        self.assertAggregates(self.phone, 1, 2, 2.0)
+
+    def test_moving_a_review_between_products(self):
+        review = self.review(4, phone=self.phone)
+        review.phone = None
+        review.accessory = self.case
+        review.save()
+        self.assertAggregates(self.phone, 0, 0, 0.0)
+        self.assertAggregates(self.case, 1, 4, 4.0)
+
+    def test_deferred_load_edit(self):
+        self.review(4, accessory=self.case)
+        review = Review.objects.only('title').get()
+        review.rating = 1
+        review.save()
+        self.assertAggregates(self.case, 1, 1, 1.0)
+
+    def test_add_review_view(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_review', args=['phone', self.phone.pk]),
+                         {'rating': '4', 'title': 'Nice', 'review_text': 'Works'})
+        self.assertAggregates(self.phone, 1, 4, 4.0)
+
+    @override_settings(TEMPLATES=TEST_TEMPLATES)
+    def test_reconcile_repairs_drift(self):
+        get_cache().clear()
+        self.review(5, phone=self.phone)
+        Phone.objects.update(review_count=9, rating_sum=1, rating=0.1)
+        drifted_at = Phone.objects.get(pk=self.phone.pk).updated_at
+        self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_ratings', stdout=out)
+        self.assertIn("phone: 1 repaired", out.getvalue())
+        self.assertAggregates(self.phone, 1, 5, 5.0)
+        self.assertGreater(self.phone.updated_at, drifted_at)
+        response = self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        self.assertEqual(response['X-Catalog-Cache'], 'miss')
+
+
+# ==================== CATALOG CACHE TESTS ====================
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.phone = make_phone()
+        self.case = make_accessory()
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_anonymous_list_is_served_from_cache(self):
+        self.assertEqual(self.get('phone_list')['X-Catalog-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.get('phone_list')
+        self.assertEqual(response['X-Catalog-Cache'], 'hit')
+        self.assertContains(response, 'Galaxy S24')
+
+    def test_filters_are_normalized(self):
+        self.get('phone_list', search='Galaxy ')
+        response = self.get('phone_list', search='galaxy', utm_source='mail', page='1')
+        self.assertEqual(response['X-Catalog-Cache'], 'hit')
+        self.assertEqual(normalize_filters(QueryDict('max_price=9&search=A%20%20B')), 'search=a b&max_price=9')
+
+    def test_product_write_invalidates_its_pages(self):
+        self.get('phone_list')
+        self.get('phone_detail', self.phone.pk)
+        self.get('accessories_list')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.name = 'Galaxy S25'
+            self.phone.save()
+        self.assertContains(self.get('phone_list'), 'Galaxy S25')
+        self.assertContains(self.get('phone_detail', self.phone.pk), 'Galaxy S25')
+        self.assertEqual(self.get('accessories_list')['X-Catalog-Cache'], 'hit')
+
+    def test_compatibility_change_invalidates_both_sides(self):
+        self.get('phone_detail', self.phone.pk)
+        self.get('accessory_detail', self.case.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case.compatible_phones.add(self.phone)
+        self.assertContains(self.get('phone_detail', self.phone.pk), 'Clear Case')
+        self.assertContains(self.get('accessory_detail', self.case.pk), 'Galaxy S24')
+        self.get('accessory_detail', self.case.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phone.delete()
+        self.assertEqual(self.get('accessory_detail', self.case.pk)['X-Catalog-Cache'], 'miss')
+
+    def test_invalidation_waits_for_commit(self):
+        self.get('phone_detail', self.phone.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.phone.name = 'Galaxy S25'
+                self.phone.save()
+                # The cached page stands until the write commits
+                self.assertContains(self.get('phone_detail', self.phone.pk), 'Galaxy S24')
+        self.assertContains(self.get('phone_detail', self.phone.pk), 'Galaxy S25')
+
+    def test_review_and_category_invalidate(self):
+        user = User.objects.create_user('reviewer')
+        self.get('phone_detail', self.phone.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(phone=self.phone, customer=user, rating=4, title='t', review_text='r')
+        self.assertContains(self.get('phone_detail', self.phone.pk), 'reviewer;')
+        self.get('accessories_list')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='New')
+        self.assertEqual(self.get('accessories_list')['X-Catalog-Cache'], 'miss')
+
+    def test_stock_changes_invalidate_pages(self):
+        buyer = User.objects.create_user('buyer')
+        self.get('phone_list')
+        self.get('phone_detail', self.phone.pk)
+        self.get('accessories_list')
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(buyer, [('phone', self.phone.pk, 2)], shipping_address='Somewhere')
+        # A sale that leaves stock only invalidates the product's own pages
+        self.assertEqual(self.get('phone_list')['X-Catalog-Cache'], 'hit')
+        self.assertEqual(self.get('phone_detail', self.phone.pk)['X-Catalog-Cache'], 'miss')
+        self.assertEqual(self.get('accessories_list')['X-Catalog-Cache'], 'hit')
+
+    def test_selling_out_and_restocking_invalidate_list_pages(self):
+        buyer = User.objects.create_user('buyer')
+        self.get('phone_list')
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(buyer, [('phone', self.phone.pk, self.phone.stock)], shipping_address='Somewhere')
+        self.assertEqual(self.get('phone_list')['X-Catalog-Cache'], 'miss')
+        self.get('phone_detail', self.phone.pk)
+        # Cancelling puts the stock back
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'cancelled'
+            order.save()
+        self.assertEqual(self.get('phone_list')['X-Catalog-Cache'], 'miss')
+        self.assertEqual(self.get('phone_detail', self.phone.pk)['X-Catalog-Cache'], 'miss')
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.get('phone_list')
+        self.assertNotIn('X-Catalog-Cache', self.get('phone_list'))
+
+    def test_catalog_fragment_tag(self):
+        template = Template('{% load catalog_cache %}{% catalog_fragment "card" phone %}{{ phone.name }}{% endcatalog_fragment %}')
+        self.assertEqual(template.render(Context({'phone': self.phone})), 'Galaxy S24')
+        Phone.objects.filter(pk=self.phone.pk).update(name='Stale')
+        stale = Phone.objects.get(pk=self.phone.pk)
+        self.assertEqual(template.render(Context({'phone': stale})), 'Galaxy S24')
+        with self.captureOnCommitCallbacks(execute=True):
+            stale.save()
+        self.assertEqual(template.render(Context({'phone': stale})), 'Stale')
+
+
+# ==================== CART TESTS ====================
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class CartTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.phone = make_phone()
+        self.case = make_accessory()
+
+    def add(self, item_type, item_id):
+        return self.client.post(reverse('add_to_cart', args=[item_type, item_id]))
+
+    def test_add_upserts_lines(self):
+        self.client.force_login(self.user)
+        self.add('phone', self.phone.pk)
+        self.add('phone', self.phone.pk)
+        self.add('accessory', self.case.pk)
+        item = CartItem.objects.get(phone=self.phone)
+        self.assertEqual(item.quantity, 2)
+        self.assertEqual(item.cart.user, self.user)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_add_repeat_is_a_single_update(self):
+        self.client.force_login(self.user)
+        self.add('phone', self.phone.pk)
+        # user, cart lookup, quantity update
+        with self.assertNumQueries(3):
+            self.add('phone', self.phone.pk)
+
+    def test_add_unknown_product(self):
+        self.assertEqual(self.add('phone', 9999).status_code, 404)
+        self.assertEqual(self.add('tablet', self.phone.pk).status_code, 404)
+
+    def test_add_is_post_only(self):
+        response = self.client.get(reverse('add_to_cart', args=['phone', self.phone.pk]))
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Cart.objects.exists())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_purge_stale_anonymous_carts(self):
+        self.add('phone', self.phone.pk)
+        stale = Cart.objects.get()
+        fresh = Cart.objects.create(user=None)
+        returning = Cart.objects.create(user=None)
+        returning.items.create(item_type='phone', phone=self.phone)
+        owned = Cart.objects.create(user=self.user)
+        long_ago = timezone.now() - datetime.timedelta(days=40)
+        Cart.objects.exclude(pk=fresh.pk).update(updated_at=long_ago)
+        CartItem.objects.filter(cart=stale).update(added_at=long_ago)
+        call_command('purge_carts', '--days', '30', stdout=StringIO())
+        self.assertEqual(set(Cart.objects.all()), {fresh, returning, owned})
+        self.assertFalse(CartItem.objects.filter(cart_id=stale.pk).exists())
+
+    def test_view_reads_current_prices_in_one_query(self):
+        self.client.force_login(self.user)
+        self.add('phone', self.phone.pk)
+        self.add('accessory', self.case.pk)
+        Phone.objects.filter(pk=self.phone.pk).update(price=Decimal('700.00'))
+        # user, cart lines joined with their products
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cart_view'))
+        self.assertContains(response, f'phone_{self.phone.pk}=1x700.00;')
+        self.assertContains(response, 'total=719.99')
+
+    def test_remove(self):
+        self.client.force_login(self.user)
+        self.add('phone', self.phone.pk)
+        self.client.get(reverse('remove_from_cart', args=[f'phone_{self.phone.pk}']))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        self.add('phone', self.phone.pk)
+        self.add('accessory', self.case.pk)
+        anonymous = Cart.objects.get()
+        self.assertIsNone(anonymous.user)
+        Cart.objects.create(user=self.user).items.create(item_type='phone', phone=self.phone)
+        self.client.login(username='buyer', password='pw')
+        self.assertFalse(Cart.objects.filter(pk=anonymous.pk).exists())
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.get(phone=self.phone).quantity, 2)
+        self.assertEqual(cart.items.get(accessory=self.case).quantity, 1)
+
+    def test_legacy_session_cart_is_imported(self):
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['cart'] = {f'phone_{self.phone.pk}': {
+            'item_type': 'phone', 'item_id': self.phone.pk, 'name': self.phone.name,
+            'price': '1.00', 'quantity': 3,
+        }}
+        session.save()
+        self.assertContains(self.client.get(reverse('cart_view')), f'phone_{self.phone.pk}=3x799.00;')
+        self.assertNotIn('cart', self.client.session)
+
+    def test_checkout_empties_cart(self):
+        self.client.force_login(self.user)
+        self.add('phone', self.phone.pk)
+        response = self.client.post(reverse('checkout'), {'shipping_address': 'Somewhere'})
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_detail', args=[order.pk]), fetch_redirect_response=False)
+        self.assertFalse(CartItem.objects.exists())
+
+
+# ==================== DETAIL VIEW TESTS ====================
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class DetailViewQueryCountTests(TestCase):
+    # user, object + category, reviews + customers, compatibility list
+    DETAIL_QUERIES = 4
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Flagships')
+        self.phone = make_phone(category=self.category)
+        self.case = make_accessory(category=self.category)
+        self.client.force_login(User.objects.create_user('viewer'))
+
+    def grow(self, reviews, links):
+        for i in range(reviews):
+            user = User.objects.create_user(f'reviewer{User.objects.count()}')
+            Review.objects.create(phone=self.phone, customer=user, rating=5, title='t', review_text='r')
+            Review.objects.create(accessory=self.case, customer=user, rating=4, title='t', review_text='r')
+        for i in range(links):
+            self.case.compatible_phones.add(make_phone(name=f'Compatible {i}', category=self.category))
+            self.phone.accessories.add(make_accessory(name=f'Fits {i}', category=self.category))
+
+    def test_phone_detail_query_count_is_constant(self):
+        url = reverse('phone_detail', args=[self.phone.pk])
+        self.grow(1, 1)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            self.client.get(url)
+        self.grow(10, 10)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(url)
+        self.assertContains(response, 'reviewer11;')
+        self.assertContains(response, 'Fits 9 Flagships;')
+
+    def test_accessory_detail_query_count_is_constant(self):
+        url = reverse('accessory_detail', args=[self.case.pk])
+        self.grow(1, 1)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            self.client.get(url)
+        self.grow(10, 10)
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(url)
+        self.assertContains(response, 'Compatible 9 Flagships;')
+
+    def test_reviews_are_capped(self):
+        self.grow(25, 0)
+        response = self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+        self.assertEqual(len(response.context['reviews']), 20)
+        self.assertEqual(response.context['phone'].review_count, 25)
+
+
+# ==================== JSON API TESTS ====================
+
+class CatalogAPITests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Flagships')
+        self.phone = make_phone(category=self.category)
+        self.case = make_accessory(category=self.category)
+        self.case.compatible_phones.add(self.phone)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get(reverse('api_phone_list'), {'fields': 'name,price'})
+        self.assertEqual(response.json()['results'], [{'name': 'Galaxy S24', 'price': '799.00'}])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('api_phone_list'), {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(reverse('api_phone_list'), {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        for i in range(3):
+            make_phone(name=f'Phone {i}')
+        first = self.client.get(reverse('api_phone_list'), {'fields': 'name', 'limit': 3}).json()
+        self.assertEqual([row['name'] for row in first['results']], ['Phone 2', 'Phone 1', 'Phone 0'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(second['results'], [{'name': 'Galaxy S24'}])
+        self.assertIsNone(second['next'])
+
+    def test_if_none_match_returns_304(self):
+        url = reverse('api_phone_detail', args=[self.phone.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['name'], 'Galaxy S24')
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+    def test_if_modified_since_returns_304(self):
+        response = self.client.get(reverse('api_category_list'))
+        cached = self.client.get(reverse('api_category_list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_etag_changes_with_data(self):
+        url = reverse('api_phone_list')
+        etag = self.client.get(url)['ETag']
+        self.phone.price = Decimal('749.00')
+        self.phone.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_fields(self):
+        url = reverse('api_phone_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, {'fields': 'name'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_compatibility(self):
+        response = self.client.get(reverse('api_phone_accessories', args=[self.phone.pk]), {'fields': 'name'})
+        self.assertEqual(response.json()['results'], [{'name': 'Clear Case'}])
+        etag = response['ETag']
+        self.case.compatible_phones.remove(self.phone)
+        response = self.client.get(reverse('api_phone_accessories', args=[self.phone.pk]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'], [])
+        phones = self.client.get(reverse('api_accessory_phones', args=[self.case.pk])).json()
+        self.assertEqual(phones['results'], [])
+
+    def test_missing_object(self):
+        self.assertEqual(self.client.get(reverse('api_accessory_detail', args=[9999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_accessory_phones', args=[9999])).status_code, 404)
+
+    def test_read_only(self):
+        self.assertEqual(self.client.post(reverse('api_phone_list')).status_code, 405)
+
+
+# ==================== ASYNC VIEW TESTS ====================
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Flagships')
+        self.phone = make_phone(category=self.category)
+        self.case = make_accessory(category=self.category)
+        self.case.compatible_phones.add(self.phone)
+        self.client = AsyncClient()
+
+    async def test_list_matches_sync_view(self):
+        await Phone.objects.acreate(name='Pixel 9', brand='Google', model='G9', description='Camera phone',
+                                    price=Decimal('699.00'), stock=5)
+        response = await self.client.get(reverse('async_phone_list'), {'min_price': '750'})
+        self.assertContains(response, 'Galaxy S24;')
+        self.assertNotContains(response, 'Pixel 9')
+        response = await self.client.get(reverse('async_phone_list'), {'pagination': 'cursor'})
+        self.assertEqual([phone.name for phone in response.context['phones']], ['Pixel 9', 'Galaxy S24'])
+
+    async def test_search(self):
+        await Phone.objects.acreate(name='Pixel 9', brand='Google', model='G9', description='Camera phone',
+                                    price=Decimal('699.00'), stock=5)
+        response = await self.client.get(reverse('async_phone_list'), {'search': 'gal'})
+        self.assertEqual([phone.name for phone in response.context['phones']], ['Galaxy S24'])
+        self.assertEqual([entry['value'] for entry in response.context['facets']['brand']], ['Samsung'])
+        response = await self.client.get(reverse('async_accessories_list'), {'search': 'case', 'brand': 'Spigen'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['count'] for entry in response.context['facets']['accessory_type']], [1])
+
+    async def test_list_is_cached(self):
+        url = reverse('async_accessories_list')
+        self.assertEqual((await self.client.get(url))['X-Catalog-Cache'], 'miss')
+        self.assertEqual((await self.client.get(url))['X-Catalog-Cache'], 'hit')
+
+    async def test_detail(self):
+        response = await self.client.get(reverse('async_phone_detail', args=[self.phone.pk]))
+        self.assertContains(response, 'Galaxy S24')
+        self.assertContains(response, 'Clear Case Flagships;')
+        response = await self.client.get(reverse('async_accessory_detail', args=[self.case.pk]))
+        self.assertContains(response, 'Galaxy S24 Flagships;')
+        response = await self.client.get(reverse('async_phone_detail', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_invalid_page(self):
+        response = await self.client.get(reverse('async_phone_list'), {'page': '7'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_anonymous_cart(self):
+        add = reverse('async_add_to_cart', args=['phone', self.phone.pk])
+        await self.client.post(add)
+        await self.client.post(add)
+        await self.client.post(reverse('async_add_to_cart', args=['accessory', self.case.pk]))
+        response = await self.client.get(reverse('async_cart_view'))
+        self.assertContains(response, f'phone_{self.phone.pk}=2x799.00;')
+        self.assertContains(response, 'total=1617.99')
+        await self.client.get(reverse('async_remove_from_cart', args=[f'phone_{self.phone.pk}']))
+        response = await self.client.get(reverse('async_cart_view'))
+        self.assertNotContains(response, 'phone_')
+
+    async def test_signed_in_cart(self):
+        user = await User.objects.acreate_user('shopper')
+        await self.client.aforce_login(user)
+        await self.client.post(reverse('async_add_to_cart', args=['phone', self.phone.pk]))
+        self.assertEqual(await CartItem.objects.filter(cart__user=user).acount(), 1)
+        response = await self.client.get(reverse('async_cart_view'))
+        self.assertContains(response, f'phone_{self.phone.pk}=1x799.00;')
+
+
+# ==================== FACET TESTS ====================
+
+class FacetTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.flagships = Category.objects.create(name='Flagships')
+        self.budget = Category.objects.create(name='Budget')
+        make_phone(category=self.flagships, ram='8GB')
+        make_phone(name='Galaxy A15', price=Decimal('199.00'), category=self.budget, ram='4GB')
+        make_phone(name='Galaxy S23', condition='refurbished', price=Decimal('549.00'), category=self.flagships, ram='8GB')
+        make_phone(name='Pixel 8', brand='Google', price=Decimal('699.00'), category=self.flagships, ram='8GB')
+
+    def counts(self, facets, name):
+        return {entry['label']: entry['count'] for entry in facets[name]}
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = get_facets('phone', QueryDict())
+        self.assertEqual(self.counts(facets, 'brand'), {'Samsung': 3, 'Google': 1})
+        self.assertEqual(self.counts(facets, 'category'), {'Flagships': 3, 'Budget': 1})
+        self.assertEqual(self.counts(facets, 'condition'), {'New': 3, 'Refurbished': 1})
+        self.assertEqual(self.counts(facets, 'ram'), {'8 GB': 3, '4 GB': 1})
+        self.assertEqual([entry['label'] for entry in facets['price']],
+                         ['Under $200', '$400 - $700', '$700 - $1000'])
+
+    def test_selected_facet_keeps_its_alternatives(self):
+        facets = get_facets('phone', QueryDict('brand=Samsung&condition=new'))
+        # brand counts ignore the brand selection but honour the condition
+        self.assertEqual(self.counts(facets, 'brand'), {'Samsung': 2, 'Google': 1})
+        self.assertEqual(self.counts(facets, 'condition'), {'New': 2, 'Refurbished': 1})
+        self.assertEqual(self.counts(facets, 'category'), {'Flagships': 1, 'Budget': 1})
+        self.assertTrue(next(entry for entry in facets['brand'] if entry['value'] == 'Samsung')['selected'])
+
+    def test_price_range_and_search_apply(self):
+        facets = get_facets('phone', QueryDict('max_price=600'))
+        self.assertEqual(self.counts(facets, 'brand'), {'Samsung': 2})
+
+    def test_cached_per_filter_signature(self):
+        get_facets('phone', QueryDict('brand=Google'))
+        with self.assertNumQueries(0):
+            get_facets('phone', QueryDict('brand=Google&page=2'))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_phone(name='Pixel 9', brand='Google')
+        facets = get_facets('phone', QueryDict('brand=Google'))
+        self.assertEqual(self.counts(facets, 'brand')['Google'], 2)
+
+    def test_accessory_facets(self):
+        make_accessory(category=self.flagships)
+        make_accessory(name='Fast Charger', accessory_type='Charger', price=Decimal('35.00'))
+        facets = get_facets('accessory', QueryDict('type=Case'))
+        self.assertEqual(self.counts(facets, 'accessory_type'), {'Case': 1, 'Charger': 1})
+        self.assertEqual(self.counts(facets, 'price'), {'Under $25': 1})
+
+    def test_api(self):
+        response = self.client.get(reverse('api_phone_facets'), {'brand': 'Google'})
+        self.assertEqual(response.json()['facets']['brand'][0]['label'], 'Samsung')
+        cached = self.client.get(reverse('api_phone_facets'), {'brand': 'Google'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+
+# ==================== SPEC NORMALIZATION TESTS ====================
+
+class SpecNormalizationTests(TestCase):
+    def test_parsers(self):
+        self.assertEqual(parse_size_gb('8GB'), Decimal('8'))
+        self.assertEqual(parse_size_gb('1 TB'), Decimal('1024'))
+        self.assertEqual(parse_size_gb('512MB'), Decimal('0.5'))
+        self.assertEqual(parse_size_gb('128GB / 256GB'), Decimal('128'))
+        self.assertIsNone(parse_size_gb('lots'))
+        self.assertEqual(parse_inches('6.1 inches'), Decimal('6.1'))
+        self.assertEqual(parse_inches('6.7"'), Decimal('6.7'))
+        self.assertEqual(parse_inches('17 cm'), Decimal('6.69'))
+        self.assertEqual(parse_megapixels('50MP + 12MP + 10MP'), Decimal('50'))
+        self.assertEqual(parse_megapixels('108 MP f/1.8'), Decimal('108'))
+        self.assertIsNone(parse_megapixels(''))
+
+    def test_parsers_reject_implausible_values(self):
+        self.assertIsNone(parse_inches('2400x1080'))
+        self.assertEqual(parse_inches('2400x1080, 6.5 inches'), Decimal('6.5'))
+        self.assertIsNone(parse_inches('0 inches'))
+        self.assertIsNone(parse_size_gb('9999999 GB'))
+        self.assertIsNone(parse_megapixels('50000 MP'))
+        phone = make_phone(display_size='2400x1080', ram='9999 TB')
+        phone.refresh_from_db()
+        self.assertIsNone(phone.display_inches)
+        self.assertIsNone(phone.ram_gb)
+
+    def test_normalized_on_save(self):
+        phone = make_phone(ram='8GB', storage='256 GB', display_size='6.2 inches', camera_mp='50MP + 12MP')
+        phone.refresh_from_db()
+        self.assertEqual((phone.ram_gb, phone.storage_gb, phone.display_inches, phone.main_camera_mp),
+                         (Decimal('8'), Decimal('256'), Decimal('6.2'), Decimal('50')))
+        phone.ram = '12GB'
+        phone.save(update_fields=['ram'])
+        phone.refresh_from_db()
+        self.assertEqual(phone.ram_gb, Decimal('12'))
+
+    def test_range_filters(self):
+        make_phone(name='Small', ram='4GB', storage='64GB', display_size='5.8"', camera_mp='12MP')
+        make_phone(name='Big', ram='12GB', storage='1TB', display_size='6.8"', camera_mp='200MP')
+        make_phone(name='Unknown')
+
+        def names(query):
+            return sorted(filter_phones(Phone.objects.all(), QueryDict(query)).values_list('name', flat=True))
+
+        self.assertEqual(names('ram_min=8'), ['Big'])
+        self.assertEqual(names('storage_min=64&storage_max=512'), ['Small'])
+        self.assertEqual(names('display_max=6'), ['Small'])
+        self.assertEqual(names('camera_min=100&ram_max=16'), ['Big'])
+        self.assertEqual(len(names('')), 3)
+
+    def test_range_filter_uses_index(self):
+        queryset = filter_phones(Phone.objects.all(), QueryDict('ram_min=8'))[:12]
+        plan = queryset.explain()
+        self.assertEqual(find_full_scans(plan, connection.vendor), [], plan)
+
+
+# ==================== CATALOG IMPORT/EXPORT TESTS ====================
+
+PHONE_FEED = """sku,name,brand,model,description,price,stock,ram,storage,category
+PH-1,Galaxy S24,Samsung,SM-S921,Flagship,799.00,10,8GB,256GB,Flagships
+PH-2,Pixel 8,Google,G8,Camera phone,699.00,5,8GB,128GB,Flagships
+PH-3,Galaxy A15,Samsung,SM-A155,Budget,not-a-price,5,4GB,64GB,Budget
+"""
+
+
+class CatalogImportExportTests(TestCase):
+    def write_feed(self, content, suffix):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, kind, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', kind, path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_phones(self):
+        out, err = self.run_import('phone', self.write_feed(PHONE_FEED, '.csv'))
+        self.assertIn('2 created, 0 updated', out)
+        self.assertIn('rows/s', out)
+        self.assertIn('line 4: price is not a number', err)
+        phone = Phone.objects.get(sku='PH-1')
+        self.assertEqual(phone.category.name, 'Flagships')
+        self.assertEqual(phone.storage_gb, Decimal('256'))
+        self.assertEqual(list(search_queryset(Phone.objects.all(), 'pixel').values_list('sku', flat=True)), ['PH-2'])
+
+    def test_rejects_non_finite_and_negative_numbers(self):
+        feed = (
+            '{"sku": "PH-1", "name": "Galaxy", "price": "NaN"}\n'
+            '{"sku": "PH-2", "name": "Pixel", "price": "Infinity"}\n'
+            '{"sku": "PH-3", "name": "Nova", "price": "99.00", "stock": "-5"}\n'
+            '{"sku": "PH-4", "name": "Moto", "price": "99.00", "battery_mah": -1}\n'
+            '{"sku": "PH-5", "name": "Xperia", "price": "99.00", "stock": 3}\n'
+        )
+        out, err = self.run_import('phone', self.write_feed(feed, '.jsonl'), max_errors=2)
+        self.assertIn('1 created, 0 updated, 4 rejected', out)
+        self.assertIn("line 1: price is not a number: 'NaN'", err)
+        self.assertIn("line 2: price is not a number: 'Infinity'", err)
+        self.assertNotIn('line 3', err)
+        self.assertIn('... and 2 more rejected rows', err)
+        self.assertEqual(list(Phone.objects.values_list('sku', flat=True)), ['PH-5'])
+
+    def test_upsert_keeps_omitted_columns(self):
+        self.run_import('phone', self.write_feed(PHONE_FEED, '.csv'))
+        phone = Phone.objects.get(sku='PH-1')
+        feed = '{"sku": "PH-1", "name": "Galaxy S24", "price": "749.00"}\n'
+        out, _ = self.run_import('phone', self.write_feed(feed, '.jsonl'))
+        self.assertIn('0 created, 1 updated', out)
+        updated = Phone.objects.get(sku='PH-1')
+        self.assertEqual(updated.pk, phone.pk)
+        self.assertEqual(updated.price, Decimal('749.00'))
+        self.assertEqual((updated.ram_gb, updated.stock, updated.category_id), (Decimal('8'), 10, phone.category_id))
+        self.assertGreater(updated.updated_at, phone.updated_at)
+
+    def test_import_accessories_links_phones(self):
+        self.run_import('phone', self.write_feed(PHONE_FEED, '.csv'))
+        feed = (
+            '{"sku": "AC-1", "name": "Clear Case", "price": "19.99", "accessory_type": "Case", '
+            '"compatible_phones": ["PH-1", "PH-2", "PH-404"]}\n'
+            '{"sku": "AC-2", "name": "Charger", "price": "29.99", "accessory_type": "Charger"}\n'
+        )
+        out, err = self.run_import('accessory', self.write_feed(feed, '.jsonl'), batch_size=1)
+        self.assertIn('2 compatibility links', out)
+        self.assertIn('1 unknown phone SKUs', err)
+        case = Accessories.objects.get(sku='AC-1')
+        self.assertEqual(sorted(case.compatible_phones.values_list('sku', flat=True)), ['PH-1', 'PH-2'])
+
+        feed = 'sku,name,price,accessory_type,compatible_phones\nAC-1,Clear Case,19.99,Case,PH-2\n'
+        self.run_import('accessory', self.write_feed(feed, '.csv'))
+        self.assertEqual(list(case.compatible_phones.values_list('sku', flat=True)), ['PH-2'])
+
+    def test_export_round_trip(self):
+        self.run_import('phone', self.write_feed(PHONE_FEED, '.csv'))
+        for fmt in ('csv', 'jsonl'):
+            out = StringIO()
+            call_command('export_catalog', 'phone', format=fmt, stdout=out, stderr=StringIO())
+            Phone.objects.update(price=Decimal('1.00'))
+            result, _ = self.run_import('phone', self.write_feed(out.getvalue(), f'.{fmt}'))
+            self.assertIn('0 created, 2 updated', result)
+            self.assertEqual(Phone.objects.get(sku='PH-2').price, Decimal('699.00'))
+        first = json.loads(out.getvalue().splitlines()[0])
+        self.assertEqual(first['category'], 'Flagships')
+
+
+# ==================== ORDER EXPORT TESTS ====================
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', email='buyer@example.com')
+        phone = make_phone(stock=50, sku='PH-1')
+        case = make_accessory(stock=50)
+        self.orders = []
+        for day, status in ((1, 'pending'), (2, 'shipped'), (3, 'cancelled')):
+            order = place_order(self.user, [('phone', phone.pk, 1), ('accessory', case.pk, 2)],
+                                shipping_address='Somewhere')
+            created = timezone.make_aware(datetime.datetime(2024, 3, day, 23, 30))
+            Order.objects.filter(pk=order.pk).update(created_at=created, status=status)
+            self.orders.append(order)
+
+    def rows(self, content):
+        return list(csv.DictReader(StringIO(content)))
+
+    def test_command_filters_by_date_and_status(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_orders', '--from', '2024-03-02', '--to', '2024-03-03', '--status', 'shipped',
+                     stdout=out, stderr=err)
+        rows = self.rows(out.getvalue())
+        self.assertEqual({row['order_number'] for row in rows}, {self.orders[1].order_number})
+        self.assertEqual(sorted(row['item_type'] for row in rows), ['accessory', 'phone'])
+        phone_row = next(row for row in rows if row['item_type'] == 'phone')
+        self.assertEqual((phone_row['phone_sku'], phone_row['customer_email'], phone_row['line_total']),
+                         ('PH-1', 'buyer@example.com', '799.00'))
+        self.assertIn('Exported 2 rows', err.getvalue())
+
+    def test_formula_cells_are_escaped(self):
+        User.objects.filter(pk=self.user.pk).update(username='=HYPERLINK("http://evil")', email='@buyer')
+        Phone.objects.filter(sku='PH-1').update(name='-2+3')
+        out = StringIO()
+        call_command('export_orders', stdout=out, stderr=StringIO())
+        row = next(row for row in self.rows(out.getvalue()) if row['item_type'] == 'phone')
+        self.assertEqual((row['customer'], row['customer_email'], row['phone']),
+                         ('\'=HYPERLINK("http://evil")', "'@buyer", "'-2+3"))
+        self.assertEqual(row['line_total'], '799.00')
+
+    def test_command_reads_in_chunks(self):
+        out = StringIO()
+        # order lines (one joined query) are fetched chunk by chunk
+        with self.assertNumQueries(1):
+            call_command('export_orders', chunk_size=2, stdout=out, stderr=StringIO())
+        self.assertEqual(len(self.rows(out.getvalue())), 6)
+
+    def test_admin_action_streams(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:prime_accessories_order_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.orders[0].pk, self.orders[2].pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = self.rows(b''.join(response.streaming_content).decode())
+        self.assertEqual(len(rows), 4)
+
+    def test_admin_export_view(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(reverse('admin:prime_accessories_order_export'),
+                                   {'date_from': '2024-03-01', 'date_to': '2024-03-01'})
+        rows = self.rows(b''.join(response.streaming_content).decode())
+        self.assertEqual({row['order_number'] for row in rows}, {self.orders[0].order_number})
+        self.assertIn('orders_2024-03-01_2024-03-01.csv', response['Content-Disposition'])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:prime_accessories_order_export'))
+        self.assertEqual(response.status_code, 302)
+
+
+# ==================== SALES ROLLUP TESTS ====================
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.phones_category = Category.objects.create(name='Phones')
+        self.cases_category = Category.objects.create(name='Cases')
+        self.phone = make_phone(stock=50, category=self.phones_category)
+        self.case = make_accessory(stock=50, category=self.cases_category)
+        self.today = timezone.localdate()
+
+    def place(self, phones=1, cases=2, discount=Decimal('0.00'), run_tasks=True):
+        order = place_order(self.user, [('phone', self.phone.pk, phones), ('accessory', self.case.pk, cases)],
+                            shipping_address='Somewhere', discount=discount)
+        if run_tasks:
+            run_pending()
+        return order
+
+    def snapshot(self):
+        daily = list(DailySales.objects.order_by('date').values_list(
+            'date', 'order_count', 'unit_count', 'gross_revenue', 'discount_total', 'net_revenue'))
+        products = sorted(DailyProductSales.objects.values_list('date', 'item_type', 'product_id', 'unit_count', 'revenue'))
+        categories = sorted(DailyCategorySales.objects.values_list('date', 'category_id', 'unit_count', 'revenue'))
+        return daily, products, categories
+
+    def test_orders_update_rollups_incrementally(self):
+        self.place(discount=Decimal('10.00'))
+        self.place(phones=2, cases=0)
+        daily = DailySales.objects.get(date=self.today)
+        self.assertEqual((daily.order_count, daily.unit_count), (2, 5))
+        self.assertEqual(daily.gross_revenue, Decimal('2436.98'))
+        self.assertEqual(daily.discount_total, Decimal('10.00'))
+        self.assertEqual(daily.net_revenue, Decimal('2426.98'))
+        phone_sales = DailyProductSales.objects.get(item_type='phone', product_id=self.phone.pk)
+        self.assertEqual((phone_sales.unit_count, phone_sales.revenue), (3, Decimal('2397.00')))
+        self.assertEqual(DailyCategorySales.objects.get(category=self.cases_category).unit_count, 2)
+
+    def test_cancel_and_restore(self):
+        order = self.place()
+        self.place()
+        before = self.snapshot()
+        order.status = 'cancelled'
+        order.save()
+        daily = DailySales.objects.get(date=self.today)
+        self.assertEqual((daily.order_count, daily.unit_count), (1, 3))
+        self.assertEqual(DailyProductSales.objects.get(item_type='accessory').unit_count, 2)
+        # Other status changes don't touch the rollups; leaving cancelled restores
+        order = Order.objects.only('id', 'status', 'created_at', 'total_amount', 'discount', 'final_amount').get(pk=order.pk)
+        order.status = 'processing'
+        order.save()
+        self.assertEqual(self.snapshot(), before)
+        order.status = 'shipped'
+        order.save()
+        self.assertEqual(self.snapshot(), before)
+
+    def test_sales_stay_under_the_category_they_were_placed_in(self):
+        order = self.place()
+        self.place()
+        self.case.category = Category.objects.create(name='Accessories')
+        self.case.save()
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(DailyCategorySales.objects.get(category=self.cases_category).unit_count, 2)
+        self.assertFalse(DailyCategorySales.objects.filter(category=self.case.category).exists())
+        # A rebuild agrees with the incremental totals
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rollups_are_queued_with_the_order(self):
+        order = self.place(run_tasks=False)
+        self.assertFalse(DailySales.objects.exists())
+        self.assertEqual(Task.objects.get().name, 'rollups.record_order')
+        # Cancelled before the worker got to it: the deltas still net out
+        order.status = 'cancelled'
+        order.save()
+        run_pending()
+        self.assertEqual(DailySales.objects.get(date=self.today).order_count, 0)
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_delete_removes_order(self):
+        order = self.place()
+        self.place()
+        Order.objects.filter(pk=order.pk).delete()
+        daily = DailySales.objects.get(date=self.today)
+        self.assertEqual((daily.order_count, daily.unit_count), (1, 3))
+        self.assertEqual(DailyProductSales.objects.get(item_type='phone').revenue, Decimal('799.00'))
+
+    def test_rebuild_matches_incremental(self):
+        self.place(discount=Decimal('5.00'))
+        cancelled = self.place(phones=3)
+        self.place(phones=0, cases=4)
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        incremental = self.snapshot()
+        # Drift the tables the way raw writes would, then rebuild
+        DailySales.objects.update(order_count=99)
+        DailyProductSales.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_sales_rollups', stdout=out)
+        self.assertIn('Rebuilt 1 days', out.getvalue())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_range_leaves_other_days(self):
+        old = self.place()
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.make_aware(datetime.datetime(2024, 3, 1, 12)))
+        self.place()
+        call_command('rebuild_sales_rollups', '--from', '2024-03-01', '--to', '2024-03-01', stdout=StringIO())
+        # Today is outside the range, so it still counts the moved order
+        self.assertEqual(
+            list(DailySales.objects.order_by('date').values_list('date', 'order_count')),
+            [(datetime.date(2024, 3, 1), 1), (self.today, 2)],
+        )
+        call_command('rebuild_sales_rollups', '--from', str(self.today), stdout=StringIO())
+        self.assertEqual(DailySales.objects.get(date=self.today).order_count, 1)
+
+    def test_rebuild_supersedes_queued_deltas(self):
+        self.place(run_tasks=False)
+        self.place(run_tasks=False)
+        rollups.rebuild()
+        run_pending()
+        # Both orders were counted by the rebuild, not again by their tasks
+        self.assertEqual(DailySales.objects.get(date=self.today).order_count, 2)
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {'done'})
+
+    def test_rebuild_range_keeps_other_days_queued(self):
+        old = self.place(run_tasks=False)
+        old_day = datetime.date(2024, 3, 1)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.make_aware(datetime.datetime(2024, 3, 1, 12)))
+        queued = Task.objects.get()
+        queued.payload['day'] = old_day.isoformat()
+        queued.save()
+        self.place(run_tasks=False)
+        rollups.rebuild(self.today, self.today)
+        run_pending()
+        self.assertEqual(
+            list(DailySales.objects.order_by('date').values_list('date', 'order_count')),
+            [(old_day, 1), (self.today, 1)],
+        )
+
+    def test_admin_retry_only_requeues_failed_tasks(self):
+        self.place()
+        self.place(run_tasks=False)
+        rollups.rebuild()
+        failed = Task.objects.create(name='tests.create_category', payload={'name': 'Retried'}, status='failed',
+                                     attempts=2, max_attempts=2)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.client.post(reverse('admin:prime_accessories_task_changelist'), {
+            'action': 'retry', '_selected_action': list(Task.objects.values_list('pk', flat=True)),
+        })
+        # The applied and the superseded rollup tasks stay done
+        self.assertEqual(set(Task.objects.filter(name='rollups.record_order').values_list('status', flat=True)),
+                         {'done'})
+        self.assertEqual(Task.objects.get(pk=failed.pk).status, 'pending')
+        run_pending()
+        self.assertEqual(DailySales.objects.get(date=self.today).order_count, 2)
+
+    def test_rebuild_discards_running_deltas(self):
+        self.place(run_tasks=False)
+        worker = Worker(name='slow-worker')
+        running = worker.claim()
+        rollups.rebuild()
+        with self.assertLogs('prime_accessories.tasks', 'WARNING'):
+            self.assertFalse(worker.execute(running[0]))
+        self.assertEqual(DailySales.objects.get(date=self.today).order_count, 1)
+
+    def test_summary_and_dashboard(self):
+        self.place(phones=1, cases=3)
+        self.place(phones=2, cases=0)
+        summary = sales_summary(self.today, self.today)
+        self.assertEqual(summary['totals']['order_count'], 2)
+        self.assertEqual([(row['item_type'], row['units']) for row in summary['top_products']],
+                         [('phone', 3), ('accessory', 3)])
+        self.assertEqual(summary['top_products'][0]['name'], str(self.phone))
+        self.assertEqual([row['name'] for row in summary['categories']], ['Phones', 'Cases'])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(reverse('admin:prime_accessories_sales_dashboard'))
+        self.assertContains(response, str(self.phone))
+        self.assertEqual(response.context['date_to'], self.today)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:prime_accessories_sales_dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+
+# ==================== INSTRUMENTATION TESTS ====================
+
+INSTRUMENTED_TEMPLATES = [dict(TEST_TEMPLATES[0], BACKEND='prime_accessories.instrumentation.InstrumentedDjangoTemplates')]
+
+
+@override_settings(TEMPLATES=INSTRUMENTED_TEMPLATES, PRIME_SLOW_REQUEST_MS=60000)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        get_cache().clear()
+        self.phone = make_phone()
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+
+    def fetch_metrics(self, name='metrics', **headers):
+        self.client.force_login(self.staff)
+        return self.client.get(reverse(name), headers=headers)
+
+    def test_records_queries_and_render_time_per_view(self):
+        self.client.get(reverse('cart_view'))
+        self.client.get(reverse('cart_view'))
+        self.client.get(reverse('phone_list'))
+        stats = registry.snapshot()['views']
+        self.assertEqual(stats['cart_view']['requests'], 2)
+        self.assertEqual(stats['phone_list']['requests'], 1)
+        # anonymous cart: session lookup only
+        self.assertEqual(stats['cart_view']['max_queries'], 0)
+        self.assertGreater(stats['phone_list']['max_queries'], 0)
+        self.assertGreater(stats['phone_list']['avg_render_ms'], 0)
+        self.assertGreaterEqual(stats['phone_list']['avg_ms'], stats['phone_list']['avg_db_ms'])
+
+    async def test_async_views_are_measured(self):
+        await AsyncClient().get(reverse('async_phone_list'))
+        stats = registry.snapshot()['views']['async_phone_list']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['max_queries'], 0)
+
+    def test_json_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.get(reverse('phone_list'))
+        response = self.fetch_metrics()
+        self.assertIn('phone_list', response.json()['views'])
+
+    @override_settings(PRIME_METRICS_TOKEN='s3cret')
+    def test_prometheus_format_and_token(self):
+        self.client.get(reverse('phone_list'))
+        response = self.client.get(reverse('metrics_prometheus'), headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE prime_http_request_duration_seconds histogram', text)
+        self.assertIn('prime_http_requests_total{view="phone_list"} 1', text)
+        self.assertIn('prime_http_request_duration_seconds_bucket{view="phone_list",le="+Inf"} 1', text)
+        self.assertRegex(text, r'prime_db_queries_total\{view="phone_list"\} [1-9]')
+        response = self.client.get(reverse('metrics_prometheus'), headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(PRIME_SLOW_REQUEST_MS=0)
+    def test_slow_requests_keep_their_sql(self):
+        with self.assertLogs('prime_accessories.slow_requests', 'WARNING'):
+            self.client.get(reverse('phone_detail', args=[self.phone.pk]))
+            entries = self.fetch_metrics('metrics_slow_requests').json()['requests']
+        entry = next(entry for entry in entries if entry['view'] == 'phone_detail')
+        self.assertEqual(entry['queries'], len(entry['sql']))
+        self.assertTrue(any('prime_accessories_phone' in query['sql'] for query in entry['sql']))
+
+    @override_settings(PRIME_METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse('phone_list'))
+        self.assertEqual(registry.snapshot()['views'], {})
+
+
+# ==================== BENCHMARK SUITE TESTS ====================
+
+SEED_OPTIONS = ['--users', '5', '--phones', '12', '--accessories', '20', '--orders', '30', '--reviews', '60',
+                '--compatible-phones', '3', '--batch-size', '8']
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_seed_catalog(self):
+        out = StringIO()
+        call_command('seed_catalog', *SEED_OPTIONS, stdout=out)
+        self.assertIn('Seeded in', out.getvalue())
+        self.assertEqual(Phone.objects.count(), 12)
+        self.assertEqual(Accessories.compatible_phones.through.objects.count(), 60)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(Review.objects.count(), 60)
+        # Derived data the skipped signals would have maintained
+        self.assertEqual(sum(Phone.objects.values_list('review_count', flat=True)),
+                         Review.objects.filter(phone__isnull=False).count())
+        self.assertFalse(Phone.objects.filter(ram_gb__isnull=True).exists())
+        self.assertEqual(sum(DailySales.objects.values_list('order_count', flat=True)),
+                         Order.objects.exclude(status='cancelled').count())
+        self.assertTrue(search_queryset(Phone.objects.all(), Phone.objects.first().brand).exists())
+        # Orders keep their generated dates
+        self.assertGreater(Order.objects.dates('created_at', 'day').count(), 1)
+        with self.assertRaises(CommandError):
+            call_command('seed_catalog', *SEED_OPTIONS, stdout=StringIO())
+
+    def test_seed_is_deterministic(self):
+        CatalogSeeder(seed=7, batch_size=4).run(users=2, phones=6, accessories=0, orders=0, reviews=0)
+        first = list(Phone.objects.order_by('sku').values_list('sku', 'name', 'price'))
+        Phone.objects.all().delete()
+        CatalogSeeder(seed=7, batch_size=4).run(users=0, phones=6, accessories=0, orders=0, reviews=0)
+        self.assertEqual(list(Phone.objects.order_by('sku').values_list('sku', 'name', 'price')), first)
+
+    @override_settings(TEMPLATES=TEST_TEMPLATES, ALLOWED_HOSTS=['localhost'])
+    def test_run_benchmarks_json_and_baseline(self):
+        call_command('seed_catalog', *SEED_OPTIONS, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            out = StringIO()
+            call_command('run_benchmarks', '--repeat', '2', '--warmup', '0', '--json', '-o', output, stdout=out)
+            report = json.loads(out.getvalue())
+            names = [row['scenario'] for row in report['results']]
+            for name in ('phone_list filtered', 'search phones', 'phone_detail', 'add_to_cart', 'checkout', 'order_list'):
+                self.assertIn(name, names)
+            self.assertEqual(report['meta']['rows']['phones'], 12)
+            with open(output) as stream:
+                self.assertEqual(json.load(stream)['results'], report['results'])
+
+            # A baseline that issued fewer queries fails the gate
+            for row in report['results']:
+                row['queries'] -= 1
+            with open(output, 'w') as stream:
+                json.dump(report, stream)
+            with self.assertRaisesMessage(CommandError, 'Regressions against the baseline'):
+                call_command('run_benchmarks', '--repeat', '1', '--warmup', '0', '--scenario', 'phone_detail',
+                             '--baseline', output, stdout=StringIO(), stderr=StringIO())
+
+    def test_find_regressions(self):
+        baseline = [{'scenario': 'list', 'queries': 3, 'median_ms': 10.0},
+                    {'scenario': 'detail', 'queries': 4, 'median_ms': 0.5}]
+        self.assertEqual(find_regressions(baseline, [
+            {'scenario': 'list', 'queries': 3, 'median_ms': 12.0},
+            # +100%, but under min_delta_ms
+            {'scenario': 'detail', 'queries': 4, 'median_ms': 1.0},
+            {'scenario': 'new', 'queries': 9, 'median_ms': 99.0},
+        ]), [])
+        self.assertEqual(find_regressions(baseline, [
+            {'scenario': 'list', 'queries': 4, 'median_ms': 20.0},
+        ]), ['list: 3 -> 4 queries', 'list: median 10.0 -> 20.0 ms (+100%)'])
+
+
+# ==================== COMPATIBILITY TESTS ====================
+
+@override_settings(TEMPLATES=TEST_TEMPLATES)
+class CompatibilityTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.phone = make_phone()
+        self.other = make_phone(name='Pixel 8', brand='Google')
+        self.cases = [make_accessory(name=f'Case {i}', price=Decimal(price))
+                      for i, price in enumerate(['30.00', '10.00', '20.00'])]
+        self.charger = make_accessory(name='Charger', accessory_type='Charger', price=Decimal('15.00'))
+        for accessory in [*self.cases, self.charger]:
+            accessory.compatible_phones.add(self.phone)
+        self.cases[0].compatible_phones.add(self.other)
+
+    def lookup(self, query=''):
+        return compatibility.lookup(self.phone.pk, QueryDict(query))
+
+    def names(self, result):
+        return [row['name'] for row in result['results']]
+
+    def test_copies_follow_the_accessory(self):
+        link = Compatibility.objects.get(accessory=self.charger)
+        self.assertEqual((link.accessory_type, link.price), ('Charger', Decimal('15.00')))
+        self.charger.price = Decimal('12.50')
+        self.charger.accessory_type = 'Power'
+        self.charger.save()
+        link.refresh_from_db()
+        self.assertEqual((link.accessory_type, link.price), ('Power', Decimal('12.50')))
+        # Rows written without the copies are repaired in bulk
+        Compatibility.objects.update(price=0)
+        compatibility.sync_denormalized()
+        self.assertEqual(Compatibility.objects.get(accessory=self.cases[0], phone=self.phone).price, Decimal('30.00'))
+
+    def test_lookup_filters_and_orders_by_price(self):
+        result = self.lookup()
+        self.assertEqual(self.names(result), ['Case 1', 'Charger', 'Case 2', 'Case 0'])
+        self.assertEqual(result['types'], {'Case': 3, 'Charger': 1})
+        self.assertEqual(self.names(self.lookup('type=Case&max_price=25')), ['Case 1', 'Case 2'])
+        self.assertEqual(self.names(self.lookup('type=Case&type=Charger&min_price=15')),
+                         ['Charger', 'Case 2', 'Case 0'])
+        with self.assertRaises(ValueError):
+            self.lookup('min_price=cheap')
+
+    def test_cursor_pages(self):
+        first = self.lookup('limit=3')
+        self.assertEqual(self.names(first), ['Case 1', 'Charger', 'Case 2'])
+        second = self.lookup(f"limit=3&cursor={first['next']}")
+        self.assertEqual(self.names(second), ['Case 0'])
+        self.assertIsNone(second['next'])
+
+    def test_lookup_is_cached_per_phone(self):
+        self.lookup()
+        with self.assertNumQueries(0):
+            self.lookup()
+        # Unrelated phones keep their cached results
+        compatibility.lookup(self.other.pk, QueryDict())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.charger.compatible_phones.remove(self.phone)
+        with self.assertNumQueries(0):
+            compatibility.lookup(self.other.pk, QueryDict())
+        self.assertEqual(self.names(self.lookup()), ['Case 1', 'Case 2', 'Case 0'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cases[1].price = Decimal('40.00')
+            self.cases[1].save()
+        self.assertEqual(self.names(self.lookup()), ['Case 2', 'Case 0', 'Case 1'])
+
+    def test_lookup_reads_the_index(self):
+        links = (compatibility.compatible_links(self.phone.pk, QueryDict('type=Case&max_price=50'))
+                 .order_by('price', 'accessory_id').values('price', 'accessory_id'))
+        plan = links.explain()
+        self.assertIn('compatibility_lookup_idx', plan)
+        self.assertEqual(find_full_scans(plan, connection.vendor), [])
+        if connection.vendor == 'sqlite':
+            self.assertIn('COVERING INDEX', plan)
+
+    def test_api(self):
+        url = reverse('api_phone_compatible', args=[self.phone.pk])
+        response = self.client.get(url, {'type': 'Case', 'limit': 2})
+        payload = response.json()
+        self.assertEqual(self.names(payload), ['Case 1', 'Case 2'])
+        self.assertEqual(payload['types'], {'Case': 3, 'Charger': 1})
+        self.assertEqual(self.names(self.client.get(payload['next']).json()), ['Case 0'])
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, {'type': 'Case', 'limit': 2}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get(url, {'cursor': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'max_price': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_phone_compatible', args=[9999])).status_code, 404)
+
+    def test_page(self):
+        response = self.client.get(reverse('phone_compatible_accessories', args=[self.phone.pk]), {'type': 'Charger'})
+        self.assertContains(response, 'Galaxy S24|Charger=15.00;|')
+        response = self.client.get(reverse('phone_compatible_accessories', args=[self.phone.pk]), {'min_price': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+
+# ==================== TASK QUEUE TESTS ====================
+
+@task('tests.create_category', max_attempts=2)
+def create_category_task(name, fail=False, steal=False):
+    Category.objects.create(name=name)
+    if steal:
+        # Stands in for the row being reclaimed by another worker meanwhile
+        Task.objects.filter(status='running').update(locked_by='someone-else')
+    if fail:
+        raise RuntimeError(f"could not handle {name}")
+
+
+class TaskQueueTests(TestCase):
+
+    def test_tasks_commit_with_the_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue('tests.create_category', {'name': 'Lost'})
+                raise RuntimeError("rolled back")
+        self.assertFalse(Task.objects.exists())
+        queued = enqueue('tests.create_category', {'name': 'Later'}, delay=60)
+        self.assertEqual((queued.status, queued.max_attempts, queued.payload), ('pending', 2, {'name': 'Later'}))
+        # Not due yet
+        run_pending()
+        self.assertFalse(Category.objects.exists())
+
+    def test_run_pending(self):
+        for name in ('Cases', 'Chargers'):
+            enqueue('tests.create_category', {'name': name})
+        run_pending(batch_size=1)
+        self.assertEqual(sorted(Category.objects.values_list('name', flat=True)), ['Cases', 'Chargers'])
+        self.assertEqual(list(Task.objects.values_list('status', 'attempts')), [('done', 1), ('done', 1)])
+
+    def test_failures_are_retried_then_kept(self):
+        queued = enqueue('tests.create_category', {'name': 'Broken', 'fail': True})
+        with self.assertLogs('prime_accessories.tasks', 'WARNING'):
+            run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_by), ('pending', 1, ''))
+        self.assertGreater(queued.run_after, timezone.now())
+        self.assertIn('could not handle Broken', queued.last_error)
+        # The handler's own writes were rolled back with the failure
+        self.assertFalse(Category.objects.exists())
+
+        Task.objects.update(run_after=timezone.now())
+        with self.assertLogs('prime_accessories.tasks', 'ERROR'):
+            run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+        self.assertTrue(2.5 <= retry_delay(1) <= 5 and retry_delay(30) <= 3600)
+
+    def test_unknown_tasks_fail_at_once(self):
+        with self.assertRaisesMessage(LookupError, 'tests.missing'):
+            enqueue('tests.missing')
+        Task.objects.create(name='tests.missing', max_attempts=5)
+        with self.assertLogs('prime_accessories.tasks', 'ERROR'):
+            run_pending()
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+    def test_stale_tasks_are_reclaimed(self):
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        lost = Task.objects.create(name='tests.create_category', payload={'name': 'Lost'}, status='running',
+                                   attempts=1, locked_by='dead-worker', locked_at=long_ago)
+        spent = Task.objects.create(name='tests.create_category', payload={'name': 'Spent'}, status='running',
+                                    attempts=2, max_attempts=2, locked_by='dead-worker', locked_at=long_ago)
+        with self.assertLogs('prime_accessories.tasks', 'WARNING'):
+            run_pending()
+        lost.refresh_from_db()
+        spent.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts), ('done', 2))
+        self.assertEqual(spent.status, 'failed')
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Lost'])
+
+    def test_reclaimed_task_result_is_discarded(self):
+        enqueue('tests.create_category', {'name': 'Twice', 'steal': True})
+        with self.assertLogs('prime_accessories.tasks', 'WARNING'):
+            Worker(name='slow-worker').run_once()
+        self.assertFalse(Category.objects.exists())
+
+    def test_old_done_tasks_are_purged(self):
+        long_ago = timezone.now() - datetime.timedelta(days=10)
+        old = Task.objects.create(name='tests.create_category', status='done', finished_at=long_ago)
+        failed = Task.objects.create(name='tests.create_category', status='failed', finished_at=long_ago)
+        recent = Task.objects.create(name='tests.create_category', status='done', finished_at=timezone.now())
+        self.assertEqual(purge_done(7), 1)
+        self.assertEqual(set(Task.objects.all()), {failed, recent})
+        # run_pending() workers keep every task
+        old.pk = None
+        old.save()
+        run_pending()
+        self.assertTrue(Task.objects.filter(pk=old.pk).exists())
+        Worker(retention_days=7).run_once()
+        self.assertFalse(Task.objects.filter(pk=old.pk).exists())
+
+    @override_settings(PRIME_TASKS_EAGER=True)
+    def test_eager_mode(self):
+        self.assertIsNone(enqueue('tests.create_category', {'name': 'Now'}))
+        self.assertTrue(Category.objects.filter(name='Now').exists())
+        self.assertFalse(Task.objects.exists())
+
+
+class TaskWorkerCommandTests(TransactionTestCase):
+
+    def drain(self, *args):
+        for index in range(12):
+            enqueue('tests.create_category', {'name': f'Category {index}'})
+        out = StringIO()
+        call_command('run_workers', '--drain', '--batch-size', '2', *args, stdout=out)
+        self.assertIn('Task workers stopped', out.getvalue())
+        self.assertEqual(Category.objects.count(), 12)
+        self.assertEqual(set(Task.objects.values_list('status', 'attempts')), {('done', 1)})
+
+    def test_threads(self):
+        self.drain('--threads', '3')
+
+    def test_processes(self):
+        self.drain('--processes', '2', '--threads', '1')
+
+    def test_purges_old_done_tasks(self):
+        Task.objects.create(name='tests.create_category', status='done',
+                            finished_at=timezone.now() - datetime.timedelta(days=3))
+        call_command('run_workers', '--drain', '--retention-days', '5', stdout=StringIO())
+        self.assertTrue(Task.objects.exists())
+        call_command('run_workers', '--drain', '--retention-days', '2', stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+
+
+# ==================== DATABASE PROFILE TESTS ====================
+
+class DatabaseProfileTests(SimpleTestCase):
+    base_dir = Path('/srv/prime')
+
+    def settings_for(self, **environ):
+        return database_settings(environ, self.base_dir)['default']
+
+    def test_development_keeps_django_defaults(self):
+        config = self.settings_for()
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], self.base_dir / 'db.sqlite3')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertNotIn('OPTIONS', config)
+
+    def test_production_sqlite(self):
+        config = self.settings_for(PRIME_DB_PROFILE='production', PRIME_SQLITE_SYNCHRONOUS='full',
+                                   PRIME_SQLITE_BUSY_TIMEOUT_MS='2000')
+        self.assertEqual((config['CONN_MAX_AGE'], config['CONN_HEALTH_CHECKS']), (600, True))
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertEqual(config['OPTIONS']['timeout'], 2)
+        pragmas = config['OPTIONS']['init_command'].split(';')
+        for pragma in ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=FULL', 'PRAGMA busy_timeout=2000'):
+            self.assertIn(pragma, pragmas)
+        with self.assertRaises(ValueError):
+            self.settings_for(PRIME_DB_PROFILE='production', PRIME_SQLITE_SYNCHRONOUS='sometimes')
+
+    def test_production_postgresql(self):
+        pooled = self.settings_for(PRIME_DB_ENGINE='postgresql', PRIME_DB_PROFILE='production',
+                                   PRIME_DB_POOL='1', PRIME_DB_POOL_MAX_SIZE='20', PRIME_DB_HOST='db')
+        self.assertEqual(pooled['OPTIONS']['pool']['max_size'], 20)
+        self.assertNotIn('CONN_MAX_AGE', pooled)
+        persistent = self.settings_for(PRIME_DB_ENGINE='postgresql', PRIME_DB_PROFILE='production',
+                                       PRIME_DB_POOL='0', PRIME_DB_CONN_MAX_AGE='60')
+        self.assertNotIn('OPTIONS', persistent)
+        self.assertEqual(persistent['CONN_MAX_AGE'], 60)
+
+    def test_invalid_environment(self):
+        for environ in ({'PRIME_DB_PROFILE': 'staging'}, {'PRIME_DB_ENGINE': 'oracle'},
+                        {'PRIME_DB_CONN_MAX_AGE': 'forever'}):
+            with self.assertRaises(ValueError):
+                self.settings_for(**environ)
+
+
+# Not a Django test case: the benchmark opens its own scratch databases,
+# which the test database guards would refuse
+class DatabaseWriterBenchmarkTests(unittest.TestCase):
+
+    def test_bench_db_writers(self):
+        out = StringIO()
+        call_command('bench_db_writers', '--writers', '3', '--transactions', '10', '--readers', '1',
+                     '--json', stdout=out)
+        results = {row['profile']: row for row in json.loads(out.getvalue())}
+        self.assertEqual(set(results), {'development', 'production'})
+        # Writers queue on the write lock instead of failing
+        self.assertEqual((results['production']['commits'], results['production']['errors']), (30, 0))
+        self.assertEqual(results['development']['commits'] + results['development']['errors'], 30)
+
+
+# ==================== REPLICA ROUTING TESTS ====================
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def read(self, model, state=None):
+        token = routers._state.set(state)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routers._state.reset(token)
+
+    def test_catalog_reads_go_to_the_replica(self):
+        state = RoutingState('replica1')
+        self.assertEqual(self.read(Phone, state), 'replica1')
+        self.assertEqual(self.read(Order, state), 'replica1')
+        # Read-to-write models and reads outside a request stay on the primary
+        self.assertEqual(self.read(Cart, state), 'default')
+        self.assertEqual(self.read(User, state), 'default')
+        self.assertEqual(self.read(Phone), 'default')
+        with routers.use_primary():
+            self.assertEqual(self.read(Phone, state), 'default')
+
+    def test_writers_read_their_writes(self):
+        state = RoutingState('replica1')
+        token = routers._state.set(state)
+        try:
+            self.assertEqual(self.router.db_for_write(Cart), 'default')
+            self.assertFalse(state.wrote)
+            self.router.db_for_write(Review)
+            self.assertEqual(self.router.db_for_read(Phone), 'default')
+        finally:
+            routers._state.reset(token)
+        self.assertEqual(self.read(Phone, RoutingState('replica1', pinned=True)), 'default')
+
+    @override_settings(PRIME_DB_REPLICAS=['replica1'])
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'prime_accessories'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'prime_accessories'))
+
+    def test_replica_settings(self):
+        databases = database_settings({'PRIME_DB_REPLICAS': 'replica.sqlite3, /data/other.sqlite3'}, '/srv/prime')
+        self.assertEqual(replica_aliases(databases), ['replica1', 'replica2'])
+        self.assertEqual(databases['replica1']['NAME'], Path('/srv/prime/replica.sqlite3'))
+        self.assertEqual(databases['replica2']['TEST'], {'MIRROR': 'default'})
+        databases = database_settings({'PRIME_DB_ENGINE': 'postgresql', 'PRIME_DB_PORT': '5432',
+                                       'PRIME_DB_REPLICAS': 'replica-a,replica-b:6432'})
+        self.assertEqual([(databases[alias]['HOST'], databases[alias]['PORT']) for alias in ('replica1', 'replica2')],
+                         [('replica-a', '5432'), ('replica-b', '6432')])
+
+
+@override_settings(TEMPLATES=TEST_TEMPLATES, PRIME_DB_REPLICAS=['replica_test'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second SQLite file, refreshed by sync_replicas' copy, acts as the replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registered after the runner set up its databases, and allowed here only
+        cls.directory = tempfile.TemporaryDirectory()
+        add_database('replica_test', {**settings.DATABASES['default'],
+                                      'NAME': os.path.join(cls.directory.name, 'replica.sqlite3')})
+        cls.databases = cls.databases | {'replica_test'}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        remove_database('replica_test')
+        cls.directory.cleanup()
+
+    def setUp(self):
+        get_cache().clear()
+        self.replicated = make_phone(name='Replicated', stock=5)
+        self.replicate()
+        self.fresh = make_phone(name='Not yet replicated')
+
+    def replicate(self):
+        connections['replica_test'].close()
+        copy_database(connection.settings_dict['NAME'], connections['replica_test'].settings_dict['NAME'])
+
+    def test_reads_use_the_replica_until_the_client_writes(self):
+        anonymous = Client()
+        self.assertEqual(anonymous.get(reverse('phone_list')).content.decode(), 'Replicated;')
+
+        buyer = Client()
+        buyer.force_login(User.objects.create_user('buyer', password='pw'))
+        self.assertEqual(buyer.get(reverse('phone_list')).content.decode(), 'Replicated;')
+        buyer.post(reverse('add_to_cart', args=['phone', self.replicated.pk]))
+        response = buyer.post(reverse('checkout'), {'shipping_address': 'Somewhere'})
+        self.assertIn(routers.COOKIE_NAME, response.cookies)
+        # The new order isn't on the replica, but the buyer reads the primary now
+        self.assertEqual(buyer.get(response.url).status_code, 200)
+        self.assertEqual(buyer.get(reverse('phone_list')).content.decode(), 'Not yet replicated;Replicated;')
+        self.assertEqual(anonymous.get(reverse('phone_list')).content.decode(), 'Replicated;')
+
+        # Once the stickiness runs out, the replica serves the buyer again
+        buyer.cookies[routers.COOKIE_NAME] = str(int(time.time()) - 1)
+        self.assertEqual(buyer.get(reverse('phone_list')).content.decode(), 'Replicated;')
+        self.replicate()
+        self.assertEqual(buyer.get(reverse('phone_list')).content.decode(), 'Not yet replicated;Replicated;')
+
+
+# ==================== INVENTORY TESTS ====================
+
+class InventoryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.phone = make_phone(stock=10)
+        self.case = make_accessory(stock=20)
+
+    def buy(self, *lines):
+        return place_order(self.user, list(lines), shipping_address='Somewhere')
+
+    def ledger(self):
+        return sorted(StockEntry.objects.values_list('item_type', 'product_id', 'shard', 'quantity', 'status'))
+
+    def test_checkout_records_sales_in_the_ledger(self):
+        order = self.buy(('phone', self.phone.pk, 2), ('accessory', self.case.pk, 3))
+        self.assertEqual(self.ledger(), [
+            ('accessory', self.case.pk, None, 3, 'sold'),
+            ('phone', self.phone.pk, None, 2, 'sold'),
+        ])
+        self.assertEqual(set(StockEntry.objects.values_list('order_id', flat=True)), {order.pk})
+
+    def test_cancelling_an_order_releases_its_stock(self):
+        order = self.buy(('phone', self.phone.pk, 2), ('accessory', self.case.pk, 3))
+        order.status = 'cancelled'
+        order.save()
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.case.stock), (10, 20))
+        self.assertEqual({status for *_, status in self.ledger()}, {'released'})
+        # Saving it again releases nothing more
+        order.save()
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 10)
+
+    def test_sharded_stock(self):
+        inventory.shard_stock('accessory', self.case.pk, shards=4)
+        self.assertEqual(sorted(StockShard.objects.values_list('shard', 'available')),
+                         [(0, 5), (1, 5), (2, 5), (3, 5)])
+        self.case.refresh_from_db()
+        self.assertEqual((self.case.stock, self.case.stock_shards), (20, 4))
+
+        self.buy(('phone', self.phone.pk, 1), ('accessory', self.case.pk, 3))
+        # More than any one shard holds: split across shards
+        self.buy(('accessory', self.case.pk, 8))
+        entries = StockEntry.objects.filter(item_type='accessory')
+        self.assertEqual(sum(entries.values_list('quantity', flat=True)), 11)
+        self.assertTrue(all(entry.shard is not None for entry in entries))
+        self.assertEqual(sum(StockShard.objects.values_list('available', flat=True)), 9)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 9)
+
+        # The display total catches up once the refresh task has run
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.stock, 20)
+        run_pending()
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.stock, 9)
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            self.buy(('phone', self.phone.pk, 1), ('accessory', self.case.pk, 10))
+        self.assertEqual(ctx.exception.products, [self.case])
+        self.assertEqual(sum(StockShard.objects.values_list('available', flat=True)), 9)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 9)
+
+        inventory.merge_shards('accessory', self.case.pk)
+        self.case.refresh_from_db()
+        self.assertEqual((self.case.stock, self.case.stock_shards), (9, 0))
+        self.assertFalse(StockShard.objects.exists())
+
+    def test_released_stock_follows_the_sku_layout(self):
+        inventory.shard_stock('accessory', self.case.pk, shards=2)
+        order = self.buy(('accessory', self.case.pk, 4))
+        inventory.merge_shards('accessory', self.case.pk)
+        order.status = 'cancelled'
+        order.save()
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.stock, 20)
+
+    @override_settings(PRIME_STOCK_HOLD_SECONDS=900)
+    def test_holds_are_sold_on_payment(self):
+        order = self.buy(('phone', self.phone.pk, 2))
+        entry = StockEntry.objects.get()
+        self.assertEqual(entry.status, 'held')
+        self.assertEqual(entry.expires_at, order.created_at + datetime.timedelta(seconds=900))
+        self.assertTrue(Task.objects.filter(name='inventory.expire_order', payload={'order_id': order.pk}).exists())
+
+        order.payment_status = 'completed'
+        order.save()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.expires_at), ('sold', None))
+        # A paid order is left alone when its hold runs out
+        inventory.expire_order(order.pk)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+
+    @override_settings(PRIME_STOCK_HOLD_SECONDS=900)
+    def test_expired_holds_cancel_unpaid_orders(self):
+        order = self.buy(('phone', self.phone.pk, 2))
+        inventory.expire_order(order.pk)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+
+        StockEntry.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        Task.objects.update(run_after=timezone.now())
+        run_pending()
+        order.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((order.status, self.phone.stock), ('cancelled', 10))
+        self.assertEqual(StockEntry.objects.get().status, 'released')
+
+    def test_stock_levels(self):
+        inventory.shard_stock('accessory', self.case.pk, shards=2)
+        self.buy(('accessory', self.case.pk, 5))
+        with override_settings(PRIME_STOCK_HOLD_SECONDS=900):
+            self.buy(('phone', self.phone.pk, 2), ('accessory', self.case.pk, 1))
+        levels = {(row['item_type'], row['pk']): row for row in inventory.stock_levels()}
+        self.assertEqual([(row['available'], row['reserved'], row['sold']) for row in levels.values()],
+                         [(14, 1, 5), (8, 2, 0)])
+        self.assertEqual(levels[('accessory', self.case.pk)]['stock_shards'], 2)
+        self.assertEqual([row['pk'] for row in inventory.stock_levels(search='galaxy')], [self.phone.pk])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(reverse('admin:prime_accessories_stock_levels'), {'q': 'case'})
+        self.assertEqual([row['name'] for row in response.context['levels']], ['Clear Case'])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:prime_accessories_stock_levels'))
+        self.assertEqual(response.status_code, 302)
+
+
+class StockContentionBenchmarkTests(TransactionTestCase):
+
+    def test_buyers_never_oversell(self):
+        out = StringIO()
+        call_command('bench_stock_contention', buyers=4, stock=40, quantity=3, shards=3, json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual([row['layout'] for row in results], ['row', 'sharded'])
+        for row in results:
+            self.assertFalse(row['oversold'])
+            self.assertEqual(row['sold'], 39)
+            self.assertEqual(row['left'], 1)
+        self.assertFalse(Accessories.objects.exists())
+        self.assertFalse(StockEntry.objects.exists())
+
+
+# ==================== SESSION ENGINE TESTS ====================
+
+class SessionBackendTests(TestCase):
+
+    def setUp(self):
+        caches['sessions'].clear()
+        self.store = SessionStore()
+        self.store['cart_id'] = 1
+        self.store.save()
+        self.key = self.store.session_key
+
+    def stored(self):
+        return Session.objects.get(session_key=self.key).get_decoded()
+
+    def test_reads_come_from_the_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(self.key)['cart_id'], 1)
+        caches['sessions'].clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(SessionStore(self.key)['cart_id'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(self.key)['cart_id'], 1)
+
+    def test_unchanged_sessions_are_not_written(self):
+        session = SessionStore(self.key)
+        session['cart_id'] = 1
+        self.assertTrue(session.modified)
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_write_through(self):
+        session = SessionStore(self.key)
+        session['cart_id'] = 2
+        session.save()
+        self.assertEqual(self.stored(), {'cart_id': 2})
+        self.assertEqual(SessionStore(self.key)['cart_id'], 2)
+
+    @override_settings(PRIME_SESSION_WRITE_MODE='behind', PRIME_SESSION_WRITE_BEHIND_SECONDS=60)
+    def test_write_behind(self):
+        session = SessionStore(self.key)
+        session['cart_id'] = 2
+        # Queueing the flush, but no django_session write
+        with self.assertNumQueries(1):
+            session.save()
+        self.assertEqual(SessionStore(self.key)['cart_id'], 2)
+        session = SessionStore(self.key)
+        session['cart_id'] = 3
+        # The flush is already queued
+        with self.assertNumQueries(0):
+            session.save()
+        flush = Task.objects.get()
+        self.assertEqual((flush.name, flush.payload), ('sessions.flush', {'session_key': self.key}))
+
+        # The window ends: the latest cached copy reaches the database
+        self.assertEqual(self.stored(), {'cart_id': 1})
+        Task.objects.update(run_after=timezone.now())
+        run_pending()
+        self.assertEqual(self.stored(), {'cart_id': 3})
+        caches['sessions'].clear()
+        self.assertEqual(SessionStore(self.key)['cart_id'], 3)
+
+        with override_settings(PRIME_SESSION_WRITE_BEHIND_SECONDS=0):
+            session = SessionStore(self.key)
+            session['cart_id'] = 4
+            session.save()
+        self.assertEqual(self.stored(), {'cart_id': 4})
+
+    @override_settings(PRIME_SESSION_WRITE_MODE='behind', PRIME_SESSION_WRITE_BEHIND_SECONDS=60)
+    def test_write_behind_login_survives_cache_loss(self):
+        user = User.objects.create_user('shopper', password='pw')
+        self.assertTrue(self.client.login(username='shopper', password='pw'))
+        caches['sessions'].clear()
+        self.assertEqual(self.client.session.get('_auth_user_id'), str(user.pk))
+        session = self.client.session
+        session.set_expiry(600)
+        session.save()
+        self.assertEqual(Session.objects.get(session_key=session.session_key).get_decoded()['_session_expiry'], 600)
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(PRIME_SESSION_WRITE_MODE='behind', PRIME_SESSION_WRITE_BEHIND_SECONDS=60)
+    def test_flush_of_deleted_session_is_skipped(self):
+        session = SessionStore(self.key)
+        session['cart_id'] = 2
+        session.save()
+        session.delete()
+        Task.objects.update(run_after=timezone.now())
+        run_pending()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_cycle_key_and_delete(self):
+        session = SessionStore(self.key)
+        session.cycle_key()
+        self.assertFalse(Session.objects.filter(session_key=self.key).exists())
+        self.assertFalse(session.exists(self.key))
+        self.assertEqual(SessionStore(session.session_key)['cart_id'], 1)
+        session.delete()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+    @override_settings(PRIME_SESSION_WRITE_MODE='later')
+    def test_unknown_write_mode(self):
+        session = SessionStore(self.key)
+        session['cart_id'] = 2
+        with self.assertRaises(ValueError):
+            session.save()
+
+    @override_settings(TEMPLATES=TEST_TEMPLATES, ALLOWED_HOSTS=['localhost'])
+    def test_benchmark_counts_session_queries(self):
+        out = StringIO()
+        call_command('bench_sessions', repeat=2, engine=['db', 'prime-behind'], json=True, stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual({(row['engine'], row['shopper'], row['endpoint']) for row in results},
+                         {(engine, shopper, endpoint) for engine in ('db', 'prime-behind')
+                          for shopper in ('anonymous', 'signed-in') for endpoint in ('add', 'view', 'remove')})
+        self.assertEqual({row['session_queries'] for row in results if row['engine'] == 'db'}, {1})
+        self.assertEqual({row['session_queries'] for row in results if row['engine'] == 'prime-behind'}, {0})
+        # Only the session of setUp is left
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.key])
+        self.assertFalse(Phone.objects.exists())
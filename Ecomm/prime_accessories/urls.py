@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, async_views, instrumentation, views
 
 urlpatterns = [
     # ==================== PHONE URLS ====================
@@ -8,6 +8,7 @@ urlpatterns = [
     path('phones/create/', views.PhoneCreateView.as_view(), name='phone_create'),
     path('phones/<int:pk>/edit/', views.PhoneUpdateView.as_view(), name='phone_update'),
     path('phones/<int:pk>/delete/', views.PhoneDeleteView.as_view(), name='phone_delete'),
+    path('phones/<int:pk>/accessories/', views.phone_compatible_accessories, name='phone_compatible_accessories'),
     
     # ==================== ACCESSORIES URLS ====================
     path('accessories/', views.AccessoriesListView.as_view(), name='accessories_list'),
@@ -31,4 +32,30 @@ urlpatterns = [
     
     # ==================== CUSTOMER PROFILE URLS ====================
     path('profile/', views.customer_profile, name='customer_profile'),
+    
+    # ==================== ASYNC (ASGI) URLS ====================
+    path('async/phones/', async_views.phone_list, name='async_phone_list'),
+    path('async/phones/<int:pk>/', async_views.phone_detail, name='async_phone_detail'),
+    path('async/accessories/', async_views.accessories_list, name='async_accessories_list'),
+    path('async/accessories/<int:pk>/', async_views.accessory_detail, name='async_accessory_detail'),
+    path('async/cart/add/<str:item_type>/<int:item_id>/', async_views.add_to_cart, name='async_add_to_cart'),
+    path('async/cart/', async_views.view_cart, name='async_cart_view'),
+    path('async/cart/remove/<str:cart_item_key>/', async_views.remove_from_cart, name='async_remove_from_cart'),
+    
+    # ==================== JSON API URLS ====================
+    path('v1/phones/', api.phone_list, name='api_phone_list'),
+    path('v1/phones/facets/', api.phone_facets, name='api_phone_facets'),
+    path('v1/phones/<int:pk>/', api.phone_detail, name='api_phone_detail'),
+    path('v1/phones/<int:pk>/accessories/', api.phone_accessories, name='api_phone_accessories'),
+    path('v1/phones/<int:pk>/compatible/', api.phone_compatible, name='api_phone_compatible'),
+    path('v1/accessories/', api.accessory_list, name='api_accessory_list'),
+    path('v1/accessories/facets/', api.accessory_facets, name='api_accessory_facets'),
+    path('v1/accessories/<int:pk>/', api.accessory_detail, name='api_accessory_detail'),
+    path('v1/accessories/<int:pk>/phones/', api.accessory_phones, name='api_accessory_phones'),
+    path('v1/categories/', api.category_list, name='api_category_list'),
+    
+    # ==================== INSTRUMENTATION URLS ====================
+    path('metrics/', instrumentation.metrics_json, name='metrics'),
+    path('metrics/prometheus/', instrumentation.metrics_prometheus, name='metrics_prometheus'),
+    path('metrics/slow/', instrumentation.slow_requests, name='metrics_slow_requests'),
 ]
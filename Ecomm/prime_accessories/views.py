@@ -1,79 +1,86 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.views import View
+from django.views.decorators.http import require_POST
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.urls import reverse_lazy
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Prefetch, Sum
 from django.core.paginator import Paginator
 from decimal import Decimal
 from .models import Phone, Accessories, Category, Order, OrderItem, CustomerProfile, Review
+from .pagination import CursorPaginationMixin, InvalidCursor
+from .caching import CatalogCacheMixin
+from .carts import (add_item, cart_contents, cart_items, checkout_lines, get_cart,
+                    parse_item_key, remove_item)
+from .checkout import CheckoutError, place_order
+from .compatibility import lookup as lookup_compatible
+from .facets import get_facets
+from .filters import filter_accessories, filter_phones
 
 
 # ==================== PHONE VIEWS ====================
 
-class PhoneListView(ListView):
+class PhoneListView(CatalogCacheMixin, CursorPaginationMixin, ListView):
     model = Phone
+    cache_item_type = 'phone'
     template_name = 'prime_accessories/phone_list.html'
     context_object_name = 'phones'
     paginate_by = 12
     
     def get_queryset(self):
-        queryset = Phone.objects.all()
-        
-        # Search functionality
-        search_query = self.request.GET.get('search')
-        if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(brand__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-        
-        # Filter by category
-        category = self.request.GET.get('category')
-        if category:
-            queryset = queryset.filter(category__id=category)
-        
-        # Filter by price range
-        min_price = self.request.GET.get('min_price')
-        max_price = self.request.GET.get('max_price')
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        # Filter by condition
-        condition = self.request.GET.get('condition')
-        if condition:
-            queryset = queryset.filter(condition=condition)
-        
-        return queryset
+        return filter_phones(Phone.objects.all(), self.request.GET)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Category.objects.all()
         context['search_query'] = self.request.GET.get('search', '')
+        context['facets'] = get_facets('phone', self.request.GET)
         return context
 
 
-class PhoneDetailView(DetailView):
+class PhoneDetailView(CatalogCacheMixin, DetailView):
     model = Phone
+    cache_item_type = 'phone'
     template_name = 'prime_accessories/phone_detail.html'
     context_object_name = 'phone'
+    review_limit = 20  # newest reviews shown; phone.review_count has the total
+    
+    def get_queryset(self):
+        return Phone.objects.select_related('category')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['reviews'] = self.object.reviews.all()
-        context['compatible_accessories'] = self.object.accessories.all()
+        context['reviews'] = list(self.object.reviews.select_related('customer')[:self.review_limit])
+        context['compatible_accessories'] = list(self.object.accessories.select_related('category'))
         return context
 
 
+def phone_compatible_accessories(request, pk):
+    """Accessories fitting a phone, cheapest first, filterable by type and price"""
+    phone = get_object_or_404(Phone.objects.only('id', 'name', 'brand', 'model'), pk=pk)
+    try:
+        result = lookup_compatible(phone.pk, request.GET)
+    except (ValueError, InvalidCursor):
+        raise Http404("Invalid filter or page")
+    return render(request, 'prime_accessories/compatible_accessories.html', {
+        'phone': phone,
+        'accessories': result['results'],
+        'types': result['types'],
+        'selected_types': request.GET.getlist('type'),
+        'next_cursor': result['next'],
+        'previous_cursor': result['previous'],
+    })
+
+
 @method_decorator(login_required, name='dispatch')
 class PhoneCreateView(CreateView):
     model = Phone
     template_name = 'prime_accessories/phone_form.html'
-    fields = ['name', 'brand', 'model', 'description', 'price', 'stock', 'processor', 
+    fields = ['sku', 'name', 'brand', 'model', 'description', 'price', 'stock', 'processor', 
               'ram', 'storage', 'display_size', 'camera_mp', 'battery_mah', 'os', 
               'condition', 'color', 'image_url', 'category']
     success_url = reverse_lazy('phone_list')
@@ -83,7 +90,7 @@ class PhoneCreateView(CreateView):
 class PhoneUpdateView(UpdateView):
     model = Phone
     template_name = 'prime_accessories/phone_form.html'
-    fields = ['name', 'brand', 'model', 'description', 'price', 'stock', 'processor', 
+    fields = ['sku', 'name', 'brand', 'model', 'description', 'price', 'stock', 'processor', 
               'ram', 'storage', 'display_size', 'camera_mp', 'battery_mah', 'os', 
               'condition', 'color', 'image_url', 'category']
     success_url = reverse_lazy('phone_list')
@@ -98,60 +105,38 @@ class PhoneDeleteView(DeleteView):
 
 # ==================== ACCESSORIES VIEWS ====================
 
-class AccessoriesListView(ListView):
+class AccessoriesListView(CatalogCacheMixin, CursorPaginationMixin, ListView):
     model = Accessories
+    cache_item_type = 'accessory'
     template_name = 'prime_accessories/accessories_list.html'
     context_object_name = 'accessories'
     paginate_by = 12
     
     def get_queryset(self):
-        queryset = Accessories.objects.all()
-        
-        # Search functionality
-        search_query = self.request.GET.get('search')
-        if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(accessory_type__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
-        
-        # Filter by category
-        category = self.request.GET.get('category')
-        if category:
-            queryset = queryset.filter(category__id=category)
-        
-        # Filter by accessory type
-        accessory_type = self.request.GET.get('type')
-        if accessory_type:
-            queryset = queryset.filter(accessory_type=accessory_type)
-        
-        # Filter by price range
-        min_price = self.request.GET.get('min_price')
-        max_price = self.request.GET.get('max_price')
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        return queryset
+        return filter_accessories(Accessories.objects.all(), self.request.GET)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categories'] = Category.objects.all()
         context['search_query'] = self.request.GET.get('search', '')
+        context['facets'] = get_facets('accessory', self.request.GET)
         return context
 
 
-class AccessoriesDetailView(DetailView):
+class AccessoriesDetailView(CatalogCacheMixin, DetailView):
     model = Accessories
+    cache_item_type = 'accessory'
     template_name = 'prime_accessories/accessory_detail.html'
     context_object_name = 'accessory'
+    review_limit = 20  # newest reviews shown; accessory.review_count has the total
+    
+    def get_queryset(self):
+        return Accessories.objects.select_related('category')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['reviews'] = self.object.reviews.all()
-        context['compatible_phones'] = self.object.compatible_phones.all()
+        context['reviews'] = list(self.object.reviews.select_related('customer')[:self.review_limit])
+        context['compatible_phones'] = list(self.object.compatible_phones.select_related('category'))
         return context
 
 
@@ -159,7 +144,7 @@ class AccessoriesDetailView(DetailView):
 class AccessoriesCreateView(CreateView):
     model = Accessories
     template_name = 'prime_accessories/accessory_form.html'
-    fields = ['name', 'brand', 'description', 'price', 'stock', 'accessory_type', 
+    fields = ['sku', 'name', 'brand', 'description', 'price', 'stock', 'accessory_type', 
               'color', 'material', 'compatible_phones', 'image_url', 'category']
     success_url = reverse_lazy('accessories_list')
 
@@ -168,7 +153,7 @@ class AccessoriesCreateView(CreateView):
 class AccessoriesUpdateView(UpdateView):
     model = Accessories
     template_name = 'prime_accessories/accessory_form.html'
-    fields = ['name', 'brand', 'description', 'price', 'stock', 'accessory_type', 
+    fields = ['sku', 'name', 'brand', 'description', 'price', 'stock', 'accessory_type', 
               'color', 'material', 'compatible_phones', 'image_url', 'category']
     success_url = reverse_lazy('accessories_list')
 
@@ -182,58 +167,28 @@ class AccessoriesDeleteView(DeleteView):
 
 # ==================== SHOPPING CART & ORDER VIEWS ====================
 
-@login_required
+@require_POST
 def add_to_cart(request, item_type, item_id):
-    """Add phone or accessory to cart (session-based)"""
-    if 'cart' not in request.session:
-        request.session['cart'] = {}
-    
-    cart_item_key = f"{item_type}_{item_id}"
-    
-    if cart_item_key in request.session['cart']:
-        request.session['cart'][cart_item_key]['quantity'] += 1
-    else:
-        if item_type == 'phone':
-            item = get_object_or_404(Phone, id=item_id)
-        else:
-            item = get_object_or_404(Accessories, id=item_id)
-        
-        request.session['cart'][cart_item_key] = {
-            'item_type': item_type,
-            'item_id': item_id,
-            'name': item.name,
-            'price': str(item.price),
-            'quantity': 1
-        }
-    
-    request.session.modified = True
+    """Add phone or accessory to cart"""
+    cart = get_cart(request, create=True)
+    add_item(cart, item_type, item_id)
     return redirect('cart_view')
 
 
-@login_required
 def view_cart(request):
     """Display shopping cart"""
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total_amount = Decimal('0.00')
-    
-    for cart_item_key, item in cart.items():
-        item['subtotal'] = Decimal(item['price']) * item['quantity']
-        total_amount += item['subtotal']
-        cart_items.append(item)
+    cart_lines, total_amount = cart_contents(cart_items(request))
     
     return render(request, 'prime_accessories/cart.html', {
-        'cart_items': cart_items,
+        'cart_items': cart_lines,
         'total_amount': total_amount
     })
 
 
-@login_required
 def remove_from_cart(request, cart_item_key):
     """Remove item from cart"""
-    if 'cart' in request.session and cart_item_key in request.session['cart']:
-        del request.session['cart'][cart_item_key]
-        request.session.modified = True
+    item_type, item_id = parse_item_key(cart_item_key)
+    remove_item(cart_items(request), item_type, item_id)
     
     return redirect('cart_view')
 
@@ -242,44 +197,25 @@ def remove_from_cart(request, cart_item_key):
 def checkout(request):
     """Process order"""
     if request.method == 'POST':
-        cart = request.session.get('cart', {})
+        items = cart_items(request)
+        lines = checkout_lines(items)
         
-        if not cart:
+        if not lines:
             return redirect('cart_view')
         
-        # Create order
-        total_amount = Decimal('0.00')
-        for item in cart.values():
-            total_amount += Decimal(item['price']) * item['quantity']
-        
         discount = Decimal(request.POST.get('discount', 0))
-        final_amount = total_amount - discount
-        
-        order = Order.objects.create(
-            customer=request.user,
-            order_number=f"ORD-{request.user.id}-{Order.objects.count() + 1}",
-            total_amount=total_amount,
-            discount=discount,
-            final_amount=final_amount,
-            shipping_address=request.POST.get('shipping_address'),
-            notes=request.POST.get('notes', '')
-        )
-        
-        # Create order items
-        for cart_item_key, item in cart.items():
-            OrderItem.objects.create(
-                order=order,
-                item_type=item['item_type'],
-                phone_id=item['item_id'] if item['item_type'] == 'phone' else None,
-                accessory_id=item['item_id'] if item['item_type'] == 'accessory' else None,
-                quantity=item['quantity'],
-                unit_price=Decimal(item['price']),
-                total_price=Decimal(item['price']) * item['quantity']
+        try:
+            order = place_order(
+                request.user,
+                lines,
+                shipping_address=request.POST.get('shipping_address'),
+                discount=discount,
+                notes=request.POST.get('notes', ''),
+                cart_items=items
             )
-        
-        # Clear cart
-        request.session['cart'] = {}
-        request.session.modified = True
+        except CheckoutError as exc:
+            messages.error(request, str(exc))
+            return redirect('cart_view')
         
         return redirect('order_detail', pk=order.id)
     
@@ -293,7 +229,11 @@ class OrderListView(ListView):
     paginate_by = 10
     
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user)
+        return (Order.objects
+                .filter(customer=self.request.user)
+                .annotate(item_count=Count('items'), unit_count=Sum('items__quantity'))
+                # Meta.ordering is dropped from GROUP BY queries
+                .order_by('-created_at'))
     
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -307,7 +247,10 @@ class OrderDetailView(DetailView):
     context_object_name = 'order'
     
     def get_queryset(self):
-        return Order.objects.filter(customer=self.request.user)
+        items = OrderItem.objects.select_related('phone', 'accessory')
+        return (Order.objects
+                .filter(customer=self.request.user)
+                .prefetch_related(Prefetch('items', queryset=items)))
 
 
 # ==================== REVIEW VIEWS ====================
@@ -320,25 +263,28 @@ def add_review(request, item_type, item_id):
         title = request.POST.get('title')
         review_text = request.POST.get('review_text')
         
+        # The review and its product's rating aggregates commit together
         if item_type == 'phone':
             phone = get_object_or_404(Phone, id=item_id)
-            Review.objects.create(
-                phone=phone,
-                customer=request.user,
-                rating=rating,
-                title=title,
-                review_text=review_text
-            )
+            with transaction.atomic():
+                Review.objects.create(
+                    phone=phone,
+                    customer=request.user,
+                    rating=rating,
+                    title=title,
+                    review_text=review_text
+                )
             return redirect('phone_detail', pk=item_id)
         else:
             accessory = get_object_or_404(Accessories, id=item_id)
-            Review.objects.create(
-                accessory=accessory,
-                customer=request.user,
-                rating=rating,
-                title=title,
-                review_text=review_text
-            )
+            with transaction.atomic():
+                Review.objects.create(
+                    accessory=accessory,
+                    customer=request.user,
+                    rating=rating,
+                    title=title,
+                    review_text=review_text
+                )
             return redirect('accessory_detail', pk=item_id)
     
     return render(request, 'prime_accessories/add_review.html', {